@@ -1,10 +1,16 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import json
 import os
-import requests
+import threading
+import time
 import traceback
+import uuid
 from dotenv import load_dotenv
 import feedparser
 
@@ -18,10 +24,95 @@ from .llm_providers.gemini_client import GeminiClient
 from .llm_providers.deepseek_client import DeepSeekClient
 from .llm_providers.news_client import NewsClient
 from .llm_providers.weather_client import WeatherClient
+from .llm_providers import transport
+from .core.state import get_backend, make_cache, make_history_store
+from .core.response_cache import ResponseCache
+from .core.semantic_cache import SemanticCache, partition_for
+from .core.provider_router import ProviderRouter
+from .core.rate_limit import Permit, RateLimited, RateLimiter
+from .core.admission import AdmissionController, AdmissionMiddleware, RouteClass
+from .core.deadline import DeadlineMiddleware
+from .core.batch import BatchRunner, InvalidItem, assign_ids, parse_item, parse_jsonl
+from .core.jobs import FINISHED as JOB_FINISHED, JobQueue, QueueFull
+from .core.profiler import SamplingProfiler, SlowRequestLog
+from .core import deadline, metrics, tracing
+from .llm_providers import NEWSAPI_BASE_URL, OPENWEATHER_BASE_URL, is_error_reply
 
 # Initialize FastAPI
 app = FastAPI(title="Multi-LLM + Real-Time Chatbot API")
 
+# Route classes for admission control: (name, default in-flight limit, default max queue wait, priority).
+# Lower priority values are served first, so cheap lookups are not stuck behind LLM calls.
+ROUTE_CLASSES = [
+    ("meta", 64, 2.0, 0),
+    ("weather", 32, 5.0, 1),
+    ("news", 32, 5.0, 2),
+    ("auth", 16, 5.0, 2),
+    ("chat", 64, 10.0, 3),
+    ("stream", 32, 10.0, 4),
+]
+
+# Long-running streamed responses (SSE chat, NDJSON batches)
+STREAMING_PATHS = ("/chat/stream", "/chat/batch")
+
+def route_class(path: str, method: str = "GET") -> str:
+    if path.startswith("/jobs/"):
+        # Job polls only wait; the job queue bounds the work itself
+        return None
+    if path in STREAMING_PATHS:
+        # Own class, so minutes-long streams don't inflate the service time that sheds /chat
+        return "stream"
+    if path.startswith("/chat") or (path == "/jobs" and method == "POST"):
+        # Submitting a job enqueues LLM work
+        return "chat"
+    if path.startswith("/news"):
+        return "news"
+    if path.startswith("/weather"):
+        return "weather"
+    if path in ("/register", "/login", "/me"):
+        return "auth"
+    return "meta"
+
+admission = None
+if os.getenv("ADMISSION_ENABLED", "1") == "1":
+    admission = AdmissionController(
+        [
+            RouteClass(
+                name,
+                limit=int(os.getenv(f"ADMISSION_{name.upper()}_LIMIT", str(limit))),
+                max_wait=float(os.getenv(f"ADMISSION_{name.upper()}_MAX_WAIT", str(max_wait))),
+                priority=priority,
+            )
+            for name, limit, max_wait, priority in ROUTE_CLASSES
+        ],
+        max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "128")),
+    )
+    # Added before CORS so that 503s still carry CORS headers
+    app.add_middleware(AdmissionMiddleware, controller=admission, classify=route_class)
+
+# Per-request time budget (X-Request-Timeout header or ?request_timeout=, in seconds),
+# applied to every upstream call; work is cancelled when the client disconnects.
+# Long streams (SSE chat, NDJSON batches) only get a budget when the client asks for one.
+app.add_middleware(
+    DeadlineMiddleware,
+    default=float(os.getenv("REQUEST_TIMEOUT_DEFAULT", "120")),
+    maximum=float(os.getenv("REQUEST_TIMEOUT_MAX", "600")),
+    streaming_paths=STREAMING_PATHS,
+    max_buffered_body=int(os.getenv("REQUEST_MAX_BUFFERED_BODY", str(1024 * 1024))),
+)
+
+# Per-route request metrics for /metrics; outside admission so shed requests are counted too
+if os.getenv("METRICS_ENABLED", "1") == "1":
+    app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+
+# On-demand sampling profiler and the N slowest requests, both behind /admin
+profiler = SamplingProfiler()
+slow_requests = SlowRequestLog(capacity=int(os.getenv("SLOW_REQUEST_LOG_SIZE", "50")))
+
+# Server-Timing header per request; spans also go to TRACE_EXPORT_FILE as JSON lines if set
+if os.getenv("TRACING_ENABLED", "1") == "1":
+    app.add_middleware(tracing.TracingMiddleware, on_trace=slow_requests.observe, **tracing.middleware_options())
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -33,18 +124,31 @@ app.add_middleware(
 
 # Auth includes (renamed to avoid conflicts)
 from backend.auth_module.router import router as auth_router
-from backend.auth_module.database import engine
-from backend.auth_module.models import Base
+from backend.auth_module.database import close_db, init_db
+from backend.auth_module.security import shutdown_hash_pool, start_hash_pool
+from backend.auth_module.router import get_current_user_async
+from backend.auth_module import principals
+from backend.auth_module.transcripts import router as transcripts_router, writer as transcript_writer
+from backend.auth_module.models import User
 
 # Request/Response models
 class ChatRequest(BaseModel):
     provider: str
     message: str
     images: Optional[List[str]] = []  # Optional image URLs for Gemini
+    no_cache: bool = False  # Skip the response cache for this request
 
 class ChatResponse(BaseModel):
     response: str
     provider: str
+    cache: Optional[str] = None  # "hit", "semantic-hit", "miss" or "bypass" when a response cache is enabled
+
+class CompareRequest(BaseModel):
+    message: str
+    providers: Optional[List[str]] = None  # Defaults to every LLM provider
+    images: Optional[List[str]] = []  # Only sent to Gemini
+    timeout: float = 30.0  # Overall deadline in seconds
+    stream: bool = False  # Send each result as an SSE event as soon as it is ready
 
 # Initialize LLM clients
 llm_clients = {
@@ -55,39 +159,133 @@ llm_clients = {
     "weather": WeatherClient(api_key=os.getenv("OPENWEATHER_KEY") or os.getenv("OPENWEATHER_API_KEY")),
 }
 
+# Providers backed by an LLM (as opposed to news/weather lookups)
+LLM_PROVIDERS = ("openai", "gemini", "deepseek")
+
+# Providers whose single-turn replies may be served from the response cache
+CACHEABLE_PROVIDERS = set(LLM_PROVIDERS)
+
+# Opt-in exact-match cache for single-turn LLM replies
+response_cache = None
+if os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1":
+    response_cache = ResponseCache(make_cache(
+        "responses",
+        ttls={"chat": float(os.getenv("RESPONSE_CACHE_TTL", "3600"))},
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ))
+
+# Opt-in near-duplicate cache: serves replies for paraphrased single-turn prompts
+semantic_cache = None
+if os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1":
+    semantic_cache = SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        capacity=int(os.getenv("SEMANTIC_CACHE_CAPACITY", "2000")),
+    )
+
+# Tracks per-provider latency/errors and picks the provider for provider="auto"
+provider_router = ProviderRouter(
+    models={p: llm_clients[p].model for p in LLM_PROVIDERS},
+    window=int(os.getenv("ROUTER_WINDOW", "100")),
+    min_samples=int(os.getenv("ROUTER_MIN_SAMPLES", "5")),
+    max_error_rate=float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5")),
+    hedge=os.getenv("ROUTER_HEDGE_ENABLED", "1") == "1",
+    hedge_percentile=float(os.getenv("ROUTER_HEDGE_PERCENTILE", "0.95")),
+    default_hedge_delay=float(os.getenv("ROUTER_DEFAULT_HEDGE_DELAY", "5")),
+)
+
+# Per-user token buckets (one per provider) and a fair queue in front of the chat endpoints
+chat_limiter = None
+if os.getenv("CHAT_RATE_LIMIT_ENABLED", "1") == "1":
+    chat_limiter = RateLimiter(
+        rate=float(os.getenv("CHAT_RATE_LIMIT_PER_MINUTE", "20")) / 60,
+        burst=float(os.getenv("CHAT_RATE_LIMIT_BURST", "5")),
+        max_wait=float(os.getenv("CHAT_RATE_LIMIT_MAX_WAIT", "10")),
+        concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "32")),
+        queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "30")),
+    )
+
+# Metrics labels for upstream calls: one per LLM client, plus the news and weather APIs
+for _name in LLM_PROVIDERS:
+    transport.label_upstream(llm_clients[_name].upstream, _name)
+transport.label_upstream(NEWSAPI_BASE_URL, "news")
+transport.label_upstream(OPENWEATHER_BASE_URL, "weather")
+
+def cache_metrics():
+    """Cache and coalescing counters for /metrics, read from the caches' own stats."""
+    hits, misses, ratios = [], [], []
+
+    def add(cache, namespace, h, m):
+        labels = {"cache": cache, "namespace": namespace}
+        hits.append((labels, h))
+        misses.append((labels, m))
+        ratios.append((labels, h / (h + m) if h + m else None))
+
+    for namespace, c in llm_clients["weather"].cache_stats()["namespaces"].items():
+        add("weather", namespace, c["hits"], c["misses"])
+    if response_cache is not None:
+        for namespace, c in response_cache.stats()["namespaces"].items():
+            add("responses", namespace, c["hits"], c["misses"])
+    if semantic_cache is not None:
+        semantic = semantic_cache.stats()
+        add("semantic", "chat", semantic["hits"], semantic["misses"])
+    auth = principals.stats()
+    if auth is not None:
+        for namespace, c in auth["namespaces"].items():
+            add("auth", namespace, c["hits"], c["misses"])
+    coalescing = transport.coalescing_stats()
+    return [
+        ("chatbot_cache_hits_total", "counter", "Cache hits.", hits),
+        ("chatbot_cache_misses_total", "counter", "Cache misses.", misses),
+        ("chatbot_cache_hit_ratio", "gauge", "Hits / (hits + misses) since start.", ratios),
+        ("chatbot_coalesced_requests_total", "counter", "Upstream GETs served by joining an identical in-flight call.",
+         [({}, coalescing["coalesced"])]),
+    ]
+
+metrics.registry.add_collector(cache_metrics)
+
 # Real-time API keys
 ALPHA_VANTAGE_KEY = os.getenv("ALPHA_VANTAGE_KEY")
 OPENWEATHER_KEY = os.getenv("OPENWEATHER_KEY")
 NEWSAPI_KEY = os.getenv("NEWSAPI_KEY")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY") or os.getenv("NEWSAPI_KEY")
 
-# Store conversation history per session & provider
-conversation_histories = {}  # { session_id: { provider: [messages] } }
+# Store conversation history per session & provider: the trailing messages each client may fit into its token budget.
+# Lives in process memory unless STATE_BACKEND_URL points at a shared SQLite/Redis store.
+# provider="auto" keeps one history per session, whichever provider answers each turn.
+_history_windows = {name: getattr(c, "history_window", 0) for name, c in llm_clients.items()}
+_history_windows["auto"] = max(_history_windows[p] for p in LLM_PROVIDERS)
+conversation_histories = make_history_store(
+    windows=_history_windows,
+    idle_ttl=float(os.getenv("HISTORY_IDLE_TTL", "1800")),
+    max_bytes=int(os.getenv("HISTORY_MAX_BYTES", str(32 * 1024 * 1024))),
+    max_keys=int(os.getenv("HISTORY_MAX_KEYS", "100000")),
+)
 
 # --- Helper Functions for Real-Time Data ---
-def get_stock_price(symbol: str) -> str:
+async def get_stock_price(symbol: str) -> str:
     try:
         url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={ALPHA_VANTAGE_KEY}"
-        r = requests.get(url).json()
+        r = (await transport.get(url)).json()
         price = r["Global Quote"]["05. price"]
         return f"📈 {symbol} price: ${price}"
     except:
         return "⚠️ Unable to fetch stock price."
 
-def get_weather(city: str) -> str:
+async def get_weather(city: str) -> str:
     try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={OPENWEATHER_KEY}&units=metric"
-        r = requests.get(url).json()
+        url = f"{OPENWEATHER_BASE_URL}/data/2.5/weather?q={city}&appid={OPENWEATHER_KEY}&units=metric"
+        r = (await transport.get(url)).json()
         temp = r["main"]["temp"]
         desc = r["weather"][0]["description"]
         return f"🌤️ Weather in {city}: {temp}°C, {desc}"
     except:
         return "⚠️ Unable to fetch weather."
 
-def get_news() -> str:
+async def get_news() -> str:
     try:
-        url = f"https://newsapi.org/v2/top-headlines?country=us&apiKey={NEWSAPI_KEY}&pageSize=5"
-        r = requests.get(url).json()
+        url = f"{NEWSAPI_BASE_URL}/top-headlines?country=us&apiKey={NEWSAPI_KEY}&pageSize=5"
+        r = (await transport.get(url)).json()
         articles = r.get("articles", [])
         headlines = "\n".join([f"• {a['title']}" for a in articles])
         return f"📰 Latest headlines:\n{headlines}"
@@ -101,32 +299,195 @@ async def root():
 
 # Include auth routes
 app.include_router(auth_router, prefix="", tags=["auth"])
+app.include_router(transcripts_router, tags=["transcripts"])
 
 @app.on_event("startup")
 async def on_startup():
-    if Base and engine:
-        try:
-            Base.metadata.create_all(bind=engine)
-        except Exception:
-            pass
+    await init_db()
+    if transcript_writer is not None:
+        transcript_writer.start()
+    await start_hash_pool()
+    job_queue.start()
+    if os.getenv("HTTP_PREWARM", "1") != "0":
+        await transport.warmup([
+            llm_clients["openai"].api_url,
+            llm_clients["news"].base_url,
+            llm_clients["weather"].base,
+        ])
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_queue.close()
+    await transport.aclose()
+    shutdown_hash_pool()
+    if transcript_writer is not None:
+        await transcript_writer.close()
+    await close_db()
+    state_backend = get_backend()
+    if state_backend is not None:
+        await state_backend.close()
 
 @app.get("/providers")
 async def get_providers():
-    return {"providers": list(llm_clients.keys())}
+    return {"providers": list(llm_clients.keys()) + ["auto"]}
+
+@app.get("/providers/stats")
+async def get_provider_stats():
+    """Rolling latency percentiles and error rates used by provider="auto"."""
+    return provider_router.snapshot()
+
+async def generate_reply(provider: str, client, message: str, images: list, history: list):
+    """
+    Call an LLM client with the arguments it understands; returns (reply, history).
+    Latency and outcome are recorded for the provider router.
+    """
+    history = list(history)
+    started = time.perf_counter()
+    model = getattr(client, "model", "")
+    try:
+        # Gemini with optional images
+        if provider == "gemini":
+            reply = await client.generate_response(message, images=images, history=history)
+
+        # DeepSeek updates history itself
+        elif provider == "deepseek":
+            reply, history = await client.generate_response(message, history)
+
+        # OpenAI or other LLMs
+        else:
+            reply = await client.generate_response(message, history=history)
+    except asyncio.CancelledError:
+        # Abandoned (e.g. lost a hedge race), says nothing about the provider
+        raise
+    except Exception:
+        provider_router.observe(provider, model, time.perf_counter() - started, False)
+        raise
+    provider_router.observe(provider, model, time.perf_counter() - started, not is_error_reply(reply))
+    if provider != "deepseek" and not is_error_reply(reply):
+        history += [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+    return reply, history
+
+async def generate_auto(message: str, images: list, identity: str | None = None, history: list = ()):
+    """
+    Route a prompt and its `history` to the fastest healthy provider; returns
+    (provider, reply, history) like generate_reply. With an `identity`, each call
+    is charged to that caller's bucket for the provider it goes to; an empty
+    bucket fails over to the next provider like an error would.
+    """
+    refused = {}
+    histories = {}  # {provider: history after its reply}
+
+    async def call(provider):
+        if identity is not None and chat_limiter is not None:
+            try:
+                chat_limiter.charge(identity, provider)
+            except RateLimited as e:
+                refused[provider] = e
+                return str(e)
+        reply, histories[provider] = await generate_reply(provider, llm_clients[provider], message, images, history)
+        return reply
+
+    provider, reply = await provider_router.route(call)
+    if provider in refused and is_error_reply(reply):
+        # Nothing answered and the last candidate was refused: tell the caller to back off
+        raise refused[provider]
+    return provider, reply, histories.get(provider, list(history))
+
+async def bearer_user_id(request: Request) -> int | None:
+    """User id from a valid bearer token (cached, see auth_module.principals), else None."""
+    authorization = request.headers.get("authorization") or ""
+    if not authorization.startswith("Bearer "):
+        return None
+    with tracing.span("auth.decode"):
+        principal = await principals.verify_token(authorization.split(" ", 1)[1])
+    return principal[0] if principal is not None else None
+
+async def client_identity(request: Request) -> str:
+    """Rate-limit key: the JWT subject for a valid bearer token, else the client IP."""
+    user_id = await bearer_user_id(request)
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+async def remember_exchange(http_request: Request, session_id: str, message: str, reply: ChatResponse) -> ChatResponse:
+    """Queue a signed-in user's message and `reply` for the transcript (write-behind, no DB wait)."""
+    if transcript_writer is not None:
+        transcript_writer.record_exchange(await bearer_user_id(http_request), session_id, reply.provider, message, reply.response)
+    return reply
+
+def rate_limited(e: RateLimited) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+
+async def admit_chat(request: Request, *providers: str) -> Permit:
+    """
+    Wait for this caller's turn on each of `providers` (one upstream slot each),
+    or answer 429/503 with Retry-After. "auto" takes a slot but no token: its
+    calls are charged to the provider they are routed to, see generate_auto.
+    """
+    if chat_limiter is None or any(p not in llm_clients and p != "auto" for p in providers):
+        return Permit(None, {})
+    try:
+        identity = await client_identity(request)
+        with tracing.span("ratelimit"):
+            return await chat_limiter.acquire_many(identity, [p for p in providers if p != "auto"], slots=len(providers))
+    except RateLimited as e:
+        raise rate_limited(e)
+
+@app.get("/ratelimit/stats")
+async def get_rate_limit_stats():
+    """Admitted, delayed and rejected chat requests, plus the fair queue's depth."""
+    return chat_limiter.stats() if chat_limiter is not None else None
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of request, upstream and cache metrics."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    """In-flight, queued and shed requests per route class."""
+    return admission.stats() if admission is not None else None
+
+@app.get("/upstreams/stats")
+async def get_upstream_stats():
+    """Circuit breaker state per upstream and the concurrency limit of its host."""
+    return transport.upstream_stats()
+
+@app.get("/transcripts/stats")
+async def get_transcript_stats():
+    """Write-behind queue depth, batches written, and dropped or rejected messages for chat transcripts."""
+    return transcript_writer.stats() if transcript_writer is not None else None
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters and sizes of the provider, response and auth caches, upstream
+    coalescing, and the memory held by the conversation history store.
+    """
+    return {
+        "history": await conversation_histories.footprint(),
+        "weather": llm_clients["weather"].cache_stats(),
+        "responses": response_cache.stats() if response_cache is not None else None,
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+        "auth": principals.stats(),
+        "coalescing": transport.coalescing_stats(),
+    }
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, session_id: str = "default"):
+async def chat(request: ChatRequest, http_request: Request, http_response: Response, session_id: str = "default"):
     """
     Send a message to the LLM or real-time API based on content.
     Maintains session-based conversation history for context.
     """
+    tracing.annotate(provider=request.provider, message_chars=len(request.message), images=len(request.images or []))
+    permit = await admit_chat(http_request, request.provider)
+    http_response.headers.update(permit.headers)
     try:
         msg = request.message.lower()
         provider = request.provider
 
-        # Initialize session history if not exists
-        session_history = conversation_histories.get(session_id, {})
-        history = session_history.get(provider, [])
+        # Load retained session history (empty for new sessions)
+        history = await conversation_histories.get(session_id, provider)
 
         # # --- Check for real-time triggers ---
         # if "stock" in msg:
@@ -144,6 +505,13 @@ async def chat(request: ChatRequest, session_id: str = "default"):
         #     return ChatResponse(response=response, provider="realtime")
 
         # --- Call LLM or News based on provider ---
+        if provider == "auto":
+            routed, response, history = await generate_auto(
+                request.message, request.images, await client_identity(http_request), history,
+            )
+            await conversation_histories.save(session_id, provider, history)
+            return await remember_exchange(http_request, session_id, request.message, ChatResponse(response=response, provider=routed or provider))
+
         if provider not in llm_clients:
             raise HTTPException(status_code=400, detail=f"❌ Provider '{provider}' not supported.")
 
@@ -161,44 +529,473 @@ async def chat(request: ChatRequest, session_id: str = "default"):
             for cat in ["business","entertainment","general","health","science","sports","technology"]:
                 if cat in tokens:
                     category = cat
-            articles, err = client.get_latest_news(country=country, category=category, limit=5)
+            articles, err = await client.get_latest_news(country=country, category=category, limit=5)
             if err:
                 return ChatResponse(response=f"⚠️ News API error: {err}", provider="news")
             if not articles:
                 return ChatResponse(response="⚠️ No news found.", provider="news")
             headlines = "\n".join([f"• {a.get('title','Untitled')} ({(a.get('source') or {}).get('name','')})" for a in articles])
-            return ChatResponse(response=f"📰 Top headlines{f' in {country.upper()}' if country else ''}{f' - {category}' if category else ''}:\n{headlines}", provider="news")
-
-        # Gemini with optional images
-        if provider == "gemini":
-            response = client.generate_response(request.message, images=request.images)
+            return await remember_exchange(http_request, session_id, request.message, ChatResponse(response=f"📰 Top headlines{f' in {country.upper()}' if country else ''}{f' - {category}' if category else ''}:\n{headlines}", provider="news"))
 
-        # DeepSeek with history
-        elif provider == "deepseek":
-            response, history = client.generate_response(request.message, history)
+        # Response caches, only for single-turn prompts (no prior context):
+        # exact match first, then near-duplicate prompts (text only)
+        cache_key = None
+        cache_status = None
+        semantic_partition = None
+        caching = response_cache is not None or semantic_cache is not None
+        if caching and provider in CACHEABLE_PROVIDERS and not history:
+            if request.no_cache:
+                cache_status = "bypass"
+            else:
+                cached = None
+                if response_cache is not None:
+                    with tracing.span("cache", namespace="responses"):
+                        cache_key = response_cache.key_for_client(provider, client, request.message, request.images)
+                        cached = await response_cache.get(cache_key)
+                    cache_status = "hit"
+                if cached is None and semantic_cache is not None and not request.images:
+                    semantic_partition = partition_for(provider, client)
+                    with tracing.span("cache", namespace="semantic"):
+                        match = semantic_cache.lookup(semantic_partition, request.message)
+                    if match is not None:
+                        cached = match[0]
+                        cache_status = "semantic-hit"
+                if cached is not None:
+                    history.append({"role": "user", "content": request.message})
+                    history.append({"role": "assistant", "content": cached})
+                    await conversation_histories.save(session_id, provider, history)
+                    http_response.headers["X-Cache"] = cache_status
+                    return await remember_exchange(http_request, session_id, request.message, ChatResponse(response=cached, provider=provider, cache=cache_status))
+                cache_status = "miss"
 
-        # OpenAI or other LLMs
-        else:
-            response = client.generate_response(request.message)
+        response, history = await generate_reply(provider, client, request.message, request.images, history)
 
         # Save updated history
-        session_history[provider] = history
-        conversation_histories[session_id] = session_history
+        await conversation_histories.save(session_id, provider, history)
+
+        if cache_key is not None:
+            await response_cache.put(cache_key, response)
+        if semantic_partition is not None and not is_error_reply(response):
+            semantic_cache.add(semantic_partition, request.message, response)
+        if cache_status:
+            http_response.headers["X-Cache"] = cache_status
 
-        return ChatResponse(response=response, provider=provider)
+        return await remember_exchange(http_request, session_id, request.message, ChatResponse(response=response, provider=provider, cache=cache_status))
 
+    except RateLimited as e:
+        raise rate_limited(e)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"❌ Error: {str(e)}")
+    finally:
+        permit.release()
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request, session_id: str = "default"):
+    """
+    Streaming variant of /chat for LLM providers. Sends Server-Sent Events:
+    `token` events with each text chunk as it arrives, then a single `done`
+    event carrying the full reply.
+    """
+    provider = request.provider
+    if provider not in llm_clients:
+        raise HTTPException(status_code=400, detail=f"❌ Provider '{provider}' not supported.")
+    client = llm_clients[provider]
+    if not hasattr(client, "stream_response"):
+        raise HTTPException(status_code=400, detail=f"❌ Provider '{provider}' does not support streaming.")
+
+    tracing.annotate(provider=provider, message_chars=len(request.message), images=len(request.images or []), stream=True)
+    # The slot is held until the stream ends
+    permit = await admit_chat(http_request, provider)
+    history = await conversation_histories.get(session_id, provider)
+
+    if provider == "gemini":
+        chunks = client.stream_response(request.message, images=request.images, history=history)
+    elif provider == "deepseek":
+        # history is updated in place once the stream completes
+        chunks = client.stream_response(request.message, history)
+    else:
+        chunks = client.stream_response(request.message, history=history)
+
+    async def events():
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event("token", {"token": chunk})
+        except Exception as e:
+            traceback.print_exc()
+            yield sse_event("error", {"detail": f"❌ Error: {str(e)}"})
+            return
+        finally:
+            permit.release()
+
+        reply = "".join(parts).strip()
+        if provider == "gemini":
+            with tracing.span("gemini.tidy"):
+                reply = client.tidy_reply(reply)
+
+        # Save updated history
+        if provider != "deepseek" and not is_error_reply(reply):
+            history.extend([{"role": "user", "content": request.message}, {"role": "assistant", "content": reply}])
+        await conversation_histories.save(session_id, provider, history)
+        await remember_exchange(http_request, session_id, request.message, ChatResponse(response=reply, provider=provider))
+
+        yield sse_event("done", {"response": reply, "provider": provider})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **permit.headers},
+        # Also release if the stream never started (release is idempotent)
+        background=BackgroundTask(permit.release),
+    )
+
+async def compare_results(providers: list, message: str, images: list, timeout: float):
+    """
+    Run one prompt against several LLM providers concurrently and yield each
+    result as soon as it is ready. Providers still running at the deadline
+    are cancelled and reported with status "timeout".
+    """
+    started = time.perf_counter()
+
+    async def run(provider):
+        t0 = time.perf_counter()
+        try:
+            reply, _ = await generate_reply(provider, llm_clients[provider], message, images, [])
+            status = "error" if is_error_reply(reply) else "ok"
+        except Exception as e:
+            traceback.print_exc()
+            reply, status = f"❌ Error: {str(e)}", "error"
+        return {
+            "provider": provider,
+            "status": status,
+            "response": reply,
+            "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+
+    pending = {asyncio.create_task(run(p)): p for p in providers}
+    deadline = started + timeout
+    try:
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del pending[task]
+                yield task.result()
+        for provider in pending.values():
+            yield {
+                "provider": provider,
+                "status": "timeout",
+                "response": f"⚠️ {provider} did not answer within {timeout:g}s.",
+                "latency_ms": None,
+            }
+    finally:
+        for task in pending:
+            task.cancel()
+
+@app.post("/chat/compare")
+async def chat_compare(request: CompareRequest, http_request: Request, http_response: Response):
+    """
+    Send one prompt to several LLM providers at once. Wall-clock time is
+    bounded by the slowest provider or the deadline, whichever comes first.
+    Each provider is charged to the caller's rate limit as if asked separately.
+    """
+    providers = request.providers or list(LLM_PROVIDERS)
+    unknown = [p for p in providers if p not in LLM_PROVIDERS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"❌ Providers not supported for comparison: {', '.join(unknown)}")
+    providers = list(dict.fromkeys(providers))
+    tracing.annotate(provider=",".join(providers), message_chars=len(request.message), images=len(request.images or []))
+    timeout = max(1.0, min(120.0, request.timeout))
+    permit = await admit_chat(http_request, *providers)
+    results = compare_results(providers, request.message, request.images, timeout)
+
+    if request.stream:
+        async def events():
+            started = time.perf_counter()
+            try:
+                async for result in results:
+                    yield sse_event("result", result)
+            finally:
+                permit.release()
+            yield sse_event("done", {"elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **permit.headers},
+            # Also release if the stream never started (release is idempotent)
+            background=BackgroundTask(permit.release),
+        )
+
+    http_response.headers.update(permit.headers)
+    started = time.perf_counter()
+    try:
+        collected = [r async for r in results]
+    finally:
+        permit.release()
+    return {"results": collected, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+# --- Batch: bulk prompts, results streamed back as NDJSON ---
+BATCH_PROVIDERS = LLM_PROVIDERS + ("auto",)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+
+async def batch_call(provider: str, message: str, images: list, identity: str | None = None):
+    """
+    One batch item or job. With an `identity` (batch items), the call is charged
+    to that caller's bucket and takes an upstream slot, like a /chat request;
+    jobs are charged when they are submitted instead.
+    """
+    permit = Permit(None, {})
+    try:
+        if identity is not None and chat_limiter is not None:
+            permit = await chat_limiter.acquire_many(identity, [] if provider == "auto" else [provider], slots=1)
+        if provider == "auto":
+            routed, reply, _ = await generate_auto(message, images, identity)
+            return routed or provider, reply
+        reply, _ = await generate_reply(provider, llm_clients[provider], message, images, [])
+        return provider, reply
+    except RateLimited as e:
+        # An error reply, so the batch runner backs off and retries the item
+        return provider, str(e)
+    finally:
+        permit.release()
+
+batch_runner = BatchRunner(
+    batch_call,
+    is_error_reply,
+    concurrency=int(os.getenv("BATCH_CONCURRENCY_PER_PROVIDER", "4")),
+    max_attempts=int(os.getenv("BATCH_MAX_ATTEMPTS", "3")),
+    item_timeout=float(os.getenv("BATCH_ITEM_TIMEOUT", "120")),
+    store=make_cache(
+        "batches",
+        ttls={"result": float(os.getenv("BATCH_RESULT_TTL", "86400"))},
+        max_entries=int(os.getenv("BATCH_RESULT_MAX_ENTRIES", "50000")),
+        max_bytes=int(os.getenv("BATCH_RESULT_MAX_BYTES", str(64 * 1024 * 1024))),
+    ),
+    store_ttl=float(os.getenv("BATCH_RESULT_TTL", "86400")),
+)
+
+async def read_batch_items(http_request: Request) -> tuple[list, str | None]:
+    """Raw items and an optional batch id from a JSON body, a JSONL body or a JSONL file upload."""
+    content_type = http_request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await http_request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="❌ Upload the JSONL file as form field 'file'.")
+        return parse_jsonl((await upload.read()).decode("utf-8")), form.get("batch_id")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return parse_jsonl((await http_request.body()).decode("utf-8")), None
+    try:
+        body = await http_request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="❌ Body must be JSON, JSONL or a multipart JSONL upload.")
+    if isinstance(body, list):
+        return body, None
+    if isinstance(body, dict) and isinstance(body.get("items"), list):
+        return body["items"], body.get("batch_id")
+    raise HTTPException(status_code=400, detail="❌ Expected a list of items or {\"items\": [...]}.")
+
+@app.post("/chat/batch")
+async def chat_batch(
+    http_request: Request,
+    batch_id: Optional[str] = None,
+    skip_completed: bool = False,
+    current_user: User = Depends(get_current_user_async),
+):
+    """
+    Run many {id, provider, message, images} prompts and stream one NDJSON
+    result line per item in completion order, then a summary line. Send the
+    same batch_id again to resume: finished items are replayed from the last
+    run (or left out with skip_completed=true) and only the rest is called.
+    """
+    raw, body_batch_id = await read_batch_items(http_request)
+    if len(raw) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"❌ At most {BATCH_MAX_ITEMS} items per batch.")
+    batch_id = batch_id or body_batch_id or uuid.uuid4().hex
+    try:
+        ids = assign_ids(raw)
+    except InvalidItem:
+        raise HTTPException(status_code=400, detail="❌ Item ids must be unique within a batch.")
+    items, invalid = [], []
+    for item_id, entry in zip(ids, raw):
+        try:
+            if isinstance(entry, dict) and "_error" in entry:
+                raise InvalidItem(entry["_error"])
+            items.append(parse_item(entry, item_id, BATCH_PROVIDERS))
+        except InvalidItem as e:
+            invalid.append({"type": "result", "id": item_id, "status": "invalid", "response": f"❌ {e}"})
+    tracing.annotate(batch_id=batch_id, batch_items=len(raw))
+
+    async def lines():
+        started = time.perf_counter()
+        counts = {"ok": 0, "error": 0, "invalid": len(invalid), "replayed": 0}
+        for result in invalid:
+            yield json.dumps(result) + "\n"
+        # The owner is also the rate-limit identity (see client_identity)
+        async for result in batch_runner.run(items, f"user:{current_user.id}", batch_id):
+            if result.get("replayed"):
+                counts["replayed"] += 1
+                if skip_completed:
+                    continue
+            counts[result["status"]] += 1
+            yield json.dumps(result) + "\n"
+        yield json.dumps({
+            "type": "summary",
+            "batch_id": batch_id,
+            "items": len(raw),
+            **counts,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/chat/batch/stats")
+async def get_batch_stats():
+    """Batch items done, failed, replayed and retried, and calls in flight per provider."""
+    return batch_runner.stats()
+
+# --- Jobs: long-running requests, submitted now and fetched later ---
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+
+job_queue = JobQueue(
+    batch_call,
+    is_error_reply,
+    store=make_cache(
+        "jobs",
+        ttls={"job": float(os.getenv("JOB_RESULT_TTL", "3600"))},
+        max_entries=int(os.getenv("JOB_MAX_ENTRIES", "20000")),
+        max_bytes=int(os.getenv("JOB_MAX_BYTES", str(64 * 1024 * 1024))),
+    ),
+    workers=int(os.getenv("JOB_WORKERS", "8")),
+    max_queue=int(os.getenv("JOB_MAX_QUEUE", "1000")),
+    timeout=float(os.getenv("JOB_TIMEOUT", "600")),
+    result_ttl=float(os.getenv("JOB_RESULT_TTL", "3600")),
+)
+
+def job_response(record: dict, response: Response) -> dict:
+    response.headers["Location"] = f"/jobs/{record['job_id']}"
+    if record["status"] not in JOB_FINISHED:
+        response.headers["Retry-After"] = "1"
+    return record
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: ChatRequest, http_request: Request, http_response: Response):
+    """
+    Queue an LLM request and return its job id at once. Poll GET /jobs/{job_id}
+    (optionally with ?wait=seconds) for the result.
+    """
+    if request.provider not in BATCH_PROVIDERS:
+        raise HTTPException(status_code=400, detail=f"❌ Provider '{request.provider}' not supported for jobs.")
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="❌ Message is required.")
+    # The job is routed when it runs; charge the provider that would serve it now
+    charged = request.provider
+    if charged == "auto":
+        charged = next(iter(provider_router.rank()), charged)
+    permit = await admit_chat(http_request, charged)
+    http_response.headers.update(permit.headers)
+    try:
+        record = await job_queue.submit(await bearer_user_id(http_request), request.provider, request.message, request.images or [])
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"⚠️ Too many jobs queued; please retry in {e.retry_after}s.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    finally:
+        # The permit only paces submissions; the job queue bounds the calls
+        permit.release()
+    tracing.annotate(job_id=record["job_id"])
+    return job_response(record, http_response)
+
+@app.get("/jobs/stats")
+async def get_job_stats():
+    """Jobs queued, running, completed, failed and refused, and the average job time."""
+    return job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    http_response: Response,
+    http_request: Request,
+    wait: float = Query(0, ge=0, description="seconds to wait for the job to finish (long-poll)"),
+):
+    """A job's status ("queued", "running", "done" or "error") and, once finished, its response."""
+    record = await job_queue.get(job_id)
+    # Jobs of signed-in users are theirs alone; anonymous jobs are reachable by id
+    if record is None or (record["user_id"] is not None and record["user_id"] != await bearer_user_id(http_request)):
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    left = deadline.remaining()
+    wait = min(wait, JOB_MAX_WAIT, max(0.0, left - 1.0) if left is not None else JOB_MAX_WAIT)
+    record = await job_queue.wait(job_id, wait) or record
+    return job_response(record, http_response)
+
+# --- Admin: profiling ---
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+async def require_admin(current_user: User = Depends(get_current_user_async)) -> User:
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin only")
+    return current_user
+
+@app.post("/admin/profiler/start")
+async def profiler_start(duration: float = 30.0, interval_ms: float = 10.0, threads: str = "all", _: User = Depends(require_admin)):
+    """
+    Sample stacks for `duration` seconds (capped at 10 minutes). threads="loop"
+    samples only the event loop thread, leaving out idle worker threads.
+    """
+    thread_id = threading.get_ident() if threads == "loop" else None
+    if not profiler.start(duration=duration, interval=interval_ms / 1000, thread_id=thread_id):
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return profiler.status()
+
+@app.post("/admin/profiler/stop")
+async def profiler_stop(_: User = Depends(require_admin)):
+    await asyncio.to_thread(profiler.stop)
+    return profiler.status()
+
+@app.get("/admin/profiler/status")
+async def profiler_status(_: User = Depends(require_admin)):
+    return profiler.status()
+
+@app.get("/admin/profiler/collapsed")
+async def profiler_collapsed(_: User = Depends(require_admin)):
+    """Last profile as collapsed stacks, for flamegraph.pl or speedscope."""
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'},
+    )
+
+@app.get("/admin/slow-requests")
+async def get_slow_requests(limit: int = 20, _: User = Depends(require_admin)):
+    """Slowest requests seen so far, with their span breakdown and request shape."""
+    return {"requests": slow_requests.entries(max(1, limit))}
+
+@app.delete("/admin/slow-requests")
+async def clear_slow_requests(_: User = Depends(require_admin)):
+    slow_requests.clear()
+    return {"cleared": True}
 
 # --- Dedicated News endpoints ---
 @app.get("/news/global")
 async def news_global():
     if not NEWS_API_KEY:
         raise HTTPException(status_code=400, detail="Missing NEWS_API_KEY in environment")
-    url = f"https://newsapi.org/v2/top-headlines?language=en&apiKey={NEWS_API_KEY}"
+    url = f"{NEWSAPI_BASE_URL}/top-headlines?language=en&apiKey={NEWS_API_KEY}"
     try:
-        r = requests.get(url, timeout=10)
+        r = await transport.get_shared(url, timeout=10)
         if r.status_code != 200:
             return {"status": r.status_code, "error": r.text}
         return r.json()
@@ -209,9 +1006,9 @@ async def news_global():
 async def news_india():
     if not NEWS_API_KEY:
         raise HTTPException(status_code=400, detail="Missing NEWS_API_KEY in environment")
-    url = f"https://newsapi.org/v2/top-headlines?country=in&apiKey={NEWS_API_KEY}"
+    url = f"{NEWSAPI_BASE_URL}/top-headlines?country=in&apiKey={NEWS_API_KEY}"
     try:
-        r = requests.get(url, timeout=10)
+        r = await transport.get_shared(url, timeout=10)
         if r.status_code != 200:
             return {"status": r.status_code, "error": r.text}
         return r.json()
@@ -222,9 +1019,9 @@ async def news_india():
 async def news_sources():
     if not NEWS_API_KEY:
         raise HTTPException(status_code=400, detail="Missing NEWS_API_KEY in environment")
-    url = f"https://newsapi.org/v2/top-headlines/sources?language=en&apiKey={NEWS_API_KEY}"
+    url = f"{NEWSAPI_BASE_URL}/top-headlines/sources?language=en&apiKey={NEWS_API_KEY}"
     try:
-        r = requests.get(url, timeout=10)
+        r = await transport.get_shared(url, timeout=10)
         if r.status_code != 200:
             return {"status": r.status_code, "error": r.text}
         return r.json()
@@ -235,7 +1032,7 @@ async def news_sources():
 async def news_combined(country: str = "in", category: str | None = None, q: str | None = None):
     if not NEWS_API_KEY:
         raise HTTPException(status_code=400, detail="Missing NEWS_API_KEY in environment")
-    base = f"https://newsapi.org/v2/top-headlines?apiKey={NEWS_API_KEY}"
+    base = f"{NEWSAPI_BASE_URL}/top-headlines?apiKey={NEWS_API_KEY}"
     if country:
         base += f"&country={country}"
     if category:
@@ -243,10 +1040,12 @@ async def news_combined(country: str = "in", category: str | None = None, q: str
     if q:
         base += f"&q={q}"
     headlines_url = base
-    sources_url = f"https://newsapi.org/v2/top-headlines/sources?language=en&apiKey={NEWS_API_KEY}"
+    sources_url = f"{NEWSAPI_BASE_URL}/top-headlines/sources?language=en&apiKey={NEWS_API_KEY}"
     try:
-        h = requests.get(headlines_url, timeout=10)
-        s = requests.get(sources_url, timeout=10)
+        h, s = await asyncio.gather(
+            transport.get_shared(headlines_url, timeout=10),
+            transport.get_shared(sources_url, timeout=10),
+        )
         return {
             "headlines": h.json() if h.status_code == 200 else {"status": h.status_code, "error": h.text},
             "sources": s.json() if s.status_code == 200 else {"status": s.status_code, "error": s.text}
@@ -263,7 +1062,8 @@ async def news_stocks(feed_url: str | None = None, limit: int = 20):
     default_feed = os.getenv("NEWS_STOCK_RSS", "https://www.moneycontrol.com/rss/latestnews.xml")
     url = feed_url or default_feed
     try:
-        parsed = feedparser.parse(url)
+        r = await transport.get_shared(url, timeout=10, follow_redirects=True, label="rss")
+        parsed = feedparser.parse(r.content)
         items = []
         for entry in parsed.entries[: max(1, min(50, limit))]:
             items.append({
@@ -280,16 +1080,16 @@ async def news_stocks(feed_url: str | None = None, limit: int = 20):
 @app.get("/weather/current")
 async def weather_current(city: str, units: str = "metric"):
     wc = llm_clients.get("weather")
-    data, err = wc.current(city=city, units=units)
+    data, err = await wc.current(city=city, units=units)
     if err:
         # Fallback to text response for clearer client message
-        return {"detail": wc.current_text(city=city, units=units)}
+        return {"detail": await wc.current_text(city=city, units=units)}
     return data
 
 @app.get("/weather/forecast")
 async def weather_forecast(city: str, units: str = "metric"):
     wc = llm_clients.get("weather")
-    data, err = wc.forecast(city=city, units=units)
+    data, err = await wc.forecast(city=city, units=units)
     if err:
         raise HTTPException(status_code=400, detail=err)
     return data
@@ -297,7 +1097,9 @@ async def weather_forecast(city: str, units: str = "metric"):
 @app.get("/weather/combined")
 async def weather_combined(city: str, units: str = "metric"):
     wc = llm_clients.get("weather")
-    cur, e1 = wc.current(city=city, units=units)
-    fc, e2 = wc.forecast(city=city, units=units)
+    (cur, e1), (fc, e2) = await asyncio.gather(
+        wc.current(city=city, units=units),
+        wc.forecast(city=city, units=units),
+    )
     return {"current": cur or {"detail": e1}, "forecast": fc or {"detail": e2}}
  
\ No newline at end of file
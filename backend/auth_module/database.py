@@ -1,13 +1,82 @@
+"""
+Auth database engines and sessions.
+
+Two engines share one DATABASE_URL:
+
+    engine / SessionLocal / get_db                  sync, for sync routes
+    async_engine / AsyncSessionLocal / get_async_db  asyncio (aiosqlite, asyncpg)
+
+The async URL is derived from DATABASE_URL (sqlite:// -> sqlite+aiosqlite://,
+postgresql:// -> postgresql+asyncpg://) unless ASYNC_DATABASE_URL is set.
+Pool size, overflow, timeout and recycle come from DB_POOL_*. SQLite
+connections are switched to WAL with synchronous=NORMAL, memory-mapped
+reads and a busy timeout, so readers never wait on a writer and concurrent
+writers queue instead of failing with "database is locked".
+
+Tables are created once per process by init_db(), called at app startup,
+which also fills in the chat session summaries for older transcripts.
+"""
 import os
-from sqlalchemy import create_engine
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./auth.db")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def async_url(url: str) -> str:
+    """The asyncio driver variant of a sync database URL."""
+    scheme, sep, rest = url.partition("://")
+    drivers = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+    return f"{drivers.get(scheme, scheme)}{sep}{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _engine_options(url: str) -> dict:
+    options = {}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in url or url.rstrip("/").endswith(("sqlite:", "aiosqlite:")):
+            # In-memory databases live in a single connection; pool settings don't apply
+            return options
+    options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=not _is_sqlite(url),
+    )
+    return options
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+if _is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _sqlite_pragmas)
+if _is_sqlite(ASYNC_DATABASE_URL):
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 def get_db():
@@ -17,3 +86,25 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+_initialized = False
+
+async def init_db():
+    """Create missing tables, once per process."""
+    global _initialized
+    if _initialized:
+        return
+    from . import models  # noqa: F401  (registers the tables on Base)
+    from .transcripts import backfill_sessions
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await backfill_sessions(conn)
+    _initialized = True
+
+async def close_db():
+    await async_engine.dispose()
+    engine.dispose()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, ForeignKey, Index, Integer, PrimaryKeyConstraint, String, Text, DateTime
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -9,3 +9,34 @@ class User(Base):
     password_hash = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class ChatMessage(Base):
+    """One transcript line. `id` grows with write order and is the pagination cursor."""
+    __tablename__ = "chat_messages"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    session_id = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # Serves the per-session message pages
+        Index("ix_chat_messages_user_session_id", "user_id", "session_id", "id"),
+    )
+
+class ChatSession(Base):
+    """Per-session summary, updated with every transcript batch; the session list reads only this."""
+    __tablename__ = "chat_sessions"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    session_id = Column(String, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "session_id"),
+        # Keyset pagination of the session list, most recently active first
+        Index("ix_chat_sessions_user_last_message", "user_id", "last_message_id"),
+    )
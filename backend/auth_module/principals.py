@@ -0,0 +1,107 @@
+"""
+Cache of authenticated principals, so requests with a known bearer token
+skip both the JWT verification and the users-table lookup.
+
+Two namespaces share one bounded cache (core.cache via make_cache, so a
+shared STATE_BACKEND_URL also shares invalidations between workers):
+
+    token  sha256(token) -> user id, once the signature and expiry checked out
+    user   user id       -> {"id", "email", "created_at"} snapshot
+
+Entries never outlive the token's own `exp`, and are capped at
+AUTH_CACHE_TTL. Call invalidate_user() whenever a user row changes or is
+deleted; its tokens then fall through to the database again on next use.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime
+
+from backend.core.state import make_cache
+from .models import User
+from .security import decode_access_token
+
+AUTH_CACHE_ENABLED = os.getenv("AUTH_CACHE_ENABLED", "1") == "1"
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+
+_cache = make_cache(
+    "auth",
+    ttls={"token": AUTH_CACHE_TTL, "user": AUTH_CACHE_TTL},
+    max_entries=int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("AUTH_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+) if AUTH_CACHE_ENABLED else None
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _ttl(expires_at: float | None) -> float | None:
+    """Seconds an entry may live: up to AUTH_CACHE_TTL, never past the token's expiry."""
+    if expires_at is None:
+        return AUTH_CACHE_TTL
+    remaining = expires_at - time.time()
+    return min(AUTH_CACHE_TTL, remaining) if remaining > 0 else None
+
+
+async def verify_token(token: str) -> tuple[int, float | None] | None:
+    """(user id, token expiry as a unix time) for a valid token, else None."""
+    key = _token_key(token)
+    if _cache is not None:
+        cached = await _cache.get("token", key)
+        if cached is not None and (cached["exp"] is None or cached["exp"] > time.time()):
+            return cached["sub"], cached["exp"]
+    payload = decode_access_token(token)
+    if not payload or payload.get("sub") is None:
+        return None
+    try:
+        user_id = int(payload["sub"])
+    except (TypeError, ValueError):
+        return None
+    expires_at = float(payload["exp"]) if payload.get("exp") is not None else None
+    ttl = _ttl(expires_at)
+    if _cache is not None and ttl is not None:
+        await _cache.set("token", key, {"sub": user_id, "exp": expires_at}, ttl=ttl)
+    return user_id, expires_at
+
+
+async def cached_user(user_id: int) -> User | None:
+    """A detached User built from the cached snapshot, or None on a miss."""
+    if _cache is None:
+        return None
+    snapshot = await _cache.get("user", str(user_id))
+    if snapshot is None:
+        return None
+    created_at = snapshot["created_at"]
+    return User(
+        id=snapshot["id"],
+        email=snapshot["email"],
+        created_at=datetime.fromisoformat(created_at) if created_at else None,
+    )
+
+
+async def remember_user(user: User, expires_at: float | None = None):
+    """Cache `user` until the token that looked it up expires (or AUTH_CACHE_TTL)."""
+    ttl = _ttl(expires_at)
+    if _cache is None or ttl is None:
+        return
+    await _cache.set("user", str(user.id), {
+        "id": user.id,
+        "email": user.email,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+    }, ttl=ttl)
+
+
+async def invalidate_user(user_id: int):
+    """Forget a user's snapshot, e.g. after it was updated or deleted."""
+    if _cache is not None:
+        await _cache.delete("user", str(user_id))
+
+
+async def clear():
+    if _cache is not None:
+        await _cache.clear()
+
+
+def stats() -> dict | None:
+    return _cache.stats() if _cache is not None else None
@@ -1,50 +1,121 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Header
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .database import get_db, Base, engine
+from .database import get_db, get_async_db, AsyncSessionLocal
 from .models import User
 from .schemas import UserCreate, UserOut, Token
-from .security import hash_password, verify_password, create_access_token, decode_access_token
-
-# Ensure tables exist
-Base.metadata.create_all(bind=engine)
+from .security import hash_password_async, verify_and_update_async, create_access_token, decode_access_token
+from . import principals
+from backend.core import tracing
 
 router = APIRouter()
 
+async def _find_user(db: AsyncSession, email: str) -> User | None:
+    user = (await db.execute(select(User).where(User.email == email))).scalar_one_or_none()
+    if user is not None:
+        db.expunge(user)
+    # End the transaction so no pooled connection is held while the password is hashed
+    await db.rollback()
+    return user
+
+async def _save(db: AsyncSession, user: User) -> User:
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+# bcrypt runs in the hashing process pool (see security.py) and the DB calls
+# on the async engine, so a queued login holds no thread and no connection.
 @router.post("/register", response_model=UserOut)
-def register(user_in: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.email == user_in.email).first()
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    with tracing.span("auth.db"):
+        existing = await _find_user(db, user_in.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = User(email=user_in.email, password_hash=hash_password(user_in.password))
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    return user
+    with tracing.span("auth.hash"):
+        password_hash = await hash_password_async(user_in.password)
+    user = User(email=user_in.email, password_hash=password_hash)
+    try:
+        with tracing.span("auth.db"):
+            return await _save(db, user)
+    except IntegrityError:
+        # Registered concurrently while we were hashing
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    with tracing.span("auth.db"):
+        user = await _find_user(db, form_data.username)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    with tracing.span("auth.verify"):
+        valid, new_hash = await verify_and_update_async(form_data.password, user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made: store it at the new cost
+        user.password_hash = new_hash
+        with tracing.span("auth.db"):
+            await _save(db, user)
+        await principals.invalidate_user(user.id)
     token = create_access_token(subject=str(user.id))
     return Token(access_token=token)
 
-def get_current_user(authorization: str | None = Header(None), db: Session = Depends(get_db)) -> User:
+def _bearer_token(authorization: str | None) -> str:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
-    token = authorization.split(" ", 1)[1]
-    payload = decode_access_token(token)
-    if not payload:
+    return authorization.split(" ", 1)[1]
+
+async def _bearer_principal(authorization: str | None) -> tuple[int, float | None]:
+    """(user id, token expiry) from an Authorization header; 401 when missing or invalid."""
+    token = _bearer_token(authorization)
+    with tracing.span("auth.decode"):
+        principal = await principals.verify_token(token)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return principal
+
+def get_current_user(authorization: str | None = Header(None), db: Session = Depends(get_db)) -> User:
+    """
+    For sync routes (run in the threadpool). The principal cache is async,
+    so this path always checks the token and reads the user row.
+    """
+    payload = decode_access_token(_bearer_token(authorization))
+    try:
+        user_id = int(payload["sub"]) if payload else None
+    except (TypeError, ValueError):
+        user_id = None
+    if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user_id = int(payload.get("sub"))
-    user = db.query(User).filter(User.id == user_id).first()
+    with tracing.span("auth.db"):
+        user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_current_user_async(authorization: str | None = Header(None)) -> User:
+    """
+    Same as get_current_user, for async routes: no threadpool slot is used,
+    and only a cache miss opens an (async) session.
+    """
+    user_id, expires_at = await _bearer_principal(authorization)
+    user = await principals.cached_user(user_id)
+    if user is not None:
+        return user
+    async with AsyncSessionLocal() as db:
+        with tracing.span("auth.db"):
+            user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    await principals.remember_user(user, expires_at)
     return user
 
 @router.get("/me", response_model=UserOut)
-def read_me(current_user: User = Depends(get_current_user)):
+async def read_me(current_user: User = Depends(get_current_user_async)):
     return current_user
 
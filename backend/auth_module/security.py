@@ -1,11 +1,21 @@
+import asyncio
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 import jwt
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor (log2 rounds). Hashes made with another cost are
+# upgraded on the next successful login, see verify_and_update().
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes used for hashing. Defaults to one per core, minus one left for
+# the event loop so login storms cannot take every core; 0 hashes in threads.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) - 1))))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "change-me")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
@@ -17,6 +27,45 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, password_hash: str) -> bool:
     return pwd_context.verify(plain_password, password_hash)
 
+def verify_and_update(plain_password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    """(valid, new hash); the new hash is set when the stored one uses an outdated cost."""
+    return pwd_context.verify_and_update(plain_password, password_hash)
+
+# --- Process pool: bcrypt is pure CPU, so it runs outside the server process ---
+_hash_pool: Optional[ProcessPoolExecutor] = None
+
+def _noop():
+    return None
+
+def _get_hash_pool() -> Optional[ProcessPoolExecutor]:
+    global _hash_pool
+    if _hash_pool is None and PASSWORD_HASH_WORKERS > 0:
+        # spawn, not fork: the server process has an event loop and threads running
+        _hash_pool = ProcessPoolExecutor(PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _hash_pool
+
+async def _run_hashing(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), fn, *args)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(hash_password, password)
+
+async def verify_and_update_async(plain_password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    return await _run_hashing(verify_and_update, plain_password, password_hash)
+
+async def start_hash_pool():
+    """Start every worker now, so the first logins after a deploy don't pay for process start-up."""
+    pool = _get_hash_pool()
+    if pool is not None:
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(PASSWORD_HASH_WORKERS)))
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
     if expires_delta is None:
         expires_delta = timedelta(minutes=JWT_EXPIRE_MINUTES)
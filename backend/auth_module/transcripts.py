@@ -0,0 +1,311 @@
+"""
+Persistent chat transcripts for signed-in users.
+
+Chat handlers call `writer.record(...)`, which only appends to an in-memory
+queue, so persistence costs the hot path nothing measurable. A background
+task writes the queue to the chat_messages table in batches: as soon as
+TRANSCRIPT_BATCH_SIZE messages are waiting, otherwise every
+TRANSCRIPT_FLUSH_INTERVAL seconds, and once more at shutdown. If the
+database is unavailable, messages stay queued and are retried, up to
+TRANSCRIPT_MAX_QUEUE; beyond that the oldest are dropped (and counted). A
+batch the database refuses (e.g. a foreign key or integrity error) is
+retried one message at a time, and messages refused on their own are
+logged and dropped, so one bad row cannot hold up the rest.
+
+Each batch also updates a chat_sessions summary row per session (message
+count, last message id, first and last message time). Reads are
+keyset-paginated on message ids, indexed as (user_id, session_id, id) for
+messages and (user_id, last_message_id) for sessions, so a page costs the
+same at any depth:
+
+    GET /transcripts/sessions?limit=20&cursor=...
+    GET /transcripts/sessions/{session_id}/messages?limit=50&cursor=...&order=asc
+"""
+import asyncio
+import os
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import exc, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from .database import AsyncSessionLocal, get_async_db
+from .models import ChatMessage, ChatSession, User
+from .router import get_current_user_async
+
+TRANSCRIPTS_ENABLED = os.getenv("TRANSCRIPTS_ENABLED", "1") == "1"
+
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _unreachable(e: Exception) -> bool:
+    """Whether a write failed because of the database (down, locked) rather than the data."""
+    if isinstance(e, exc.DBAPIError):
+        return e.connection_invalidated or isinstance(e, (exc.OperationalError, exc.InterfaceError))
+    return isinstance(e, (OSError, asyncio.TimeoutError))
+
+
+async def update_sessions(db: AsyncSession, batch: list):
+    """Fold a just-inserted batch of messages into the chat_sessions summaries."""
+    groups = {}  # {(user_id, session_id): [messages, first created_at, last created_at]}
+    for m in batch:
+        group = groups.get((m["user_id"], m["session_id"]))
+        if group is None:
+            groups[(m["user_id"], m["session_id"])] = [1, m["created_at"], m["created_at"]]
+        else:
+            group[0] += 1
+            group[1] = min(group[1], m["created_at"])
+            group[2] = max(group[2], m["created_at"])
+    upsert = _UPSERTS.get(db.bind.dialect.name)
+    for (user_id, session_id), (count, first, last) in groups.items():
+        # One index probe on (user_id, session_id, id); includes every earlier message
+        last_id = (await db.execute(
+            select(func.max(ChatMessage.id))
+            .where(ChatMessage.user_id == user_id, ChatMessage.session_id == session_id)
+        )).scalar_one()
+        changes = {
+            "message_count": ChatSession.message_count + count,
+            "last_message_id": last_id,
+            "updated_at": last,
+        }
+        row = dict(user_id=user_id, session_id=session_id, message_count=count,
+                   last_message_id=last_id, started_at=first, updated_at=last)
+        if upsert is not None:
+            await db.execute(
+                upsert(ChatSession).values(**row)
+                .on_conflict_do_update(index_elements=["user_id", "session_id"], set_=changes)
+            )
+            continue
+        result = await db.execute(
+            update(ChatSession)
+            .where(ChatSession.user_id == user_id, ChatSession.session_id == session_id)
+            .values(**changes)
+        )
+        if result.rowcount == 0:
+            await db.execute(insert(ChatSession).values(**row))
+
+
+async def backfill_sessions(conn: AsyncConnection):
+    """Build the chat_sessions summaries from existing messages, if there are none yet."""
+    if (await conn.execute(select(ChatSession.user_id).limit(1))).first() is not None:
+        return
+    await conn.execute(
+        insert(ChatSession).from_select(
+            ["user_id", "session_id", "message_count", "last_message_id", "started_at", "updated_at"],
+            select(
+                ChatMessage.user_id,
+                ChatMessage.session_id,
+                func.count(ChatMessage.id),
+                func.max(ChatMessage.id),
+                func.min(ChatMessage.created_at),
+                func.max(ChatMessage.created_at),
+            ).group_by(ChatMessage.user_id, ChatMessage.session_id),
+        )
+    )
+
+
+class TranscriptWriter:
+    def __init__(self, batch_size: int = 200, interval: float = 1.0, max_queue: int = 10000):
+        """
+        :param batch_size: messages per INSERT, and the queue length that triggers an early flush
+        :param interval: longest a message waits in the queue, in seconds
+        :param max_queue: messages kept while the database is unreachable
+        """
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.max_queue = max(self.batch_size, max_queue)
+        self._queue = deque()
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.errors = 0
+        self.last_flush_ms = None
+
+    def record(self, user_id: int, session_id: str, provider: str, role: str, content: str):
+        """Queue one message for writing. Never blocks and never raises."""
+        if len(self._queue) >= self.max_queue:
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append({
+            "user_id": user_id,
+            "session_id": session_id,
+            "provider": provider,
+            "role": role,
+            "content": content,
+            "created_at": datetime.now(timezone.utc),
+        })
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def record_exchange(self, user_id: int | None, session_id: str, provider: str, message: str, reply: str):
+        """Queue a user message and the reply to it; anonymous callers are not recorded."""
+        if user_id is None:
+            return
+        self.record(user_id, session_id, provider, "user", message)
+        self.record(user_id, session_id, provider, "assistant", reply)
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                if not await self.flush():
+                    break  # Keep the rest queued and retry on the next tick
+
+    async def _write(self, rows: list):
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(ChatMessage), rows)
+            await update_sessions(db, rows)
+            await db.commit()
+
+    def _requeue(self, rows: list):
+        self._queue.extendleft(reversed(rows))
+        while len(self._queue) > self.max_queue:
+            self._queue.popleft()
+            self.dropped += 1
+
+    async def flush(self) -> bool:
+        """
+        Write one batch; False if the database could not be reached (the batch
+        is put back). A refused batch is written one message at a time instead.
+        """
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if not batch:
+            return True
+        started = time.perf_counter()
+        try:
+            await self._write(batch)
+            self.written += len(batch)
+        except Exception as e:
+            traceback.print_exc()
+            self.errors += 1
+            if _unreachable(e):
+                self._requeue(batch)
+                return False
+            for index, row in enumerate(batch):
+                try:
+                    await self._write([row])
+                    self.written += 1
+                except Exception as e:
+                    if _unreachable(e):
+                        self._requeue(batch[index:])
+                        return False
+                    print(f"Dropping transcript message for user {row['user_id']}, "
+                          f"session {row['session_id']!r}: {e}")
+                    self.rejected += 1
+        self.batches += 1
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        return True
+
+    async def close(self):
+        """Stop the background task and write whatever is still queued."""
+        if self._task is not None:
+            # Let a flush in progress finish rather than cancelling it mid-write
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._queue:
+            if not await self.flush():
+                break
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+            "batch_size": self.batch_size,
+            "interval_s": self.interval,
+        }
+
+
+writer = TranscriptWriter(
+    batch_size=int(os.getenv("TRANSCRIPT_BATCH_SIZE", "200")),
+    interval=float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", "1.0")),
+    max_queue=int(os.getenv("TRANSCRIPT_MAX_QUEUE", "10000")),
+) if TRANSCRIPTS_ENABLED else None
+
+
+router = APIRouter(prefix="/transcripts")
+
+@router.get("/sessions")
+async def list_sessions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: int | None = Query(None, description="next_cursor from the previous page"),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """The caller's chat sessions, most recently active first."""
+    query = (
+        select(ChatSession)
+        .where(ChatSession.user_id == current_user.id)
+        .order_by(ChatSession.last_message_id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        query = query.where(ChatSession.last_message_id < cursor)
+    rows = (await db.execute(query)).scalars().all()
+    return {
+        "sessions": [
+            {
+                "session_id": r.session_id,
+                "messages": r.message_count,
+                "started_at": r.started_at,
+                "updated_at": r.updated_at,
+                "last_message_id": r.last_message_id,
+            }
+            for r in rows
+        ],
+        "next_cursor": rows[-1].last_message_id if len(rows) == limit else None,
+    }
+
+@router.get("/sessions/{session_id}/messages")
+async def list_messages(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: int | None = Query(None, description="next_cursor from the previous page"),
+    order: str = Query("asc", pattern="^(asc|desc)$", description="asc: oldest first, desc: newest first"),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Messages of one session. Recent messages may take up to TRANSCRIPT_FLUSH_INTERVAL to appear."""
+    query = select(ChatMessage).where(ChatMessage.user_id == current_user.id, ChatMessage.session_id == session_id)
+    if order == "asc":
+        query = query.order_by(ChatMessage.id.asc())
+        if cursor is not None:
+            query = query.where(ChatMessage.id > cursor)
+    else:
+        query = query.order_by(ChatMessage.id.desc())
+        if cursor is not None:
+            query = query.where(ChatMessage.id < cursor)
+    messages = (await db.execute(query.limit(limit))).scalars().all()
+    if not messages and cursor is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "session_id": session_id,
+        "messages": [
+            {"id": m.id, "role": m.role, "content": m.content, "provider": m.provider, "created_at": m.created_at}
+            for m in messages
+        ],
+        "next_cursor": messages[-1].id if len(messages) == limit else None,
+    }
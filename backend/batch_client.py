@@ -0,0 +1,124 @@
+"""
+Command-line and Python client for /chat/batch.
+
+Sends a JSONL file of {"id", "provider", "message", "images"} items and
+appends each NDJSON result line to an output file as it arrives. If the
+stream is cut short (deadline, restart, network), it resubmits the items
+that have no successful result yet, under the same batch id, until all are
+done or a round makes no progress. Re-running the command later picks up
+from the output file, so an interrupted nightly job simply continues.
+
+    python -m backend.batch_client prompts.jsonl --out results.ndjson \\
+        --target http://127.0.0.1:8000 --token "$CHATBOT_TOKEN"
+
+From Python:
+
+    async for result in stream_batch("http://127.0.0.1:8000", token, items):
+        ...
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+
+import httpx
+
+
+def load_items(path: str) -> list:
+    """Items from a JSONL file; items without an id are numbered by line."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if line.strip():
+                item = json.loads(line)
+                item.setdefault("id", str(number))
+                items.append(item)
+    return items
+
+
+def completed_ids(path: str) -> set:
+    """Ids with an "ok" result in an existing output file."""
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # A line cut off by an interrupted run
+                if result.get("type") == "result" and result.get("status") == "ok":
+                    done.add(str(result["id"]))
+    return done
+
+
+async def stream_batch(target: str, token: str, items: list, batch_id: str | None = None, timeout: float = 600.0):
+    """Submit one batch and yield its NDJSON lines (results, then a summary) as dicts."""
+    body = "".join(json.dumps(item) + "\n" for item in items)
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/x-ndjson",
+        "X-Request-Timeout": str(timeout),
+    }
+    params = {"batch_id": batch_id} if batch_id else {}
+    async with httpx.AsyncClient(base_url=target.rstrip("/"), timeout=httpx.Timeout(timeout + 30)) as client:
+        async with client.stream("POST", "/chat/batch", content=body, headers=headers, params=params) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise RuntimeError(f"/chat/batch returned {response.status_code}: {response.text}")
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+async def run(args) -> int:
+    items = load_items(args.input)
+    with open(args.input, "rb") as f:
+        batch_id = args.batch_id or hashlib.sha256(f.read()).hexdigest()[:16]
+    done = completed_ids(args.out)
+
+    for round_number in range(1, args.max_rounds + 1):
+        pending = [item for item in items if str(item["id"]) not in done]
+        if not pending:
+            break
+        print(f"round {round_number}: {len(pending)} of {len(items)} items pending (batch {batch_id})", file=sys.stderr)
+        progress = 0
+        try:
+            with open(args.out, "a", encoding="utf-8") as out:
+                async for line in stream_batch(args.target, args.token, pending, batch_id, args.timeout):
+                    if line.get("type") == "summary":
+                        print(json.dumps(line), file=sys.stderr)
+                        continue
+                    out.write(json.dumps(line) + "\n")
+                    out.flush()
+                    if line.get("status") == "ok":
+                        done.add(str(line["id"]))
+                        progress += 1
+        except (httpx.HTTPError, RuntimeError) as e:
+            print(f"round {round_number} interrupted: {e}", file=sys.stderr)
+        if not progress:
+            break  # Only failing items left; don't spin on them
+
+    missing = len([item for item in items if str(item["id"]) not in done])
+    print(f"{len(items) - missing} of {len(items)} items done", file=sys.stderr)
+    return 1 if missing else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through /chat/batch, resumably.")
+    parser.add_argument("input", help="JSONL file, one {id, provider, message, images} object per line")
+    parser.add_argument("--out", required=True, help="NDJSON results file; appended to, and read to resume")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default=os.getenv("CHATBOT_TOKEN"), help="bearer token (default: $CHATBOT_TOKEN)")
+    parser.add_argument("--batch-id", help="defaults to a hash of the input file")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds per submission")
+    parser.add_argument("--max-rounds", type=int, default=10, help="resubmissions of unfinished items")
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("--token or CHATBOT_TOKEN is required")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
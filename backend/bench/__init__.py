@@ -0,0 +1 @@
+# Benchmark harness: stub upstreams (stubs), load generator (loadgen) and a runner (run)
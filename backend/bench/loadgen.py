@@ -0,0 +1,243 @@
+"""
+Load generator for the chatbot API.
+
+Sends a weighted mix of /chat, /chat/stream, /news/*, /weather/*, /login and
+/register requests, either closed-loop (a fixed number of concurrent
+workers) or open-loop (Poisson arrivals at --rate requests/second). It then
+prints a JSON report with throughput, p50/p95/p99 latency and the error rate,
+overall and per scenario. Commit the reports and diff them to catch
+regressions.
+
+Chat requests are spread over --users registered accounts (bearer tokens),
+so the per-user rate limit sees many users rather than one noisy client.
+
+Run: python -m backend.bench.loadgen --target http://127.0.0.1:8000 --duration 30
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import time
+import uuid
+
+import httpx
+
+from ..llm_providers import is_error_reply
+
+CITIES = ["Delhi,IN", "London,GB", "New York,US", "Tokyo,JP", "Sydney,AU", "Berlin,DE"]
+PROMPTS = [
+    "Explain HTTP keep-alive in one paragraph.",
+    "Write a haiku about latency.",
+    "What is a circuit breaker?",
+    "Summarise the plot of Hamlet.",
+]
+
+# scenario: (weight, method, path); path may be a callable for varied parameters
+SCENARIOS = {
+    "chat": (20, "POST", "/chat"),
+    "chat_stream": (5, "POST", "/chat/stream"),
+    "news_global": (5, "GET", "/news/global"),
+    "news_in": (5, "GET", "/news/in"),
+    "news_sources": (3, "GET", "/news/sources"),
+    "news_combined": (3, "GET", "/news/combined"),
+    "news_stocks": (4, "GET", "/news/stocks"),
+    "weather_current": (15, "GET", lambda: f"/weather/current?city={random.choice(CITIES)}"),
+    "weather_forecast": (8, "GET", lambda: f"/weather/forecast?city={random.choice(CITIES)}"),
+    "weather_combined": (5, "GET", lambda: f"/weather/combined?city={random.choice(CITIES)}"),
+    "login": (3, "POST", "/login"),
+    "register": (1, "POST", "/register"),
+}
+
+
+def percentile(sorted_values: list, p: float) -> float | None:
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """samples: [(latency_seconds, ok)]"""
+    latencies = sorted(lat for lat, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+class LoadGenerator:
+    def __init__(self, target: str, scenarios: dict, users: int = 20, provider: str = "openai", password: str = "bench-password"):
+        self.target = target.rstrip("/")
+        self.scenarios = scenarios
+        self.users = max(1, users)
+        self.provider = provider
+        self.password = password
+        self.accounts = []  # [(email, token)]
+        self._account = None
+        self.samples = {name: [] for name in scenarios}
+        self.status_codes = {}
+
+    async def setup(self, client: httpx.AsyncClient):
+        """Register and log in the accounts used for chat and login traffic."""
+        run = uuid.uuid4().hex[:8]
+        for i in range(self.users):
+            email = f"bench-{run}-{i}@example.com"
+            r = await client.post("/register", json={"email": email, "password": self.password})
+            r.raise_for_status()
+            r = await client.post("/login", data={"username": email, "password": self.password})
+            r.raise_for_status()
+            self.accounts.append((email, r.json()["access_token"]))
+        self._account = itertools.cycle(self.accounts)
+
+    def pick(self) -> str:
+        names = list(self.scenarios)
+        return random.choices(names, weights=[self.scenarios[n][0] for n in names])[0]
+
+    async def run_one(self, client: httpx.AsyncClient, name: str):
+        _, method, path = self.scenarios[name]
+        if callable(path):
+            path = path()
+        email, token = next(self._account)
+        kwargs = {}
+        if name in ("chat", "chat_stream"):
+            kwargs = {
+                "json": {"provider": self.provider, "message": random.choice(PROMPTS), "no_cache": True},
+                "headers": {"Authorization": f"Bearer {token}"},
+                "params": {"session_id": uuid.uuid4().hex},
+            }
+        elif name == "login":
+            kwargs = {"data": {"username": email, "password": self.password}}
+        elif name == "register":
+            kwargs = {"json": {"email": f"bench-{uuid.uuid4().hex}@example.com", "password": self.password}}
+
+        started = time.perf_counter()
+        ok = False
+        status = "exception"
+        try:
+            async with client.stream(method, path, **kwargs) as response:
+                body = await response.aread()
+            status = response.status_code
+            ok = response.status_code < 400
+            if ok and name == "chat":
+                ok = not is_error_reply(json.loads(body).get("response", ""))
+            elif ok and name == "chat_stream":
+                ok = b"event: done" in body
+        except (httpx.HTTPError, ValueError):
+            pass
+        self.samples[name].append((time.perf_counter() - started, ok))
+        key = f"{name}:{status}"
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+
+    async def closed_loop(self, client: httpx.AsyncClient, concurrency: int, duration: float):
+        stop = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < stop:
+                await self.run_one(client, self.pick())
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    async def open_loop(self, client: httpx.AsyncClient, rate: float, duration: float):
+        stop = time.perf_counter() + duration
+        tasks = set()
+        while time.perf_counter() < stop:
+            task = asyncio.create_task(self.run_one(client, self.pick()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(random.expovariate(rate))
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def run(self, concurrency: int, duration: float, rate: float | None = None, warmup: float = 0.0) -> dict:
+        limits = httpx.Limits(max_connections=max(concurrency, 100), max_keepalive_connections=max(concurrency, 100))
+        async with httpx.AsyncClient(base_url=self.target, limits=limits, timeout=httpx.Timeout(300.0)) as client:
+            await self.setup(client)
+            if warmup > 0:
+                await self.closed_loop(client, concurrency, warmup)
+                self.samples = {name: [] for name in self.scenarios}
+                self.status_codes = {}
+            started = time.perf_counter()
+            if rate:
+                await self.open_loop(client, rate, duration)
+            else:
+                await self.closed_loop(client, concurrency, duration)
+            elapsed = time.perf_counter() - started
+
+        everything = [s for samples in self.samples.values() for s in samples]
+        return {
+            "target": self.target,
+            "mode": "open" if rate else "closed",
+            "concurrency": None if rate else concurrency,
+            "rate_rps": rate,
+            "duration_s": round(elapsed, 2),
+            "python": platform.python_version(),
+            "overall": summarize(everything, elapsed),
+            "scenarios": {name: summarize(s, elapsed) for name, s in self.samples.items() if s},
+            "status_codes": dict(sorted(self.status_codes.items())),
+        }
+
+
+def parse_mix(spec: str | None) -> dict:
+    """'chat=10,weather_current=5' -> SCENARIOS subset with those weights."""
+    if not spec:
+        return dict(SCENARIOS)
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'. Known: {', '.join(SCENARIOS)}")
+        _, method, path = SCENARIOS[name]
+        mix[name] = (float(weight or 1), method, path)
+    return mix
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=20, help="closed-loop workers")
+    parser.add_argument("--rate", type=float, help="open-loop arrivals per second (overrides --concurrency)")
+    parser.add_argument("--users", type=int, default=20, help="accounts to spread chat traffic over")
+    parser.add_argument("--provider", default="openai", help="provider for chat scenarios")
+    parser.add_argument("--mix", help="scenario weights, e.g. 'chat=10,weather_current=5' (default: all)")
+    parser.add_argument("--seed", type=int, help="random seed for a repeatable request mix")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+
+
+def run_load(target: str, args) -> dict:
+    if args.seed is not None:
+        random.seed(args.seed)
+    generator = LoadGenerator(target, parse_mix(args.mix), users=args.users, provider=args.provider)
+    report = asyncio.run(generator.run(args.concurrency, args.duration, rate=args.rate, warmup=args.warmup))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against the chatbot API and report latency percentiles.")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    add_arguments(parser)
+    args = parser.parse_args()
+    run_load(args.target, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Login storm benchmark.
+
+Measures chat latency on its own, then again while a burst of /login
+requests runs alongside it (as after a deploy, when every client logs in at
+once). The report has both chat summaries and the login throughput, so the
+effect of password hashing on the rest of the API shows up as a p95 delta.
+
+Run against a running API:
+
+    python -m backend.bench.login --target http://127.0.0.1:8000 --duration 20 --login-concurrency 64
+
+or through the one-shot runner with `python -m backend.bench.run --suite login`.
+Compare BCRYPT_ROUNDS / PASSWORD_HASH_WORKERS settings run by run.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import time
+
+import httpx
+
+from .loadgen import SCENARIOS, LoadGenerator, add_arguments as add_load_arguments, summarize
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--login-concurrency", type=int, default=32, help="concurrent login workers during the storm")
+
+
+async def _closed_loop(generator: LoadGenerator, client: httpx.AsyncClient, name: str, concurrency: int, duration: float):
+    stop = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < stop:
+            await generator.run_one(client, name)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+
+async def login_storm(target: str, concurrency: int, login_concurrency: int, duration: float,
+                      users: int = 20, provider: str = "openai", warmup: float = 0.0) -> dict:
+    generator = LoadGenerator(target, {"chat": SCENARIOS["chat"], "login": SCENARIOS["login"]}, users=users, provider=provider)
+    limits = httpx.Limits(max_connections=concurrency + login_concurrency + 10)
+    async with httpx.AsyncClient(base_url=generator.target, limits=limits, timeout=httpx.Timeout(300.0)) as client:
+        await generator.setup(client)
+        if warmup > 0:
+            await _closed_loop(generator, client, "chat", concurrency, warmup)
+
+        generator.samples = {"chat": [], "login": []}
+        started = time.perf_counter()
+        await _closed_loop(generator, client, "chat", concurrency, duration)
+        baseline = summarize(generator.samples["chat"], time.perf_counter() - started)
+
+        generator.samples = {"chat": [], "login": []}
+        started = time.perf_counter()
+        await asyncio.gather(
+            _closed_loop(generator, client, "chat", concurrency, duration),
+            _closed_loop(generator, client, "login", login_concurrency, duration),
+        )
+        elapsed = time.perf_counter() - started
+
+    storm_chat = summarize(generator.samples["chat"], elapsed)
+    return {
+        "target": generator.target,
+        "concurrency": concurrency,
+        "login_concurrency": login_concurrency,
+        "duration_s": duration,
+        "python": platform.python_version(),
+        "baseline": {"chat": baseline},
+        "storm": {"chat": storm_chat, "login": summarize(generator.samples["login"], elapsed)},
+        "chat_p95_delta_ms": round(storm_chat["p95_ms"] - baseline["p95_ms"], 2)
+        if storm_chat["p95_ms"] is not None and baseline["p95_ms"] is not None else None,
+        "status_codes": dict(sorted(generator.status_codes.items())),
+    }
+
+
+def run_login_storm(target: str, args) -> dict:
+    if args.seed is not None:
+        random.seed(args.seed)
+    report = asyncio.run(login_storm(
+        target, args.concurrency, args.login_concurrency, args.duration,
+        users=args.users, provider=args.provider, warmup=args.warmup,
+    ))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chat latency with and without a concurrent login storm.")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    add_load_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    run_login_storm(args.target, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+One-shot benchmark: start the upstream stubs and the API as subprocesses,
+wired together through the *_BASE_URL overrides, run the load generator
+against them and print its JSON report.
+
+Run from the repository root:
+
+    python -m backend.bench.run --duration 30 --concurrency 50 --out bench.json
+
+`--suite login` runs the login storm benchmark (see bench/login.py) instead
+of the request mix.
+
+Extra environment variables (cache, rate limit, admission settings...) are
+passed through to the API process, so configurations can be compared run by
+run. Auth data goes to a throwaway SQLite file unless DATABASE_URL is set.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from . import login
+from .loadgen import add_arguments, run_load
+from .stubs import base_urls
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Process serving {url} exited with code {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against local upstream stubs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="API port")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--profile", help="JSON file with stub latency/error overrides")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API")
+    parser.add_argument("--suite", choices=("mix", "login"), default="mix", help="request mix or login storm")
+    add_arguments(parser)
+    login.add_arguments(parser)
+    args = parser.parse_args()
+
+    stub_origin = f"http://{args.host}:{args.stub_port}"
+    target = f"http://{args.host}:{args.port}"
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+
+    env = dict(os.environ)
+    env.update(base_urls(stub_origin))
+    for key in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "GEMINI_API_KEY", "DEEPSEEK_API_KEY", "NEWS_API_KEY", "OPENWEATHER_KEY"):
+        env.setdefault(key, "bench")
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'auth.db')}")
+
+    stub_cmd = [sys.executable, "-m", "backend.bench.stubs", "--host", args.host, "--port", str(args.stub_port)]
+    if args.profile:
+        stub_cmd += ["--profile", args.profile]
+    api_cmd = [
+        sys.executable, "-m", "uvicorn", "backend.app:app",
+        "--host", args.host, "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ]
+
+    procs = []
+    try:
+        procs.append(subprocess.Popen(stub_cmd, env=env))
+        wait_ready(f"{stub_origin}/stats", procs[-1])
+        procs.append(subprocess.Popen(api_cmd, env=env))
+        wait_ready(f"{target}/", procs[-1])
+
+        report = login.run_login_storm(target, args) if args.suite == "login" else run_load(target, args)
+        print(json.dumps({"upstream_stubs": httpx.get(f"{stub_origin}/stats").json()["stats"]}), file=sys.stderr)
+        return report
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Local stand-ins for the upstream APIs, so the service can be load tested
+without spending real quota.
+
+One FastAPI app serves all of them, each under its own prefix, which is
+what the *_BASE_URL overrides in llm_providers expect:
+
+    OPENROUTER_BASE_URL  = http://127.0.0.1:9100/openrouter/api/v1
+    NEWSAPI_BASE_URL     = http://127.0.0.1:9100/newsapi/v2
+    OPENWEATHER_BASE_URL = http://127.0.0.1:9100/openweather
+    NEWS_STOCK_RSS       = http://127.0.0.1:9100/rss/latestnews.xml
+
+Each upstream has a profile with a latency distribution and an error rate.
+The defaults are in DEFAULT_PROFILES; a JSON file passed with --profile is
+merged over them, e.g.
+
+    {"openrouter": {"latency": {"dist": "lognormal", "median_ms": 1500, "sigma": 0.6},
+                    "error_rate": 0.05, "error_status": 429}}
+
+Run: python -m backend.bench.stubs --port 9100 [--profile profile.json]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import math
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# latency: dist is "fixed" (ms), "uniform" (low_ms..high_ms), "normal"
+# (mean_ms, stddev_ms) or "lognormal" (median_ms, sigma)
+DEFAULT_PROFILES = {
+    "openrouter": {
+        "latency": {"dist": "lognormal", "median_ms": 800, "sigma": 0.5},
+        "error_rate": 0.0,
+        "error_status": 500,
+        # Streaming: first token after the latency above, then one chunk per interval
+        "stream_chunks": 20,
+        "chunk_interval_ms": 25,
+    },
+    "newsapi": {"latency": {"dist": "lognormal", "median_ms": 120, "sigma": 0.4}, "error_rate": 0.0, "error_status": 500},
+    "openweather": {"latency": {"dist": "lognormal", "median_ms": 80, "sigma": 0.4}, "error_rate": 0.0, "error_status": 500},
+    "rss": {"latency": {"dist": "lognormal", "median_ms": 150, "sigma": 0.4}, "error_rate": 0.0, "error_status": 500},
+}
+
+
+def merge_profiles(overrides: dict | None) -> dict:
+    profiles = copy.deepcopy(DEFAULT_PROFILES)
+    for name, override in (overrides or {}).items():
+        profiles.setdefault(name, {}).update(override)
+    return profiles
+
+
+def sample_latency(spec: dict, rng: random.Random = random) -> float:
+    """Draw one latency in seconds from a profile's latency spec."""
+    dist = spec.get("dist", "fixed")
+    if dist == "uniform":
+        ms = rng.uniform(spec.get("low_ms", 0), spec.get("high_ms", 0))
+    elif dist == "normal":
+        ms = rng.gauss(spec.get("mean_ms", 0), spec.get("stddev_ms", 0))
+    elif dist == "lognormal":
+        ms = rng.lognormvariate(math.log(max(spec.get("median_ms", 1), 1e-3)), spec.get("sigma", 0.5))
+    else:
+        ms = spec.get("ms", 0)
+    return max(0.0, ms) / 1000
+
+
+def create_app(profiles: dict | None = None) -> FastAPI:
+    profiles = merge_profiles(profiles)
+    stats = {name: {"requests": 0, "errors": 0} for name in profiles}
+    app = FastAPI(title="Upstream stubs")
+
+    async def simulate(name: str):
+        """Sleep like the upstream would; returns an error response to send instead, if any."""
+        profile = profiles[name]
+        stats[name]["requests"] += 1
+        await asyncio.sleep(sample_latency(profile.get("latency", {})))
+        if random.random() < profile.get("error_rate", 0.0):
+            stats[name]["errors"] += 1
+            status = profile.get("error_status", 500)
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            return JSONResponse({"error": {"message": f"stub {name} error", "code": status}}, status_code=status, headers=headers)
+        return None
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"profiles": profiles, "stats": stats}
+
+    @app.post("/openrouter/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = await simulate("openrouter")
+        if error is not None:
+            return error
+        model = body.get("model", "stub")
+        prompt = (body.get("messages") or [{}])[-1].get("content")
+        if isinstance(prompt, list):
+            prompt = " ".join(p.get("text", "") for p in prompt if isinstance(p, dict))
+        words = f"Stub reply from {model} to: {str(prompt)[:200]}".split()
+
+        if not body.get("stream"):
+            return {
+                "id": "stub",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            }
+
+        profile = profiles["openrouter"]
+        chunks = max(1, profile.get("stream_chunks", 20))
+        interval = profile.get("chunk_interval_ms", 25) / 1000
+
+        async def events():
+            yield ": OPENROUTER PROCESSING\n\n"
+            for i in range(chunks):
+                text = " ".join(words[i::chunks])
+                if text:
+                    chunk = {"id": "stub", "model": model, "choices": [{"index": 0, "delta": {"content": text + " "}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(interval)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/newsapi/v2/top-headlines")
+    async def top_headlines(country: str | None = None, category: str | None = None, pageSize: int = 20):
+        error = await simulate("newsapi")
+        if error is not None:
+            return error
+        label = " ".join(p for p in [country, category] if p) or "world"
+        articles = [
+            {
+                "source": {"id": None, "name": f"Stub Source {i % 5}"},
+                "title": f"Stub headline {i} ({label})",
+                "description": "Lorem ipsum dolor sit amet.",
+                "url": f"https://example.com/{i}",
+                "publishedAt": "2024-01-01T00:00:00Z",
+            }
+            for i in range(max(1, min(100, pageSize)))
+        ]
+        return {"status": "ok", "totalResults": len(articles), "articles": articles}
+
+    @app.get("/newsapi/v2/top-headlines/sources")
+    async def sources():
+        error = await simulate("newsapi")
+        if error is not None:
+            return error
+        return {"status": "ok", "sources": [{"id": f"stub-{i}", "name": f"Stub Source {i}", "language": "en"} for i in range(20)]}
+
+    @app.get("/openweather/geo/1.0/direct")
+    async def geocode(q: str, limit: int = 5):
+        error = await simulate("openweather")
+        if error is not None:
+            return error
+        name, _, country = q.partition(",")
+        # Stable coordinates per name so the weather cache behaves like the real thing
+        seed = sum(map(ord, name.lower()))
+        return [{"name": name.strip().title(), "country": country.strip().upper() or "XX",
+                 "lat": round(seed % 180 - 90 + 0.5, 4), "lon": round(seed * 7 % 360 - 180 + 0.5, 4)}]
+
+    def conditions(lat: float, lon: float) -> dict:
+        return {
+            "coord": {"lat": lat, "lon": lon},
+            "weather": [{"id": 800, "main": "Clear", "description": "clear sky"}],
+            "main": {"temp": 21.5, "feels_like": 21.0, "humidity": 40, "pressure": 1012},
+            "wind": {"speed": 3.2},
+        }
+
+    @app.get("/openweather/data/2.5/weather")
+    async def current(lat: float, lon: float):
+        error = await simulate("openweather")
+        if error is not None:
+            return error
+        return dict(conditions(lat, lon), cod=200, name="Stub City")
+
+    @app.get("/openweather/data/2.5/forecast")
+    async def forecast(lat: float, lon: float):
+        error = await simulate("openweather")
+        if error is not None:
+            return error
+        return {"cod": "200", "cnt": 40, "list": [dict(conditions(lat, lon), dt=1700000000 + i * 10800) for i in range(40)]}
+
+    @app.get("/rss/latestnews.xml")
+    async def rss():
+        error = await simulate("rss")
+        if error is not None:
+            return error
+        items = "".join(
+            f"<item><title>Stub market story {i}</title><link>https://example.com/m/{i}</link>"
+            f"<pubDate>Mon, 01 Jan 2024 00:00:00 GMT</pubDate><description>Markets moved.</description></item>"
+            for i in range(30)
+        )
+        xml = f'<?xml version="1.0"?><rss version="2.0"><channel><title>Stub Markets</title>{items}</channel></rss>'
+        return Response(xml, media_type="application/rss+xml")
+
+    return app
+
+
+def base_urls(origin: str) -> dict:
+    """Environment overrides pointing the service at stubs served from `origin`."""
+    origin = origin.rstrip("/")
+    return {
+        "OPENROUTER_BASE_URL": f"{origin}/openrouter/api/v1",
+        "NEWSAPI_BASE_URL": f"{origin}/newsapi/v2",
+        "OPENWEATHER_BASE_URL": f"{origin}/openweather",
+        "NEWS_STOCK_RSS": f"{origin}/rss/latestnews.xml",
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve stub upstream APIs for benchmarking.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--profile", help="JSON file with per-upstream overrides of DEFAULT_PROFILES")
+    args = parser.parse_args()
+
+    overrides = None
+    if args.profile:
+        with open(args.profile) as f:
+            overrides = json.load(f)
+    uvicorn.run(create_app(overrides), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
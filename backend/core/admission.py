@@ -0,0 +1,193 @@
+"""
+Global admission control: bounded in-flight work per route class.
+
+Every HTTP request is mapped to a route class (chat, news, weather, auth,
+...). Each class caps its own in-flight requests and all classes share a
+global cap. Requests over a cap wait in a queue, and free slots go to the
+highest-priority class first, so cheap endpoints keep answering while
+expensive LLM calls queue up behind each other.
+
+Waiting is bounded. A request whose estimated queue wait already exceeds its
+class's `max_wait` is shed immediately; the estimate uses the queue length
+and a moving average of the class's service time. A request still waiting
+at its deadline is shed too. In both cases the client gets a 503 with
+Retry-After instead of a slow timeout.
+"""
+import asyncio
+import itertools
+import math
+import time
+
+from starlette.responses import JSONResponse
+
+from . import tracing
+
+
+class Overloaded(Exception):
+    def __init__(self, route_class: str, retry_after: float):
+        super().__init__(f"{route_class} is overloaded")
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+
+class RouteClass:
+    def __init__(self, name: str, limit: int, max_wait: float, priority: int):
+        """
+        :param limit: requests of this class allowed in flight at once
+        :param max_wait: longest a request may queue before it is shed
+        :param priority: lower is served first when slots free up
+        """
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_wait = max_wait
+        self.priority = priority
+        self.active = 0
+        self.waiting = 0
+        self.service_time = None  # Moving average, seconds
+        self.admitted = 0
+        self.shed = 0
+
+    def observe(self, elapsed: float, alpha: float = 0.2):
+        if self.service_time is None:
+            self.service_time = elapsed
+        else:
+            self.service_time += alpha * (elapsed - self.service_time)
+
+    def estimated_wait(self) -> float:
+        """Rough time until a newly queued request would be served."""
+        if not self.service_time:
+            return 0.0
+        return (self.waiting + 1) / self.limit * self.service_time
+
+
+class AdmissionController:
+    def __init__(self, classes: list, max_in_flight: int, clock=time.monotonic):
+        self.classes = {c.name: c for c in classes}
+        self.max_in_flight = max(1, max_in_flight)
+        self._clock = clock
+        self._active = 0
+        self._waiters = []  # [(priority, seq, RouteClass, future)]
+        self._seq = itertools.count()
+
+    def _has_room(self, cls: RouteClass) -> bool:
+        return self._active < self.max_in_flight and cls.active < cls.limit
+
+    def _yields_to(self, cls: RouteClass, waiter) -> bool:
+        """
+        Whether a new request of `cls` must queue behind `waiter`: an earlier
+        request of its own class, or a higher-priority one that only the
+        global limit holds back (one stuck on its own class limit would not
+        get the slot anyway).
+        """
+        other = waiter[2]
+        return other is cls or (waiter[0] < cls.priority and other.active < other.limit)
+
+    def _take(self, cls: RouteClass):
+        self._active += 1
+        cls.active += 1
+        cls.admitted += 1
+
+    def _shed(self, cls: RouteClass, retry_after: float):
+        cls.shed += 1
+        raise Overloaded(cls.name, max(1, math.ceil(retry_after)))
+
+    async def admit(self, name: str):
+        """Take a slot for a request of class `name`; raises Overloaded when shedding."""
+        cls = self.classes[name]
+        if self._has_room(cls) and not any(self._yields_to(cls, w) for w in self._waiters):
+            self._take(cls)
+            return
+        estimate = cls.estimated_wait()
+        if estimate > cls.max_wait:
+            # Would miss the deadline anyway: fail now rather than after max_wait
+            self._shed(cls, estimate)
+        fut = asyncio.get_running_loop().create_future()
+        waiter = (cls.priority, next(self._seq), cls, fut)
+        self._waiters.append(waiter)
+        cls.waiting += 1
+        try:
+            await asyncio.wait_for(fut, cls.max_wait)
+        except asyncio.TimeoutError:
+            self._shed(cls, cls.estimated_wait() or cls.max_wait)
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as we were cancelled
+                self.release(name, 0.0)
+            raise
+        finally:
+            cls.waiting -= 1
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, name: str, elapsed: float):
+        cls = self.classes[name]
+        self._active -= 1
+        cls.active -= 1
+        if elapsed > 0:
+            cls.observe(elapsed)
+        self._dispatch()
+
+    def _dispatch(self):
+        for waiter in sorted(self._waiters):
+            if self._active >= self.max_in_flight:
+                break
+            cls, fut = waiter[2], waiter[3]
+            if cls.active < cls.limit and not fut.done():
+                self._waiters.remove(waiter)
+                self._take(cls)
+                fut.set_result(True)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._active,
+            "max_in_flight": self.max_in_flight,
+            "classes": {
+                name: {
+                    "in_flight": c.active,
+                    "limit": c.limit,
+                    "queued": c.waiting,
+                    "priority": c.priority,
+                    "service_ms": round(c.service_time * 1000, 1) if c.service_time is not None else None,
+                    "admitted": c.admitted,
+                    "shed": c.shed,
+                }
+                for name, c in self.classes.items()
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that runs each HTTP request under an admission slot. The
+    slot is held until the response, including any streamed body, is sent.
+    """
+
+    def __init__(self, app, controller: AdmissionController, classify):
+        """
+        :param classify: maps a request's (path, method) to a route class name, or None to skip
+        """
+        self.app = app
+        self.controller = controller
+        self.classify = classify
+
+    async def __call__(self, scope, receive, send):
+        name = self.classify(scope["path"], scope["method"]) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            with tracing.span("admission", route_class=name):
+                await self.controller.admit(name)
+        except Overloaded as e:
+            response = JSONResponse(
+                {"detail": f"⚠️ Server busy ({e.route_class}); please retry in {e.retry_after}s."},
+                status_code=503,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, time.perf_counter() - started)
@@ -0,0 +1,230 @@
+"""
+Bulk prompt processing for /chat/batch and the `python -m backend.batch_client` client.
+
+A batch is a list of {"id", "provider", "message", "images"} items. Items
+run with a bounded number of concurrent calls per provider. The bound is
+shared by every batch on the process, so two nightly jobs don't double the
+load on an upstream. Within it, the shared transport's adaptive limiter
+and circuit breaker pace calls to what the upstream accepts. Failed items
+are retried with exponential backoff, unless the error is permanent (bad
+request, auth, unknown model). Results are yielded in completion order.
+Every call is made on behalf of the batch owner, so the caller can charge
+it to the owner's rate limit like any other chat request.
+
+Successful results are kept for a while under (owner, batch id, item id),
+with a fingerprint of the item. Re-submitting the same batch id replays
+those results instead of calling the provider again, so a batch cut short
+by a deadline or a dropped connection resumes where it stopped.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import traceback
+from collections import deque
+
+from . import deadline, tracing
+
+# Replies that will fail the same way on every attempt
+_PERMANENT = re.compile(r"Unauthorized|\b40[0134]\b|not available|not supported")
+
+
+class InvalidItem(ValueError):
+    pass
+
+
+def assign_ids(raw: list) -> list:
+    """
+    One id per item, valid or not: its own "id", else its position, moved on
+    to the first free "<position>-<n>" when another item already uses it.
+    Raises InvalidItem if two items carry the same id.
+    """
+    given = [str(entry["id"]) for entry in raw if isinstance(entry, dict) and "id" in entry]
+    taken = set(given)
+    if len(taken) != len(given):
+        raise InvalidItem("item ids must be unique within a batch")
+    ids = []
+    for index, entry in enumerate(raw):
+        if isinstance(entry, dict) and "id" in entry:
+            ids.append(str(entry["id"]))
+            continue
+        item_id, n = str(index), 0
+        while item_id in taken:
+            n += 1
+            item_id = f"{index}-{n}"
+        taken.add(item_id)
+        ids.append(item_id)
+    return ids
+
+
+def parse_item(raw, item_id: str, providers) -> dict:
+    """Validate one batch item, filed under `item_id` (see assign_ids)."""
+    if not isinstance(raw, dict):
+        raise InvalidItem(f"item {item_id} is not an object")
+    provider = raw.get("provider")
+    message = raw.get("message")
+    images = raw.get("images") or []
+    if provider not in providers:
+        raise InvalidItem(f"item {item_id}: provider '{provider}' not supported")
+    if not isinstance(message, str) or not message.strip():
+        raise InvalidItem(f"item {item_id}: message is required")
+    if not isinstance(images, list) or not all(isinstance(i, str) for i in images):
+        raise InvalidItem(f"item {item_id}: images must be a list of URLs")
+    fingerprint = hashlib.sha256(json.dumps([provider, message, images]).encode("utf-8")).hexdigest()[:16]
+    return {"id": item_id, "provider": provider, "message": message, "images": images, "fingerprint": fingerprint}
+
+
+def parse_jsonl(text: str) -> list:
+    """One JSON item per non-empty line; malformed lines become {"_error": ...} items."""
+    items = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append({"id": f"line-{number}", "_error": f"line {number}: {e}"})
+    return items
+
+
+class BatchRunner:
+    def __init__(self, call, is_error, concurrency: int = 4, max_attempts: int = 3,
+                 item_timeout: float = 120.0, store=None, store_ttl: float = 86400.0):
+        """
+        :param call: async (provider, message, images, owner) -> (provider that answered, reply)
+        :param is_error: reply -> True if it is an error message
+        :param concurrency: calls in flight per provider, across all batches
+        :param max_attempts: tries per item before it is reported as an error
+        :param item_timeout: time budget of one attempt, in seconds
+        :param store: TTLCache-like cache for resumable results, or None
+        """
+        self.call = call
+        self.is_error = is_error
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.item_timeout = item_timeout
+        self.store = store
+        self.store_ttl = store_ttl
+        self._slots = {}  # {provider: Semaphore}
+        self._in_flight = {}
+        self.items_done = 0
+        self.items_failed = 0
+        self.items_replayed = 0
+        self.retries = 0
+
+    def _slot(self, provider: str) -> asyncio.Semaphore:
+        slot = self._slots.get(provider)
+        if slot is None:
+            slot = self._slots[provider] = asyncio.Semaphore(self.concurrency)
+        return slot
+
+    async def _attempt(self, item: dict, owner: str):
+        # Each attempt gets its own budget, within whatever is left of the request's
+        left = deadline.remaining()
+        token = deadline.set_deadline(self.item_timeout if left is None else min(self.item_timeout, left))
+        try:
+            return await self.call(item["provider"], item["message"], item["images"], owner)
+        finally:
+            deadline.reset_deadline(token)
+
+    async def run_item(self, item: dict, owner: str) -> dict:
+        started = time.perf_counter()
+        provider, reply, attempts = item["provider"], None, 0
+        while attempts < self.max_attempts:
+            attempts += 1
+            try:
+                async with self._slot(item["provider"]):
+                    self._in_flight[item["provider"]] = self._in_flight.get(item["provider"], 0) + 1
+                    try:
+                        provider, reply = await self._attempt(item, owner)
+                    finally:
+                        self._in_flight[item["provider"]] -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                reply = f"❌ Error: {str(e)}"
+            if not self.is_error(reply) or _PERMANENT.search(reply) or attempts >= self.max_attempts:
+                break
+            left = deadline.remaining()
+            if left is not None and left <= 1.0:
+                break  # The request is about to end; a resubmission will pick this item up
+            self.retries += 1
+            await asyncio.sleep(min(30.0, 2 ** (attempts - 1)) * random.uniform(0.5, 1.5))
+        failed = self.is_error(reply)
+        if failed:
+            self.items_failed += 1
+        else:
+            self.items_done += 1
+        return {
+            "type": "result",
+            "id": item["id"],
+            "status": "error" if failed else "ok",
+            "provider": provider,
+            "response": reply,
+            "attempts": attempts,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def _key(self, owner: str, batch_id: str, item: dict) -> str:
+        return f"{owner}:{batch_id}:{item['id']}"
+
+    async def replay(self, owner: str, batch_id: str, item: dict) -> dict | None:
+        if self.store is None:
+            return None
+        saved = await self.store.get("result", self._key(owner, batch_id, item))
+        if saved is None or saved.get("fingerprint") != item["fingerprint"]:
+            return None
+        self.items_replayed += 1
+        return dict(saved["result"], replayed=True)
+
+    async def run(self, items: list, owner: str, batch_id: str):
+        """Yield one result per item as it completes (replayed ones first)."""
+        queues = {}  # {provider: deque of items}, so a slow provider doesn't hold up the others
+        remaining = 0
+        for item in items:
+            result = await self.replay(owner, batch_id, item)
+            if result is not None:
+                yield result
+            else:
+                queues.setdefault(item["provider"], deque()).append(item)
+                remaining += 1
+
+        results = asyncio.Queue()
+
+        async def worker(todo: deque):
+            with tracing.suspended():  # Thousands of calls would bloat the request's trace
+                while todo:
+                    item = todo.popleft()
+                    result = await self.run_item(item, owner)
+                    if result["status"] == "ok" and self.store is not None:
+                        await self.store.set("result", self._key(owner, batch_id, item),
+                                             {"fingerprint": item["fingerprint"], "result": result}, ttl=self.store_ttl)
+                    results.put_nowait(result)
+
+        # Enough workers to keep each provider's slots busy; the shared slots do the limiting
+        workers = [
+            asyncio.create_task(worker(todo))
+            for todo in queues.values()
+            for _ in range(min(len(todo), self.concurrency))
+        ]
+        try:
+            while remaining:
+                yield await results.get()
+                remaining -= 1
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_per_provider": self.concurrency,
+            "in_flight": dict(self._in_flight),
+            "items_done": self.items_done,
+            "items_failed": self.items_failed,
+            "items_replayed": self.items_replayed,
+            "retries": self.retries,
+        }
@@ -0,0 +1,213 @@
+"""
+Bounded TTL + LRU cache shared by the provider clients.
+
+Entries live in named namespaces (e.g. "geocode", "current", "forecast"),
+each with its own time-to-live, while one LRU order and one entry/byte
+budget covers the whole cache. Values are stored JSON-encoded, so every
+`get` returns a fresh copy and callers can never mutate cached state.
+
+The data methods are coroutines so that TTLCache and SharedCache (whose
+backend may be a network hop away) are used the same way: `await
+cache.get(...)`. `stats()` only reads local counters and stays synchronous.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ("blob", "expires_at")
+
+    def __init__(self, blob: bytes, expires_at: float):
+        self.blob = blob
+        self.expires_at = expires_at
+
+
+class _Counters:
+    __slots__ = ("hits", "misses", "evictions", "expirations")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TTLCache:
+    def __init__(
+        self,
+        ttls: dict | None = None,
+        default_ttl: float = 300.0,
+        max_entries: int = 1024,
+        max_bytes: int = 8 * 1024 * 1024,
+        clock=time.monotonic,
+    ):
+        """
+        :param ttls: per-namespace time-to-live in seconds
+        :param default_ttl: TTL for namespaces missing from `ttls`
+        :param max_entries: LRU entry budget across all namespaces
+        :param max_bytes: LRU budget for the encoded size of all values
+        """
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self._clock = clock
+        self._entries = OrderedDict()  # {(namespace, key): _Entry}, oldest first
+        self._bytes = 0
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _stats_for(self, namespace: str) -> _Counters:
+        counters = self._counters.get(namespace)
+        if counters is None:
+            counters = self._counters[namespace] = _Counters()
+        return counters
+
+    def _drop(self, full_key):
+        entry = self._entries.pop(full_key)
+        self._bytes -= len(entry.blob)
+
+    async def get(self, namespace: str, key: str, default=None):
+        """Return a copy of the cached value, or `default` if missing or expired."""
+        full_key = (namespace, key)
+        with self._lock:
+            stats = self._stats_for(namespace)
+            entry = self._entries.get(full_key)
+            if entry is None:
+                stats.misses += 1
+                return default
+            if entry.expires_at <= self._clock():
+                self._drop(full_key)
+                stats.expirations += 1
+                stats.misses += 1
+                return default
+            self._entries.move_to_end(full_key)
+            stats.hits += 1
+            blob = entry.blob
+        return json.loads(blob)
+
+    async def set(self, namespace: str, key: str, value, ttl: float | None = None):
+        """Store a snapshot of `value` (must be JSON-serializable)."""
+        blob = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        if ttl is None:
+            ttl = self.ttls.get(namespace, self.default_ttl)
+        full_key = (namespace, key)
+        with self._lock:
+            if len(blob) > self.max_bytes:
+                # Would evict everything else and still not fit
+                if full_key in self._entries:
+                    self._drop(full_key)
+                return
+            if full_key in self._entries:
+                self._drop(full_key)
+            self._entries[full_key] = _Entry(blob, self._clock() + ttl)
+            self._bytes += len(blob)
+            self._evict()
+
+    async def delete(self, namespace: str, key: str):
+        with self._lock:
+            if (namespace, key) in self._entries:
+                self._drop((namespace, key))
+
+    async def clear(self, namespace: str | None = None):
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for full_key in [k for k in self._entries if k[0] == namespace]:
+                self._drop(full_key)
+
+    def _evict(self):
+        """Drop expired entries first, then least recently used ones, until within budget."""
+        if len(self._entries) <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        now = self._clock()
+        for full_key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            self._drop(full_key)
+            self._stats_for(full_key[0]).expirations += 1
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            full_key = next(iter(self._entries))
+            self._drop(full_key)
+            self._stats_for(full_key[0]).evictions += 1
+
+    def stats(self) -> dict:
+        """Counters per namespace plus the current size of the cache."""
+        with self._lock:
+            sizes = {}
+            for namespace, _ in self._entries:
+                sizes[namespace] = sizes.get(namespace, 0) + 1
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "namespaces": {
+                    ns: dict(c.as_dict(), entries=sizes.get(ns, 0), ttl=self.ttls.get(ns, self.default_ttl))
+                    for ns, c in self._counters.items()
+                },
+            }
+
+
+class SharedCache:
+    """
+    TTLCache-compatible cache stored in a shared StateBackend (see core.state),
+    so every worker process sees the same entries. Size limits and entry
+    counts are left to the backend; hit/miss counters are per process.
+    """
+
+    def __init__(self, backend, prefix: str, ttls: dict | None = None, default_ttl: float = 300.0):
+        self.backend = backend
+        self.prefix = prefix
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"cache:{self.prefix}:{namespace}:{key}"
+
+    def _count(self, namespace: str, field: str):
+        with self._lock:
+            counters = self._counters.get(namespace)
+            if counters is None:
+                counters = self._counters[namespace] = _Counters()
+            setattr(counters, field, getattr(counters, field) + 1)
+
+    async def get(self, namespace: str, key: str, default=None):
+        blob = await self.backend.get(self._key(namespace, key))
+        if blob is None:
+            self._count(namespace, "misses")
+            return default
+        self._count(namespace, "hits")
+        return json.loads(blob)
+
+    async def set(self, namespace: str, key: str, value, ttl: float | None = None):
+        if ttl is None:
+            ttl = self.ttls.get(namespace, self.default_ttl)
+        blob = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        await self.backend.set(self._key(namespace, key), blob, ttl)
+
+    async def delete(self, namespace: str, key: str):
+        await self.backend.delete(self._key(namespace, key))
+
+    async def clear(self, namespace: str | None = None):
+        if namespace is None:
+            await self.backend.delete_prefix(f"cache:{self.prefix}:")
+        else:
+            await self.backend.delete_prefix(f"cache:{self.prefix}:{namespace}:")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = {ns: c.as_dict() for ns, c in self._counters.items()}
+        return {
+            "backend": self.backend.name,
+            "namespaces": {
+                ns: dict(c, ttl=self.ttls.get(ns, self.default_ttl)) for ns, c in counters.items()
+            },
+        }
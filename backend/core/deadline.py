@@ -0,0 +1,184 @@
+"""
+Per-request deadlines and cancellation on client disconnect.
+
+DeadlineMiddleware gives every HTTP request a time budget. The budget comes
+from the `X-Request-Timeout` header or the `request_timeout` query parameter
+(seconds), capped at a server maximum, with a server default otherwise. The
+absolute deadline is kept in a context variable, so it follows the request
+into every task it spawns. The shared transport reads it to bound each
+upstream call (see llm_providers.transport).
+
+The middleware also watches the connection. If the client goes away, or the
+deadline passes with a grace period and no response yet, the handler is
+cancelled. That cancellation reaches the in-flight upstream request, which
+is dropped instead of being read to the end. Once a response has started,
+only a disconnect ends it early, so long SSE and NDJSON streams are never
+cut off mid-body; routes listed in `streaming_paths` also get no default
+budget for their upstream calls.
+"""
+import asyncio
+import contextvars
+import time
+from urllib.parse import parse_qs
+
+import httpx
+from starlette.responses import JSONResponse
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The request's time budget ran out before or during an upstream call."""
+
+
+def set_deadline(seconds: float | None):
+    """Set the budget for the current context; returns a token for reset_deadline()."""
+    return _deadline.set(time.monotonic() + seconds if seconds is not None else None)
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current request's budget, or None if it has none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def parse_timeout(scope) -> float | None:
+    for name, value in scope.get("headers") or []:
+        if name == b"x-request-timeout":
+            return _to_seconds(value.decode("latin-1"))
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if "request_timeout" in query:
+        return _to_seconds(query["request_timeout"][0])
+    return None
+
+
+def _to_seconds(value: str) -> float | None:
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+class DeadlineMiddleware:
+    def __init__(self, app, default: float = 60.0, maximum: float = 300.0, grace: float = 1.0,
+                 streaming_paths=(), max_buffered_body: int = 1024 * 1024):
+        """
+        :param default: budget when the client does not ask for one
+        :param maximum: cap on what a client may ask for
+        :param grace: time past the deadline left for the handler to answer on its own
+        :param streaming_paths: paths of long-running streamed responses; they get no
+            default budget, only one the client asks for
+        :param max_buffered_body: request body bytes read ahead; the rest is passed
+            through to the handler as it arrives
+        """
+        self.app = app
+        self.default = default
+        self.maximum = maximum
+        self.grace = grace
+        self.streaming_paths = frozenset(streaming_paths)
+        self.max_buffered_body = max_buffered_body
+
+    def budget_for(self, scope) -> float | None:
+        requested = parse_timeout(scope)
+        if requested is None and scope.get("path") in self.streaming_paths:
+            return None
+        return min(self.maximum, requested or self.default)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = self.budget_for(scope)
+        disconnected = asyncio.Event()
+
+        async def watch():
+            while True:
+                if (await receive())["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        watcher = None
+
+        def body_read():
+            # From here on nobody else calls receive(), so the connection can be watched
+            nonlocal watcher
+            watcher = asyncio.create_task(watch())
+
+        # Read a small request body up front so the connection can be watched
+        # for a disconnect while the handler runs; a larger one is handed over
+        # as it arrives and watched once the handler has read it all
+        body, size, complete = [], 0, False
+        while size <= self.max_buffered_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message)
+            size += len(message.get("body", b""))
+            if not message.get("more_body"):
+                complete = True
+                break
+
+        async def replay():
+            nonlocal complete
+            if body:
+                return body.pop(0)
+            if not complete:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    complete = True
+                    disconnected.set()
+                elif not message.get("more_body"):
+                    complete = True
+                    body_read()
+                return message
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        started = False
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = set_deadline(budget)
+        try:
+            handler = asyncio.create_task(self.app(scope, replay, tracked_send))
+        finally:
+            reset_deadline(token)
+        if complete:
+            body_read()
+        gone = asyncio.create_task(disconnected.wait())
+        try:
+            timeout = budget + self.grace if budget is not None else None
+            done, _ = await asyncio.wait({handler, gone}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done and started:
+                # The budget covers the time to the first byte; a response that
+                # is already streaming runs until it ends or the client leaves
+                done, _ = await asyncio.wait({handler, gone}, return_when=asyncio.FIRST_COMPLETED)
+            if handler in done:
+                handler.result()
+                return
+            handler.cancel()
+            await asyncio.gather(handler, return_exceptions=True)
+            if gone in done:
+                # Client is gone, nobody will read the answer: the work was stopped
+                return
+            response = JSONResponse(
+                {"detail": f"⚠️ Request timed out after {budget:g}s."},
+                status_code=504,
+            )
+            await response(scope, replay, send)
+        finally:
+            gone.cancel()
+            if watcher is not None:
+                watcher.cancel()
+            if not handler.done():
+                handler.cancel()
@@ -0,0 +1,222 @@
+"""
+Memory-bounded conversation history, keyed by session and provider.
+
+Only the trailing window of messages each provider actually sends upstream
+is retained. Sessions idle for longer than `idle_ttl` are dropped, and
+when the estimated footprint exceeds `max_bytes` the least recently used
+sessions are evicted until it fits again.
+
+Like the caches in core.cache, the data methods are coroutines so the
+in-process and the shared store are used the same way.
+"""
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-record overhead on top of the content string (object + slots)
+_RECORD_OVERHEAD = 64
+
+
+class Message:
+    """Compact message record; converted to an API dict only when needed."""
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    @property
+    def size(self) -> int:
+        return sys.getsizeof(self.content) + _RECORD_OVERHEAD
+
+    def as_dict(self) -> dict:
+        return {"role": self.role, "content": self.content}
+
+
+class _Session:
+    __slots__ = ("last_seen", "threads", "bytes")
+
+    def __init__(self, now: float):
+        self.last_seen = now
+        self.threads = {}  # {provider: tuple[Message, ...]}
+        self.bytes = 0
+
+
+class HistoryStore:
+    def __init__(
+        self,
+        windows: dict | None = None,
+        default_window: int = 0,
+        idle_ttl: float = 1800.0,
+        max_bytes: int = 32 * 1024 * 1024,
+        clock=time.monotonic,
+    ):
+        """
+        :param windows: number of trailing messages kept per provider
+        :param default_window: window for providers missing from `windows`
+        :param idle_ttl: seconds after the last access before a session is dropped
+        :param max_bytes: cap on the estimated memory held by all sessions
+        """
+        self.windows = dict(windows or {})
+        self.default_window = default_window
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._sessions = OrderedDict()  # {session_id: _Session}, least recently used first
+        self._bytes = 0
+        self._evicted = 0
+        self._lock = threading.Lock()
+
+    def window_for(self, provider: str) -> int:
+        return self.windows.get(provider, self.default_window)
+
+    async def get(self, session_id: str, provider: str) -> list:
+        """Return the retained history as a new list of {"role", "content"} dicts."""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session.last_seen = now
+            self._sessions.move_to_end(session_id)
+            return [m.as_dict() for m in session.threads.get(provider, ())]
+
+    async def save(self, session_id: str, provider: str, history: list):
+        """Replace a provider's history with the trailing window of `history`."""
+        window = self.window_for(provider)
+        kept = history[-window:] if window > 0 else []
+        records = tuple(Message(m["role"], m["content"]) for m in kept)
+        size = sum(m.size for m in records)
+
+        with self._lock:
+            now = self._clock()
+            session = self._sessions.get(session_id)
+            if session is None:
+                if not records:
+                    return
+                session = self._sessions[session_id] = _Session(now)
+            old = session.threads.pop(provider, ())
+            old_size = sum(m.size for m in old)
+            if records:
+                session.threads[provider] = records
+            session.bytes += size - old_size
+            self._bytes += size - old_size
+            session.last_seen = now
+            self._sessions.move_to_end(session_id)
+            if not session.threads:
+                self._drop(session_id)
+            self._expire(now)
+            self._enforce_cap(keep=session_id)
+
+    async def clear(self, session_id: str | None = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+                self._bytes = 0
+            elif session_id in self._sessions:
+                self._drop(session_id)
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.bytes
+
+    def _expire(self, now: float):
+        # Sessions are ordered by last access, so idle ones sit at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen < self.idle_ttl:
+                break
+            self._drop(session_id)
+            self._evicted += 1
+
+    def _enforce_cap(self, keep: str):
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self._evicted += 1
+
+    async def footprint(self) -> dict:
+        """Current size of the store."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(t) for s in self._sessions.values() for t in s.threads.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evicted_sessions": self._evicted,
+            }
+
+
+class SharedHistoryStore:
+    """
+    HistoryStore-compatible store kept in a shared StateBackend (see core.state),
+    so a session continues on whichever worker receives the next request.
+    Each (provider, session) window is one key whose TTL is the idle timeout.
+    Every `trim_every` saves, the keys beyond `max_keys` that were saved the
+    longest ago are evicted.
+    """
+
+    def __init__(self, backend, windows: dict | None = None, default_window: int = 0, idle_ttl: float = 1800.0,
+                 max_keys: int = 100_000, trim_every: int = 500):
+        """
+        :param idle_ttl: seconds after the last save before a window expires
+        :param max_keys: cap on (provider, session) windows held in the backend
+        """
+        self.backend = backend
+        self.windows = dict(windows or {})
+        self.default_window = default_window
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.trim_every = max(1, trim_every)
+        self._saves = 0
+        self._evicted = 0
+
+    def window_for(self, provider: str) -> int:
+        return self.windows.get(provider, self.default_window)
+
+    @staticmethod
+    def _key(session_id: str, provider: str) -> str:
+        return f"history:{provider}:{session_id}"
+
+    async def get(self, session_id: str, provider: str) -> list:
+        blob = await self.backend.get(self._key(session_id, provider))
+        if blob is None:
+            return []
+        # Stored as compact [role, content] pairs
+        return [{"role": role, "content": content} for role, content in json.loads(blob)]
+
+    async def save(self, session_id: str, provider: str, history: list):
+        window = self.window_for(provider)
+        kept = history[-window:] if window > 0 else []
+        key = self._key(session_id, provider)
+        if not kept:
+            await self.backend.delete(key)
+            return
+        blob = json.dumps([[m["role"], m["content"]] for m in kept], separators=(",", ":"))
+        await self.backend.set(key, blob.encode("utf-8"), self.idle_ttl)
+        self._saves += 1
+        if self._saves % self.trim_every == 0:
+            # Every window's TTL restarts on save, so the soonest to expire is the least recently used
+            self._evicted += await self.backend.trim("history:", self.max_keys)
+
+    async def clear(self, session_id: str | None = None):
+        if session_id is None:
+            await self.backend.delete_prefix("history:")
+            return
+        for provider in self.windows:
+            await self.backend.delete(self._key(session_id, provider))
+
+    async def footprint(self) -> dict:
+        # One key per (provider, session) window; counting sessions would mean reading every key
+        return {
+            "backend": self.backend.name,
+            "keys": await self.backend.count("history:"),
+            "max_keys": self.max_keys,
+            "evicted_keys": self._evicted,
+        }
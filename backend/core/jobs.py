@@ -0,0 +1,182 @@
+"""
+Asynchronous jobs for LLM calls that may outlast an HTTP connection.
+
+`POST /jobs` queues a {provider, message, images} request and answers at
+once with a job id. A fixed pool of worker tasks takes jobs off the queue
+and makes the call, each under its own time budget, so a slow Gemini image
+prompt or a large DeepSeek context no longer depends on a load balancer's
+idle timeout. `GET /jobs/{id}` returns the job's status, and its result once
+finished; with `?wait=N` it long-polls, returning as soon as the job
+finishes or after N seconds, whichever comes first.
+
+A burst of submissions waits in a bounded queue; when the queue is full,
+submissions are refused with a Retry-After estimated from the queue length
+and the average job time. Job records are kept in a TTL cache (the shared
+state backend when STATE_BACKEND_URL is set, so any worker process can
+answer a poll) and expire JOB_RESULT_TTL seconds after they were last
+updated. Jobs still queued or running at shutdown are recorded as failed.
+"""
+import asyncio
+import time
+import traceback
+import uuid
+
+from . import deadline
+
+FINISHED = ("done", "error")
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("job queue is full")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    def __init__(self, call, is_error, store, workers: int = 8, max_queue: int = 1000,
+                 timeout: float = 600.0, result_ttl: float = 3600.0, poll_interval: float = 0.5):
+        """
+        :param call: async (provider, message, images) -> (provider that answered, reply)
+        :param is_error: reply -> True if it is an error message
+        :param store: TTLCache-like cache holding the job records
+        :param workers: jobs running at once
+        :param max_queue: jobs waiting for a worker before submissions are refused
+        :param timeout: time budget of one job, in seconds
+        :param result_ttl: how long a job record is kept after its last update
+        :param poll_interval: store polling period when waiting on a job run by another process
+        """
+        self.call = call
+        self.is_error = is_error
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._queue = None
+        self._tasks = []
+        self._events = {}  # {job_id: Event set when the job finishes}, for jobs of this process
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.service_time = None  # Moving average, seconds
+
+    def start(self):
+        if not self._tasks:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def _save(self, record: dict):
+        await self.store.set("job", record["job_id"], record, ttl=self.result_ttl)
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued job would start."""
+        waiting = self._queue.qsize() if self._queue is not None else 0
+        return round(max(1.0, (waiting + 1) / self.workers * (self.service_time or 1.0)), 1)
+
+    async def submit(self, user_id: int | None, provider: str, message: str, images: list) -> dict:
+        """Queue a job and return its record; raises QueueFull when the queue is at capacity."""
+        if self._queue is None:
+            raise RuntimeError("JobQueue.start() has not been called")
+        if self._queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+        record = {
+            "job_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "status": "queued",
+            "provider": provider,
+            "response": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self._save(record)
+        self._events[record["job_id"]] = asyncio.Event()
+        self._queue.put_nowait((record, message, images))
+        self.submitted += 1
+        return record
+
+    async def get(self, job_id: str) -> dict | None:
+        return await self.store.get("job", job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        """The job's record once it has finished, or as it stands after `timeout` seconds."""
+        record = await self.get(job_id)
+        if record is None or record["status"] in FINISHED or timeout <= 0:
+            return record
+        event = self._events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return await self.get(job_id)
+        # Queued on another worker process: all we can see is the shared store
+        until = time.monotonic() + timeout
+        while time.monotonic() < until:
+            await asyncio.sleep(min(self.poll_interval, until - time.monotonic()))
+            record = await self.get(job_id)
+            if record is None or record["status"] in FINISHED:
+                break
+        return record
+
+    async def _finish(self, record: dict, status: str, reply: str):
+        record.update(status=status, response=reply, finished_at=time.time())
+        await self._save(record)
+        if status == "done":
+            self.completed += 1
+        else:
+            self.failed += 1
+        event = self._events.pop(record["job_id"], None)
+        if event is not None:
+            event.set()
+
+    async def _work(self):
+        while True:
+            record, message, images = await self._queue.get()
+            record.update(status="running", started_at=time.time())
+            await self._save(record)
+            self.running += 1
+            started = time.perf_counter()
+            token = deadline.set_deadline(self.timeout)
+            try:
+                provider, reply = await self.call(record["provider"], message, images)
+                record["provider"] = provider
+            except asyncio.CancelledError:
+                await self._finish(record, "error", "❌ Server restarted while the job was running; please resubmit.")
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                reply = f"❌ Error: {str(e)}"
+            finally:
+                deadline.reset_deadline(token)
+                self.running -= 1
+            elapsed = time.perf_counter() - started
+            self.service_time = elapsed if self.service_time is None else self.service_time + 0.2 * (elapsed - self.service_time)
+            await self._finish(record, "error" if self.is_error(reply) else "done", reply)
+
+    async def close(self):
+        """Stop the workers; jobs still queued or running are recorded as failed."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue is not None and not self._queue.empty():
+            record, _, _ = self._queue.get_nowait()
+            await self._finish(record, "error", "❌ Server restarted before the job ran; please resubmit.")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_job_ms": round(self.service_time * 1000, 1) if self.service_time is not None else None,
+        }
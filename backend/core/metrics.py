@@ -0,0 +1,282 @@
+"""
+Minimal Prometheus-style instrumentation.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format (version 0.0.4) by `registry.render()`. Recording is a dict
+lookup and a few additions, cheap enough to leave on in production. Values
+are updated from the event loop only, so no locking is done.
+
+Values that already live elsewhere (cache counters, for instance) are
+exported through collectors. A collector is a callable run at scrape time
+that returns extra samples, so nothing has to be counted twice.
+"""
+import bisect
+import math
+import time
+
+# Seconds; covers cached lookups (ms) up to slow LLM completions (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yield (suffix, label string, value) for every child."""
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield "_total", _format_labels(self.labelnames, values), child.value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield "", _format_labels(self.labelnames, values), child.value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"'), cumulative
+            labels = _format_labels(self.labelnames, values)
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collect):
+        """
+        `collect()` returns [(name, type, help, [(labels dict, value), ...]), ...],
+        evaluated on every scrape.
+        """
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        for collect in self._collectors:
+            for name, type_, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type_}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    label_str = _format_labels(labels.keys(), labels.values())
+                    lines.append(f"{name}{label_str} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP server side, recorded by MetricsMiddleware ---
+http_requests = registry.counter(
+    "chatbot_http_requests", "HTTP requests served, by route and status.", ("route", "method", "status"))
+http_duration = registry.histogram(
+    "chatbot_http_request_duration_seconds", "Time to serve an HTTP request, including streamed bodies.", ("route", "method"))
+http_in_flight = registry.gauge(
+    "chatbot_http_requests_in_flight", "HTTP requests currently being served.", ("route",))
+http_bytes_in = registry.counter(
+    "chatbot_http_request_bytes", "Request body bytes received.", ("route",))
+http_bytes_out = registry.counter(
+    "chatbot_http_response_bytes", "Response body bytes sent.", ("route",))
+
+# --- Upstream (client) side, recorded by the shared transport ---
+upstream_requests = registry.counter(
+    "chatbot_upstream_requests", "Requests to upstream APIs, by upstream and status (or error kind).", ("upstream", "status"))
+upstream_duration = registry.histogram(
+    "chatbot_upstream_request_duration_seconds", "Time until an upstream returned response headers.", ("upstream",))
+upstream_in_flight = registry.gauge(
+    "chatbot_upstream_requests_in_flight", "Upstream requests currently open, including unread bodies.", ("upstream",))
+upstream_bytes_out = registry.counter(
+    "chatbot_upstream_request_bytes", "Request body bytes sent upstream.", ("upstream",))
+upstream_bytes_in = registry.counter(
+    "chatbot_upstream_response_bytes", "Response body bytes received from upstreams.", ("upstream",))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording count, status, latency, in-flight requests and
+    body bytes per route. Routes are labelled by their path template (e.g.
+    /weather/current), never the raw path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, routes, skip=("/metrics",)):
+        """
+        :param routes: the application's routes (app.routes), used to find the template
+        :param skip: paths not to record, such as the scrape endpoint itself
+        """
+        self.app = app
+        self.routes = routes
+        self.skip = set(skip)
+
+    def route_for(self, scope, routes=None, prefix: str = "") -> str:
+        from starlette.routing import Match
+
+        for route in self.routes if routes is None else routes:
+            match, _ = route.matches(scope)
+            if match != Match.FULL:
+                continue
+            included = getattr(route, "original_router", None)
+            if included is not None:
+                # FastAPI keeps include_router() routes behind one entry; look inside it
+                sub_prefix = route.include_context.prefix
+                label = self.route_for(
+                    dict(scope, path=scope["path"][len(sub_prefix):]), included.routes, prefix + sub_prefix,
+                )
+                if label != "unmatched":
+                    return label
+                continue
+            path = getattr(route, "path", None)
+            return prefix + path if path is not None else "other"
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            await self.app(scope, receive, send)
+            return
+
+        route = self.route_for(scope)
+        method = scope["method"]
+        status = "500"
+        bytes_in = bytes_out = 0
+
+        async def counting_receive():
+            nonlocal bytes_in
+            message = await receive()
+            if message["type"] == "http.request":
+                bytes_in += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, bytes_out
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = http_in_flight.labels(route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            in_flight.dec()
+            http_duration.labels(route, method).observe(time.perf_counter() - started)
+            http_requests.labels(route, method, status).inc()
+            http_bytes_in.labels(route).inc(bytes_in)
+            http_bytes_out.labels(route).inc(bytes_out)
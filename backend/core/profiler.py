@@ -0,0 +1,155 @@
+"""
+Runtime profiling: a sampling profiler and a log of the slowest requests.
+
+SamplingProfiler runs a background thread that snapshots every thread's
+Python stack (sys._current_frames) at a fixed interval, for a bounded time
+window. Stacks are counted in the "collapsed" format understood by
+flamegraph.pl, speedscope and similar tools. Cost is one stack walk per
+thread per sample; nothing runs while the profiler is stopped. On the event
+loop thread, the leaf frames show which coroutine was running, and
+samples sitting in the selector show time spent waiting on I/O.
+
+SlowRequestLog keeps the N slowest traced requests (see core.tracing) with
+their span breakdown and the request shape annotated by the handler.
+"""
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    MAX_DURATION = 600.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = {}
+        self.samples = 0
+        self.interval = None
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = 30.0, interval: float = 0.01, thread_id: int | None = None) -> bool:
+        """
+        Start a new profile (discarding the last one); False if one is already running.
+        With `thread_id`, only that thread is sampled (e.g. the event loop's).
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = {}
+            self.samples = 0
+            self.interval = max(0.001, interval)
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(min(duration, self.MAX_DURATION), thread_id), name="sampling-profiler", daemon=True,
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def _run(self, duration: float, thread_id: int | None):
+        me = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + duration
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == me or (thread_id is not None and ident != thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                key = ";".join(reversed(stack))
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.stopped_at = time.time()
+
+    def collapsed(self) -> str:
+        """One 'frame;frame;frame count' line per distinct stack, busiest first."""
+        stacks = sorted(dict(self._stacks).items(), key=lambda item: -item[1])
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000 if self.interval else None,
+            "distinct_stacks": len(self._stacks),
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+        }
+
+
+class SlowRequestLog:
+    def __init__(self, capacity: int = 50):
+        self.capacity = max(1, capacity)
+        self._heap = []  # Min-heap of (duration, seq, entry): the fastest kept request is evicted first
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def observe(self, trace):
+        """Keep `trace` (a finished core.tracing.Trace) if it is among the slowest seen."""
+        root = trace.root
+        if root is None or root.end is None:
+            return
+        duration = root.duration
+        if len(self._heap) >= self.capacity and duration <= self._heap[0][0]:
+            return
+        entry = {
+            "trace_id": trace.trace_id,
+            "request": root.name,
+            "status": root.attributes.get("http.status_code"),
+            "duration_ms": round(duration * 1000, 1),
+            "at": round(trace.unix_nanos(root.start) / 1e9, 3),
+            "shape": dict(trace.attributes),
+            "spans": [
+                {
+                    "name": s.name,
+                    "offset_ms": round((s.start - root.start) * 1000, 1),
+                    "duration_ms": round(s.duration * 1000, 1),
+                    **({"error": s.error} if s.error else {}),
+                }
+                for s in sorted(trace.spans, key=lambda s: s.start)
+                if s is not root and s.end is not None
+            ],
+        }
+        with self._lock:
+            item = (duration, next(self._seq), entry)
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, item)
+            else:
+                heapq.heappushpop(self._heap, item)
+
+    def entries(self, limit: int | None = None) -> list:
+        with self._lock:
+            slowest = sorted(self._heap, key=lambda item: -item[0])
+        return [entry for _, _, entry in slowest[:limit]]
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
@@ -0,0 +1,176 @@
+"""
+Latency-aware routing across LLM providers for `provider="auto"`.
+
+Every LLM call feeds a rolling window of (latency, success) samples per
+provider/model. Routing prefers healthy providers with the lowest median
+latency. If the chosen provider has not answered by the time its own tail
+latency (p95 by default) has passed, a hedged duplicate is sent to the next
+best provider and whichever answers first wins; the other is cancelled.
+Error replies fail over to the next candidate.
+"""
+import asyncio
+import threading
+from collections import deque
+
+from ..llm_providers import is_error_reply
+
+
+class LatencyTracker:
+    """Rolling window of recent call outcomes for one provider/model."""
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)  # (latency_seconds, ok)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float, successes_only: bool = True) -> float | None:
+        with self._lock:
+            values = sorted(lat for lat, ok in self._samples if ok or not successes_only)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(0.50), self.percentile(0.95)
+        return {
+            "samples": len(self),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+
+class ProviderRouter:
+    def __init__(
+        self,
+        models: dict,
+        window: int = 100,
+        min_samples: int = 5,
+        max_error_rate: float = 0.5,
+        hedge: bool = True,
+        hedge_percentile: float = 0.95,
+        default_hedge_delay: float = 5.0,
+    ):
+        """
+        :param models: {provider: model id} for the candidates
+        :param min_samples: samples needed before a provider's stats are trusted
+        :param max_error_rate: providers above this rate are only used as a last resort
+        :param hedge_percentile: latency percentile after which a hedged request is sent
+        :param default_hedge_delay: hedge delay (seconds) while stats are not trusted yet
+        """
+        self.models = dict(models)
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.hedges = 0
+        self.failovers = 0
+
+    def _tracker(self, provider: str, model: str) -> LatencyTracker:
+        key = f"{provider}:{model}"
+        with self._lock:
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = LatencyTracker(self.window)
+            return tracker
+
+    def tracker_for(self, provider: str) -> LatencyTracker:
+        return self._tracker(provider, self.models.get(provider, ""))
+
+    def observe(self, provider: str, model: str, latency: float, ok: bool):
+        self._tracker(provider, model).observe(latency, ok)
+
+    def rank(self) -> list:
+        """Candidates best first: healthy before unhealthy, then by median latency."""
+        def score(provider):
+            tracker = self.tracker_for(provider)
+            if len(tracker) < self.min_samples:
+                # Not enough data yet: try it early so it gets measured
+                return (0, 0.0)
+            unhealthy = tracker.error_rate() > self.max_error_rate
+            p50 = tracker.percentile(0.50)
+            return (1 if unhealthy else 0, p50 if p50 is not None else float("inf"))
+
+        return sorted(self.models, key=score)
+
+    def hedge_delay(self, provider: str) -> float:
+        tracker = self.tracker_for(provider)
+        if len(tracker) < self.min_samples:
+            return self.default_hedge_delay
+        delay = tracker.percentile(self.hedge_percentile)
+        return delay if delay is not None else self.default_hedge_delay
+
+    async def route(self, call):
+        """
+        Run `await call(provider)` (returning a reply string) on the best
+        provider, hedging and failing over as needed. Returns (provider, reply);
+        if every candidate fails, the last error reply is returned.
+        """
+        queue = self.rank()
+        running = {}  # {task: provider}
+        last = (queue[0], "❌ No provider available.") if queue else (None, "❌ No provider available.")
+        self.routed += 1
+
+        def launch():
+            provider = queue.pop(0)
+            running[asyncio.create_task(call(provider))] = provider
+
+        if queue:
+            launch()
+        try:
+            while running:
+                timeout = None
+                if self.hedge and queue and len(running) == 1:
+                    timeout = self.hedge_delay(next(iter(running.values())))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than this provider usually is: race a second one
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        reply = task.result()
+                    except Exception as e:
+                        reply = f"❌ Unexpected error: {str(e)}"
+                    if not is_error_reply(reply):
+                        return provider, reply
+                    last = (provider, reply)
+                if not running and queue:
+                    self.failovers += 1
+                    launch()
+            return last
+        finally:
+            for task in running:
+                task.cancel()
+
+    def snapshot(self) -> dict:
+        return {
+            "ranking": self.rank(),
+            "routed": self.routed,
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "providers": {
+                provider: dict(self.tracker_for(provider).snapshot(), model=model,
+                               hedge_delay_ms=round(self.hedge_delay(provider) * 1000, 1))
+                for provider, model in self.models.items()
+            },
+        }
@@ -0,0 +1,292 @@
+"""
+Per-user rate limiting and fair queuing for the chat endpoints.
+
+Each (user, provider) pair has a token bucket. A request that finds its bucket
+empty is not rejected straight away: it reserves the next token and waits for
+it, as long as that wait stays under `max_wait`; only then is it refused
+with a Retry-After. Admitted requests then share `concurrency` upstream slots
+through a fair queue that hands out free slots round-robin across users, so a
+user with a deep backlog cannot starve everyone else.
+
+A request that fans out to several providers takes a token from each of their
+buckets and one slot per upstream call. A request whose provider is only
+chosen later (provider="auto") takes its slot up front and is charged with
+charge() as each call is made, so the bucket of the provider that serves it
+pays.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+
+class RateLimited(Exception):
+    """Request refused; carries the HTTP status and headers to answer with."""
+
+    def __init__(self, message: str, status_code: int, retry_after: float, headers: dict):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        """
+        :param rate: tokens added per second
+        :param burst: bucket size, i.e. requests allowed back to back
+        """
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._tokens
+
+    def reserve(self, max_wait: float) -> float | None:
+        """
+        Take a token, possibly one that has not been added yet. Returns how long
+        to wait before using it, or None (nothing taken) if that exceeds max_wait.
+        """
+        tokens = self._refill()
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+        if wait > max_wait:
+            return None
+        self._tokens -= 1
+        return wait
+
+    def refund(self):
+        self._tokens = min(self.burst, self._tokens + 1)
+
+    def remaining(self) -> int:
+        return max(0, int(self._refill()))
+
+    def reset_in(self) -> float:
+        """Seconds until the bucket is full again."""
+        return max(0.0, (self.burst - self._refill()) / self.rate)
+
+    def retry_in(self) -> float:
+        """Seconds until a token is available without queueing."""
+        return max(0.0, (1 - self._refill()) / self.rate)
+
+    def is_full(self) -> bool:
+        return self._refill() >= self.burst
+
+
+class FairQueue:
+    """
+    Concurrency limit whose waiters are served round-robin per key.
+
+    A waiter asking for several slots gets all of them at once or none, so
+    waiters never hold part of what they need while blocking each other. The
+    waiter whose turn it is keeps it until enough slots are free.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        self._active = 0
+        self._queues = OrderedDict()  # {key: deque of (future, slots)}, in service order
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def acquire(self, key, timeout: float | None = None, n: int = 1) -> bool:
+        """Take `n` slots, waiting up to `timeout` seconds. Returns False on timeout."""
+        if n > self.concurrency:
+            raise ValueError(f"cannot take {n} slots from a queue of {self.concurrency}")
+        if self._active + n <= self.concurrency and not self._queues:
+            self._active += n
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        entry = (fut, n)
+        self._queues.setdefault(key, deque()).append(entry)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                # Slots were handed over just as we were cancelled
+                self.release(n)
+            raise
+        finally:
+            queue = self._queues.get(key)
+            if queue is not None and entry in queue:
+                queue.remove(entry)
+                if not queue:
+                    del self._queues[key]
+                # We may have been the waiter holding everyone else up
+                self._wake()
+
+    def release(self, n: int = 1):
+        self._active -= n
+        self._wake()
+
+    def _wake(self):
+        while self._queues:
+            # Serve the key at the front, then move it to the back of the line
+            key, queue = next(iter(self._queues.items()))
+            fut, n = queue[0]
+            if not fut.done() and self._active + n > self.concurrency:
+                break
+            self._queues.popitem(last=False)
+            queue.popleft()
+            if queue:
+                self._queues[key] = queue
+            if not fut.done():
+                self._active += n
+                fut.set_result(True)
+
+
+class Permit:
+    """An admitted request. Call release() once its upstream work is done."""
+
+    def __init__(self, queue: FairQueue | None, headers: dict, slots: int = 1):
+        self._queue = queue
+        self.headers = headers
+        self.slots = slots
+
+    def release(self):
+        if self._queue is not None:
+            self._queue.release(self.slots)
+            self._queue = None
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_wait: float = 10.0,
+        concurrency: int = 32,
+        queue_timeout: float = 30.0,
+        clock=time.monotonic,
+    ):
+        """
+        :param rate: sustained requests per second per user and provider
+        :param burst: requests a user may send back to back per provider
+        :param max_wait: longest a request may wait for its user's next token
+        :param concurrency: chat requests allowed upstream at once, across all users
+        :param queue_timeout: longest a request may wait for one of those slots
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        self._buckets = {}  # {(user, provider): TokenBucket}
+        self._queue = FairQueue(concurrency)
+        self._last_sweep = clock()
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+
+    def _bucket(self, user: str, provider: str) -> TokenBucket:
+        now = self._clock()
+        if now - self._last_sweep > 60:
+            # A full bucket is the same as a fresh one, so idle users can be dropped
+            self._last_sweep = now
+            self._buckets = {k: b for k, b in self._buckets.items() if not b.is_full()}
+        bucket = self._buckets.get((user, provider))
+        if bucket is None:
+            bucket = self._buckets[(user, provider)] = TokenBucket(self.rate, self.burst, self._clock)
+        return bucket
+
+    def _headers(self, bucket: TokenBucket) -> dict:
+        # IETF draft "RateLimit header fields for HTTP"
+        return {
+            "RateLimit-Limit": str(int(bucket.burst)),
+            "RateLimit-Remaining": str(bucket.remaining()),
+            "RateLimit-Reset": str(math.ceil(bucket.reset_in())),
+            "RateLimit-Policy": f"{int(bucket.burst)};w={math.ceil(bucket.burst / bucket.rate)}",
+        }
+
+    def _reserve(self, user: str, providers, max_wait: float) -> tuple[list, float]:
+        """Take a token from each provider's bucket, or none at all; returns (buckets, wait)."""
+        buckets, wait = [], 0.0
+        for provider in providers:
+            bucket = self._bucket(user, provider)
+            waited = bucket.reserve(max_wait)
+            if waited is None:
+                for taken in buckets:
+                    taken.refund()
+                self.rejected += 1
+                retry_after = math.ceil(bucket.retry_in())
+                raise RateLimited(
+                    f"⚠️ Too many requests for '{provider}'; retry in {retry_after}s.",
+                    429, retry_after, dict(self._headers(bucket), **{"Retry-After": str(retry_after)}),
+                )
+            buckets.append(bucket)
+            wait = max(wait, waited)
+        return buckets, wait
+
+    async def acquire(self, user: str, provider: str) -> Permit:
+        """Wait for the user's turn; raises RateLimited if that would take too long."""
+        return await self.acquire_many(user, [provider])
+
+    async def acquire_many(self, user: str, providers, slots: int | None = None) -> Permit:
+        """
+        Like acquire(), charging every provider in `providers` and taking
+        `slots` upstream slots (one per provider by default, at least one).
+        """
+        slots = max(1, len(providers) if slots is None else slots)
+        if slots > self._queue.concurrency:
+            # Could never be admitted, however long it waited
+            self.rejected += 1
+            raise RateLimited(
+                f"⚠️ This request needs {slots} upstream calls at once; "
+                f"at most {self._queue.concurrency} are allowed.",
+                400, 0, {},
+            )
+        buckets, wait = self._reserve(user, providers, self.max_wait)
+        try:
+            if wait > 0:
+                self.delayed += 1
+                await asyncio.sleep(wait)
+            admitted = await self._queue.acquire(user, self.queue_timeout, slots)
+        except BaseException:
+            for bucket in buckets:
+                bucket.refund()
+            raise
+        if not admitted:
+            for bucket in buckets:
+                bucket.refund()
+            self.rejected += 1
+            retry_after = math.ceil(self.max_wait)
+            raise RateLimited(
+                "⚠️ The chat service is busy; please retry shortly.",
+                503, retry_after, {"Retry-After": str(retry_after)},
+            )
+        self.admitted += 1
+        # Report the bucket closest to running out
+        headers = self._headers(min(buckets, key=TokenBucket.remaining)) if buckets else {}
+        return Permit(self._queue, headers, slots)
+
+    def charge(self, user: str, provider: str):
+        """
+        Take a token from the user's bucket for `provider` without waiting,
+        for a call made under a permit that did not know its provider yet.
+        Raises RateLimited (429) when the bucket is empty.
+        """
+        self._reserve(user, [provider], 0.0)
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "in_flight": self._queue.active,
+            "queued": self._queue.waiting,
+            "tracked_buckets": len(self._buckets),
+        }
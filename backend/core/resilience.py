@@ -0,0 +1,257 @@
+"""
+Per-upstream circuit breaker and adaptive (AIMD) concurrency limiter.
+
+The breaker fails fast while an upstream is unhealthy: after
+`failure_threshold` consecutive failures (transport errors or 5xx) it
+opens for `reset_timeout` seconds, then lets a few probe requests through
+(half-open) and closes again on success.
+
+The limiter caps concurrent requests to an upstream and may be shared by
+several breakers, e.g. every model behind one gateway host. The cap grows
+additively with every success and is halved on 429/503/timeouts (at most once
+per `decrease_cooldown`), so throughput settles just below what the upstream
+accepts. A 429 with Retry-After blocks the limiter for that long instead of
+feeding a rate limiter that already said no.
+"""
+import asyncio
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+
+class UpstreamUnavailable(httpx.TransportError):
+    """Raised without contacting the upstream: circuit open, backing off, or no free slot."""
+
+
+def parse_retry_after(value: str | None, max_delay: float = 300.0) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(max_delay, delay))
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max: int = 1, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max = max(1, half_open_max)
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until requests will be let through again (0 if they are now)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes < self.half_open_max:
+            self._probes += 1
+            return True
+        return False
+
+    def abandon(self):
+        """A request let through by allow() ended without a verdict (e.g. cancelled)."""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_success(self):
+        self._failures = 0
+        if self._state != self.CLOSED:
+            self._state = self.CLOSED
+            self._probes = 0
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.opened += 1
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+            self._probes = 0
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial: float = 10,
+        min_limit: float = 1,
+        max_limit: float = 50,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        decrease_cooldown: float = 1.0,
+        clock=time.monotonic,
+    ):
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.increase = increase
+        self.decrease = decrease
+        self.decrease_cooldown = decrease_cooldown
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._blocked_until = 0.0
+        self._inflight = 0
+        self._waiters = deque()
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def backing_off(self) -> bool:
+        return self._blocked_until > self._clock()
+
+    def retry_in(self) -> float:
+        """Seconds until a Retry-After block ends (0 if there is none)."""
+        return max(0.0, self._blocked_until - self._clock())
+
+    def block_for(self, seconds: float):
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    async def acquire(self, timeout: float | None = None) -> bool:
+        """Take a slot, waiting up to `timeout` seconds. Returns False on timeout."""
+        if self._inflight < int(self.limit) and not self._waiters:
+            self._inflight += 1
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as we were cancelled
+                self.release()
+            raise
+        finally:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+
+    def release(self):
+        self._inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self._inflight += 1
+                fut.set_result(True)
+
+    def on_success(self):
+        # Additive increase: roughly +increase per `limit` successful requests
+        self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        self._wake()
+
+    def on_overload(self):
+        now = self._clock()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+
+
+class UpstreamGuard:
+    """
+    Breaker + limiter for one upstream, driven by the HTTP transport. The
+    limiter may be shared with other guards for the same host.
+    """
+
+    # Statuses meaning "too much load", which shrink the concurrency limit
+    OVERLOAD_STATUSES = {429, 503}
+
+    def __init__(self, name: str, breaker: CircuitBreaker, limiter: AdaptiveLimiter, acquire_timeout: float = 10.0):
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+        self.acquire_timeout = acquire_timeout
+        self.rejected = 0
+
+    async def enter(self, request: httpx.Request):
+        if self.limiter.backing_off:
+            self.rejected += 1
+            raise UpstreamUnavailable(
+                f"{self.name} is unavailable (rate limited upstream); retry in {self.limiter.retry_in():.0f}s",
+                request=request,
+            )
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable(
+                f"{self.name} is unavailable (circuit {self.breaker.state}); retry in {self.breaker.retry_in():.0f}s",
+                request=request,
+            )
+        try:
+            acquired = await self.limiter.acquire(self.acquire_timeout)
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        if not acquired:
+            self.breaker.abandon()
+            self.rejected += 1
+            raise UpstreamUnavailable(f"{self.name} is at its concurrency limit; try again shortly", request=request)
+
+    def on_response(self, status_code: int, retry_after: str | None):
+        if status_code in self.OVERLOAD_STATUSES:
+            self.limiter.on_overload()
+            delay = parse_retry_after(retry_after)
+            if delay:
+                self.limiter.block_for(delay)
+        else:
+            self.limiter.on_success()
+        if status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def on_error(self, exc: BaseException):
+        if isinstance(exc, Exception):
+            if isinstance(exc, httpx.TimeoutException):
+                self.limiter.on_overload()
+            self.breaker.record_failure()
+        else:
+            # Cancelled: no verdict on the upstream
+            self.breaker.abandon()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "retry_in_s": round(max(self.breaker.retry_in(), self.limiter.retry_in()), 1),
+            "times_opened": self.breaker.opened,
+            "limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.inflight,
+            "waiting": self.limiter.waiting,
+            "rejected": self.rejected,
+        }
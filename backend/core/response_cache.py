@@ -0,0 +1,59 @@
+"""
+Exact-match cache for single-turn LLM replies.
+
+The key covers everything that determines the upstream answer: provider,
+model, system prompt, the normalized user text and any image URLs. Error
+replies are never stored.
+"""
+import hashlib
+import json
+import re
+import unicodedata
+
+from ..llm_providers import is_error_reply
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt."""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+class ResponseCache:
+    def __init__(self, cache, namespace: str = "chat"):
+        """
+        :param cache: a TTLCache or SharedCache (see core.state.make_cache)
+        :param namespace: cache namespace whose TTL applies to replies
+        """
+        self.cache = cache
+        self.namespace = namespace
+
+    @staticmethod
+    def key_for(provider: str, model: str, system_prompt: str, message: str, images=None) -> str:
+        material = json.dumps(
+            [provider, model or "", system_prompt or "", normalize_prompt(message), list(images or [])],
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def key_for_client(self, provider: str, client, message: str, images=None) -> str:
+        return self.key_for(
+            provider,
+            getattr(client, "model", ""),
+            getattr(client, "system_prompt", ""),
+            message,
+            images,
+        )
+
+    async def get(self, key: str) -> str | None:
+        return await self.cache.get(self.namespace, key)
+
+    async def put(self, key: str, reply: str):
+        if reply and not is_error_reply(reply):
+            await self.cache.set(self.namespace, key, reply)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
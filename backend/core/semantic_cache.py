@@ -0,0 +1,223 @@
+"""
+Semantic near-duplicate cache for single-turn LLM prompts.
+
+Prompts are embedded locally (no network, no model download) as signed,
+hashed character n-gram + word vectors, L2-normalized so a dot product is
+the cosine similarity. Each provider/model gets its own fixed-capacity
+matrix; a lookup is one matrix product against it, and the cached reply of
+the best match is returned when its similarity clears the threshold.
+
+The embedding is purely lexical, so "Convert 100 USD to EUR" and "Convert
+1000 USD to EUR" look nearly identical to it. Before a match is served, both
+prompts must therefore carry the same numbers, and every name-like token
+(capitalized mid-sentence, all caps, or containing a digit) of either prompt
+must also occur in the other.
+"""
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import deque
+
+import numpy as np
+
+from .response_cache import normalize_prompt
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_WORD = re.compile(r"[^\W_]+")
+_SENTENCE_END = re.compile(r"[.!?:\n]\s*")
+
+
+class PromptTerms:
+    """The tokens of a prompt that a lexical similarity must not gloss over."""
+
+    __slots__ = ("numbers", "names", "words")
+
+    def __init__(self, text: str):
+        text = unicodedata.normalize("NFKC", text)
+        self.numbers = frozenset(_NUMBER.findall(text))
+        names = set()
+        for sentence in _SENTENCE_END.split(text):
+            for i, word in enumerate(_WORD.findall(sentence)):
+                if any(c.isdigit() for c in word) or (len(word) > 1 and (
+                        word.isupper() or (i > 0 and word[0].isupper()))):
+                    names.add(word.casefold())
+        self.names = frozenset(names)
+        self.words = frozenset(w.casefold() for w in _WORD.findall(text))
+
+    def compatible(self, other: "PromptTerms") -> bool:
+        """Same numbers, and each prompt's names appear somewhere in the other."""
+        return (
+            self.numbers == other.numbers
+            and self.names <= other.words
+            and other.names <= self.words
+        )
+
+
+class HashedNgramEmbedder:
+    def __init__(self, dim: int = 1024, char_ngrams=(3, 4), word_weight: float = 2.0):
+        self.dim = dim
+        self.char_ngrams = tuple(char_ngrams)
+        self.word_weight = word_weight
+
+    def _features(self, text: str):
+        padded = f" {text} "
+        for n in self.char_ngrams:
+            for i in range(len(padded) - n + 1):
+                yield padded[i:i + n], 1.0
+        for word in text.split():
+            yield "w:" + word, self.word_weight
+
+    def embed(self, text: str) -> np.ndarray:
+        indices, weights = [], []
+        # Punctuation rarely changes meaning here but shifts many n-grams
+        text = " ".join(_PUNCTUATION.sub(" ", normalize_prompt(text)).split())
+        for feature, weight in self._features(text):
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(feature.encode("utf-8"))
+            indices.append(h % self.dim)
+            weights.append(weight if h & 0x80000000 else -weight)
+        vec = np.zeros(self.dim, dtype=np.float32)
+        if indices:
+            np.add.at(vec, indices, weights)
+            norm = np.linalg.norm(vec)
+            if norm > 0:
+                vec /= norm
+        return vec
+
+    def embed_many(self, texts) -> np.ndarray:
+        return np.stack([self.embed(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+
+class _Partition:
+    """Fixed-capacity matrix of prompt vectors with their cached replies."""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.prompts = [None] * capacity
+        self.terms = [None] * capacity
+        self.replies = [None] * capacity
+        self.size = 0
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Similarity of each query row to every stored prompt."""
+        return queries @ self.vectors[:self.size].T
+
+    def best_match(self, scores: np.ndarray, terms: PromptTerms, threshold: float):
+        """(slot, similarity) of the closest compatible prompt at or above `threshold`, else None."""
+        candidates = np.flatnonzero(scores >= threshold)
+        for slot in candidates[np.argsort(-scores[candidates], kind="stable")].tolist():
+            if self.terms[slot].compatible(terms):
+                return slot, float(scores[slot])
+        return None
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, capacity: int = 2000, embedder: HashedNgramEmbedder | None = None):
+        """
+        :param threshold: minimum cosine similarity to serve a cached reply
+        :param capacity: entries kept per partition; least recently used are replaced
+        """
+        self.threshold = threshold
+        self.capacity = max(1, capacity)
+        self.embedder = embedder or HashedNgramEmbedder()
+        self._partitions = {}
+        self._tick = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._latencies = deque(maxlen=1000)  # recent lookup times, seconds
+        self._lock = threading.Lock()
+
+    def _partition(self, partition: str) -> _Partition:
+        part = self._partitions.get(partition)
+        if part is None:
+            part = self._partitions[partition] = _Partition(self.capacity, self.embedder.dim)
+        return part
+
+    def lookup_many(self, partition: str, prompts: list) -> list:
+        """
+        Vectorized lookup. Returns one entry per prompt: (reply, similarity)
+        for a hit, or None for a miss.
+        """
+        start = time.perf_counter()
+        queries = self.embedder.embed_many(prompts)
+        results = []
+        with self._lock:
+            part = self._partitions.get(partition)
+            if part is None or part.size == 0:
+                results = [None] * len(prompts)
+            else:
+                for row, prompt in zip(part.scores(queries), prompts):
+                    match = part.best_match(row, PromptTerms(prompt), self.threshold)
+                    if match is not None:
+                        slot, sim = match
+                        self._tick += 1
+                        part.last_used[slot] = self._tick
+                        results.append((part.replies[slot], sim))
+                    else:
+                        results.append(None)
+            hits = sum(1 for r in results if r is not None)
+            self._hits += hits
+            self._misses += len(results) - hits
+            self._latencies.append(time.perf_counter() - start)
+        return results
+
+    def lookup(self, partition: str, prompt: str):
+        return self.lookup_many(partition, [prompt])[0]
+
+    def add(self, partition: str, prompt: str, reply: str):
+        vec = self.embedder.embed(prompt)
+        terms = PromptTerms(prompt)
+        with self._lock:
+            part = self._partition(partition)
+            match = part.best_match(part.scores(vec[None, :])[0], terms, 0.999)
+            if match is not None:
+                # Same prompt again: refresh the existing entry
+                slot = match[0]
+            elif part.size < self.capacity:
+                slot = part.size
+                part.size += 1
+            else:
+                slot = int(part.last_used[:part.size].argmin())
+                self._evictions += 1
+            self._tick += 1
+            part.vectors[slot] = vec
+            part.last_used[slot] = self._tick
+            part.prompts[slot] = prompt
+            part.terms[slot] = terms
+            part.replies[slot] = reply
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            latencies = sorted(self._latencies)
+
+            def pct(p):
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+            return {
+                "threshold": self.threshold,
+                "capacity": self.capacity,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "evictions": self._evictions,
+                "lookup_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)},
+                "partitions": {name: part.size for name, part in self._partitions.items()},
+            }
+
+
+def partition_for(provider: str, client) -> str:
+    """Partition key: replies are only shared between identical provider setups."""
+    system_prompt = getattr(client, "system_prompt", "") or ""
+    return f"{provider}|{getattr(client, 'model', '')}|{zlib.crc32(system_prompt.encode('utf-8')):08x}"
@@ -0,0 +1,59 @@
+"""
+Request coalescing ("single flight") for identical upstream calls.
+
+While a call for a key is in flight, later callers with the same key wait
+for that call instead of starting their own, and all of them receive its
+result or its exception. Nothing is remembered once the call finishes, so
+errors are shared between concurrent waiters but never cached.
+
+The shared call belongs to no caller: it runs in a fresh context, so it does
+not inherit the first caller's deadline or trace, and it is bounded by its
+own `timeout` instead. Each caller limits how long it waits for the result
+itself (e.g. with asyncio.wait_for), which never cancels the shared call.
+"""
+import asyncio
+import contextvars
+
+
+class SingleFlight:
+    def __init__(self, timeout: float | None = None):
+        """
+        :param timeout: longest one shared call may run, in seconds (None: no limit)
+        """
+        self.timeout = timeout
+        self._inflight = {}  # {key: asyncio.Task}
+        self.calls = 0
+        self.coalesced = 0
+
+    def in_flight(self, key) -> bool:
+        """True if a call for `key` is running, i.e. do() would join it."""
+        return key in self._inflight
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Run `await fn(*args, **kwargs)` once per key among concurrent callers."""
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            # A task, so one caller going away does not cancel the others, created
+            # in an empty context so that it carries none of this caller's state
+            task = contextvars.Context().run(asyncio.ensure_future, self._call(fn, args, kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._forget(key, _t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _call(self, fn, args, kwargs):
+        if self.timeout is None:
+            return await fn(*args, **kwargs)
+        return await asyncio.wait_for(fn(*args, **kwargs), self.timeout)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter was cancelled
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
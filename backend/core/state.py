@@ -0,0 +1,359 @@
+"""
+Pluggable key/value backends for state that must survive across workers.
+
+Chat history and provider caches default to in-process structures
+(HistoryStore, TTLCache). Setting STATE_BACKEND_URL moves them into a
+store every worker process can reach:
+
+    STATE_BACKEND_URL=memory                      (default, per process)
+    STATE_BACKEND_URL=sqlite:///./state.db        (shared by local workers)
+    STATE_BACKEND_URL=redis://localhost:6379/0    (shared across nodes)
+
+Backends store opaque bytes with an optional TTL in seconds.
+"""
+import abc
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional dependency, only needed for redis:// URLs
+    aioredis = None
+
+from .cache import SharedCache, TTLCache
+from .history import HistoryStore, SharedHistoryStore
+
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "memory")
+
+
+class StateBackend(abc.ABC):
+    """
+    Interface shared by all backends. Every operation is a coroutine so that
+    a lock wait or a network round trip never stalls the event loop.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float | None = None):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    async def delete_prefix(self, prefix: str):
+        ...
+
+    @abc.abstractmethod
+    async def count(self, prefix: str = "") -> int:
+        ...
+
+    @abc.abstractmethod
+    async def trim(self, prefix: str, max_keys: int) -> int:
+        """Delete the keys under `prefix` closest to expiry beyond `max_keys`; returns how many."""
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """Process-local backend; mostly useful to exercise the shared code paths."""
+
+    name = "memory"
+
+    def __init__(self, clock=time.time):
+        self._data = {}  # {key: (value, expires_at or None)}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    async def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= self._clock():
+                del self._data[key]
+                return None
+            return value
+
+    async def set(self, key, value, ttl=None):
+        expires_at = self._clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (bytes(value), expires_at)
+
+    async def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    async def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    async def count(self, prefix=""):
+        now = self._clock()
+        with self._lock:
+            return sum(
+                1 for k, (_, exp) in self._data.items()
+                if k.startswith(prefix) and (exp is None or exp > now)
+            )
+
+    async def trim(self, prefix, max_keys):
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            excess = len(keys) - max_keys
+            if excess <= 0:
+                return 0
+            keys.sort(key=lambda k: (self._data[k][1] is None, self._data[k][1] or 0))
+            for key in keys[:excess]:
+                del self._data[key]
+            return excess
+
+
+class SQLiteBackend(StateBackend):
+    """
+    File-backed store that worker processes on the same host can share.
+    Runs in WAL mode so readers never block the single writer. sqlite3 is
+    blocking (a busy database waits up to `timeout` for its lock), so every
+    statement runs in a worker thread, each with its own connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 100_000, purge_every: int = 500,
+                 timeout: float = 5.0, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.purge_every = max(1, purge_every)
+        self.timeout = timeout
+        self._clock = clock
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; each is only ever used by the thread that opened it
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    @staticmethod
+    def _prefix_range(prefix: str):
+        return prefix, prefix + "\U0010ffff"
+
+    def _get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, self._clock()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, value, ttl):
+        expires_at = self._clock() + ttl if ttl is not None else None
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, sqlite3.Binary(value), expires_at),
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self._purge()
+
+    def _purge(self):
+        """Delete expired rows, then the soonest-to-expire rows beyond max_entries."""
+        conn = self._conn()
+        conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (self._clock(),))
+        excess = conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM kv WHERE key IN ("
+                " SELECT key FROM kv ORDER BY expires_at IS NULL, expires_at LIMIT ?)",
+                (excess,),
+            )
+
+    def _delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _delete_prefix(self, prefix):
+        self._conn().execute("DELETE FROM kv WHERE key >= ? AND key < ?", self._prefix_range(prefix))
+
+    def _count(self, prefix):
+        lo, hi = self._prefix_range(prefix)
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (lo, hi, self._clock()),
+        ).fetchone()[0]
+
+    def _trim(self, prefix, max_keys):
+        lo, hi = self._prefix_range(prefix)
+        conn = self._conn()
+        excess = conn.execute("SELECT COUNT(*) FROM kv WHERE key >= ? AND key < ?", (lo, hi)).fetchone()[0] - max_keys
+        if excess <= 0:
+            return 0
+        conn.execute(
+            "DELETE FROM kv WHERE key IN ("
+            " SELECT key FROM kv WHERE key >= ? AND key < ? ORDER BY expires_at IS NULL, expires_at LIMIT ?)",
+            (lo, hi, excess),
+        )
+        return excess
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, value, ttl=None):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def purge(self):
+        await asyncio.to_thread(self._purge)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._delete, key)
+
+    async def delete_prefix(self, prefix):
+        await asyncio.to_thread(self._delete_prefix, prefix)
+
+    async def count(self, prefix=""):
+        return await asyncio.to_thread(self._count, prefix)
+
+    async def trim(self, prefix, max_keys):
+        return await asyncio.to_thread(self._trim, prefix, max_keys)
+
+    async def close(self):
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+
+class RedisBackend(StateBackend):
+    """
+    Store speaking the Redis protocol, through redis.asyncio. Pass `client`
+    to use any compatible asyncio client (e.g. fakeredis.aioredis for a
+    local stand-in).
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str | None = None, client=None, key_prefix: str = "chatbot:"):
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("❌ redis package missing. Install it with `pip install redis`.")
+            client = aioredis.Redis.from_url(url)
+        self._redis = client
+        self.key_prefix = key_prefix
+
+    @staticmethod
+    def _glob_escape(text: str) -> str:
+        return "".join("\\" + c if c in "*?[]\\" else c for c in text)
+
+    async def get(self, key):
+        return await self._redis.get(self.key_prefix + key)
+
+    async def set(self, key, value, ttl=None):
+        if ttl is None:
+            await self._redis.set(self.key_prefix + key, value)
+        else:
+            await self._redis.set(self.key_prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key):
+        await self._redis.delete(self.key_prefix + key)
+
+    def _scan(self, prefix: str):
+        return self._redis.scan_iter(match=self._glob_escape(self.key_prefix + prefix) + "*", count=500)
+
+    async def delete_prefix(self, prefix):
+        batch = []
+        async for key in self._scan(prefix):
+            batch.append(key)
+            if len(batch) >= 500:
+                await self._redis.delete(*batch)
+                batch = []
+        if batch:
+            await self._redis.delete(*batch)
+
+    async def count(self, prefix=""):
+        return sum([1 async for _ in self._scan(prefix)])
+
+    async def trim(self, prefix, max_keys):
+        keys = [key async for key in self._scan(prefix)]
+        excess = len(keys) - max_keys
+        if excess <= 0:
+            return 0
+        pipe = self._redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.pttl(key)
+        # PTTL is -1 for keys without expiry (kept longest) and -2 for ones already gone
+        ttls = [ttl if ttl >= 0 else float("inf") for ttl in await pipe.execute()]
+        doomed = [key for _, key in sorted(zip(ttls, keys), key=lambda pair: pair[0])[:excess]]
+        await self._redis.delete(*doomed)
+        return len(doomed)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def backend_from_url(url: str = STATE_BACKEND_URL) -> StateBackend | None:
+    """
+    Build the backend named by `url`. Returns None for "memory", meaning
+    callers should use the faster in-process structures directly.
+    """
+    if not url or url == "memory":
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"❌ Unsupported STATE_BACKEND_URL '{url}'")
+
+
+_backend = None
+_backend_loaded = False
+
+
+def get_backend() -> StateBackend | None:
+    """Process-wide backend configured by STATE_BACKEND_URL (None for in-process state)."""
+    global _backend, _backend_loaded
+    if not _backend_loaded:
+        _backend = backend_from_url(STATE_BACKEND_URL)
+        _backend_loaded = True
+    return _backend
+
+
+def make_cache(prefix: str, ttls: dict, max_entries: int, max_bytes: int):
+    """A TTLCache, or a SharedCache when a shared backend is configured."""
+    backend = get_backend()
+    if backend is None:
+        return TTLCache(ttls=ttls, max_entries=max_entries, max_bytes=max_bytes)
+    return SharedCache(backend, prefix=prefix, ttls=ttls)
+
+
+def make_history_store(windows: dict, idle_ttl: float, max_bytes: int, max_keys: int = 100_000):
+    """A HistoryStore, or a SharedHistoryStore when a shared backend is configured."""
+    backend = get_backend()
+    if backend is None:
+        return HistoryStore(windows=windows, idle_ttl=idle_ttl, max_bytes=max_bytes)
+    return SharedHistoryStore(backend, windows=windows, idle_ttl=idle_ttl, max_keys=max_keys)
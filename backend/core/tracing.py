@@ -0,0 +1,232 @@
+"""
+Lightweight per-request tracing.
+
+TracingMiddleware starts a trace for every HTTP request. Code marks its
+phases with `with tracing.span("geocode"):`, and the shared transport adds
+connect / TTFB / body spans for each upstream call. The phase durations go
+back to the client in a `Server-Timing` header, so browser devtools show
+where the time went. With TRACE_EXPORT_FILE set, every span is also written
+as one OpenTelemetry-style JSON object per line. An incoming W3C
+`traceparent` header is honoured, so these spans join a caller's trace.
+
+The header is sent with the response start. Spans that end after that,
+such as the body of a streamed reply, only appear in the exported file.
+Outside a request, span() does nothing.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return "%0*x" % (nbytes * 2, random.getrandbits(nbytes * 8))
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: str | None, start: float, attributes: dict):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start = start  # time.perf_counter()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Trace:
+    def __init__(self, trace_id: str | None = None, parent_id: str | None = None):
+        self.trace_id = trace_id or _new_id(16)
+        self.parent_id = parent_id  # Remote parent from traceparent
+        self.spans = []
+        self.root = None
+        self.attributes = {}  # Request shape set by handlers, see annotate()
+        # Anchor so perf_counter times can be exported as wall-clock nanoseconds
+        self._wall = time.time_ns()
+        self._perf = time.perf_counter()
+
+    def unix_nanos(self, perf: float) -> int:
+        return self._wall + int((perf - self._perf) * 1e9)
+
+    def server_timing(self) -> str:
+        """Finished spans summed by name, in Server-Timing syntax (milliseconds)."""
+        totals = {}
+        for span in self.spans:
+            if span.end is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+def current() -> Trace | None:
+    return _trace.get()
+
+
+def annotate(**attributes):
+    """Attach request-level attributes (e.g. provider, message size) to the current trace."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span. A no-op outside a traced request."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    s = Span(name, parent.span_id if parent else trace.parent_id, time.perf_counter(), attributes)
+    token = _span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _span.reset(token)
+        trace.spans.append(s)
+
+
+@contextmanager
+def suspended():
+    """Record nothing inside the block, e.g. for long background work started by a request."""
+    trace_token = _trace.set(None)
+    span_token = _span.set(None)
+    try:
+        yield
+    finally:
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+
+
+def record(name: str, start: float, end: float, **attributes):
+    """Add an already finished span (perf_counter start/end), e.g. from callbacks."""
+    trace = _trace.get()
+    if trace is None:
+        return
+    parent = _span.get()
+    s = Span(name, parent.span_id if parent else trace.parent_id, start, attributes)
+    s.end = end
+    trace.spans.append(s)
+
+
+def parse_traceparent(value: str | None):
+    """(trace_id, parent span id) from a W3C traceparent header, or (None, None)."""
+    parts = (value or "").strip().split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16 and parts[1] != "0" * 32:
+        return parts[1], parts[2]
+    return None, None
+
+
+class JsonLinesExporter:
+    """Writes spans as OpenTelemetry-style JSON lines from a background thread."""
+
+    def __init__(self, path: str, service_name: str = "chatbot-api"):
+        self.path = path
+        self.service_name = service_name
+        self._queue = queue.SimpleQueue()
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def export(self, trace: Trace):
+        self._queue.put(trace)
+
+    def _encode(self, trace: Trace, span: Span) -> str:
+        attributes = [{"key": k, "value": {"stringValue": str(v)}} for k, v in span.attributes.items()]
+        return json.dumps({
+            "resource": {"service.name": self.service_name},
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": "SPAN_KIND_SERVER" if span.parent_id == trace.parent_id else "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(trace.unix_nanos(span.start)),
+            "endTimeUnixNano": str(trace.unix_nanos(span.end)),
+            "attributes": attributes,
+            "status": {"code": "STATUS_CODE_ERROR", "message": span.error} if span.error else {"code": "STATUS_CODE_UNSET"},
+        })
+
+    def _run(self):
+        while True:
+            traces = [self._queue.get()]
+            while not self._queue.empty():
+                traces.append(self._queue.get())
+            lines = [self._encode(t, s) for t in traces for s in t.spans if s.end is not None]
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            except OSError:
+                pass
+
+
+class TracingMiddleware:
+    def __init__(self, app, exporter: JsonLinesExporter | None = None, export_sample: float = 1.0, on_trace=None):
+        """
+        :param exporter: where to write finished traces, if anywhere
+        :param export_sample: fraction of requests whose spans are exported
+        :param on_trace: called with every finished Trace (e.g. a slow-request log)
+        """
+        self.app = app
+        self.exporter = exporter
+        self.export_sample = export_sample
+        self.on_trace = on_trace
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = next((v.decode("latin-1") for k, v in scope.get("headers") or [] if k == b"traceparent"), None)
+        trace = Trace(*parse_traceparent(traceparent))
+        trace_token = _trace.set(trace)
+        root = Span(f"{scope['method']} {scope['path']}", trace.parent_id, time.perf_counter(),
+                    {"http.method": scope["method"], "http.target": scope["path"]})
+        trace.root = root
+        span_token = _span.set(root)
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                header = trace.server_timing()
+                app_ms = (time.perf_counter() - root.start) * 1000
+                header = f"{header}, app;dur={app_ms:.1f}" if header else f"app;dur={app_ms:.1f}"
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            root.end = time.perf_counter()
+            _span.reset(span_token)
+            _trace.reset(trace_token)
+            trace.spans.append(root)
+            if self.exporter is not None and random.random() < self.export_sample:
+                self.exporter.export(trace)
+            if self.on_trace is not None:
+                self.on_trace(trace)
+
+
+def middleware_options() -> dict:
+    """TracingMiddleware settings from TRACE_EXPORT_FILE / TRACE_EXPORT_SAMPLE."""
+    path = os.getenv("TRACE_EXPORT_FILE")
+    return {
+        "exporter": JsonLinesExporter(path) if path else None,
+        "export_sample": float(os.getenv("TRACE_EXPORT_SAMPLE", "1.0")),
+    }
@@ -1 +1,14 @@
 # LLM Providers Package
+import os
+
+# Upstream base URLs; override to point the clients at local stubs (see backend/bench)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+NEWSAPI_BASE_URL = os.getenv("NEWSAPI_BASE_URL", "https://newsapi.org/v2").rstrip("/")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+
+# Clients report failures as user-facing strings starting with one of these
+ERROR_PREFIXES = ("❌", "⚠️", "🔥")
+
+
+def is_error_reply(text: str) -> bool:
+    return text.lstrip().startswith(ERROR_PREFIXES)
@@ -0,0 +1,162 @@
+"""
+Token-budgeted context windows for the LLM clients.
+
+Instead of a fixed number of trailing messages, each request gets as much
+recent history as fits the model's token budget. System messages are pinned
+and always sent, the current user message is always sent, and earlier turns
+are added from newest to oldest until the budget runs out. Turns that don't
+fit can be folded into a short extractive summary (no extra LLM call), so a
+long conversation keeps its gist at a bounded cost.
+
+Token counts are estimated locally, with a heuristic close to BPE
+tokenizers for English text and code, and cached per message content, so
+re-sending the same history only costs dictionary lookups.
+
+Budgets (tokens of prompt, the reply is not counted):
+
+    CONTEXT_TOKEN_BUDGET=3000                             default for every model
+    CONTEXT_BUDGETS=deepseek/deepseek-chat-v3.1:free=6000,...   per-model overrides
+    CONTEXT_SUMMARY_TOKENS=0                              >0 enables the summary, at most this size
+    CONTEXT_HISTORY_MESSAGES=40                           messages retained per session to pick from
+"""
+import os
+import re
+from functools import lru_cache
+
+from ..core import tracing
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "0"))
+CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", "40"))
+
+# Role markers and separators added by the chat template, per message
+MESSAGE_OVERHEAD = 4
+# Flat estimate for an image part; providers bill these very differently
+IMAGE_TOKENS = 500
+
+_WORDS = re.compile(r"\w+|[^\w\s]")
+
+
+def _parse_budgets(spec: str) -> dict:
+    budgets = {}
+    for part in spec.split(","):
+        model, _, tokens = part.rpartition("=")
+        if model.strip() and tokens.strip().isdigit():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+MODEL_BUDGETS = _parse_budgets(os.getenv("CONTEXT_BUDGETS", ""))
+
+
+def budget_for(model: str) -> int:
+    return MODEL_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count: words and punctuation marks, with long words
+    counted as several tokens, and never less than one token per 4 characters.
+    """
+    pieces = _WORDS.findall(text)
+    by_pieces = sum(1 + len(p) // 8 for p in pieces)
+    return max(by_pieces, (len(text) + 3) // 4)
+
+
+def message_tokens(message: dict) -> int:
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens = estimate_tokens(content)
+    else:
+        # Multimodal content: [{"type": "text", ...}, {"type": "image_url", ...}]
+        tokens = sum(
+            estimate_tokens(part.get("text", "")) if part.get("type") == "text" else IMAGE_TOKENS
+            for part in content or ()
+        )
+    return tokens + MESSAGE_OVERHEAD
+
+
+def _text_of(message: dict) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content or () if part.get("type") == "text")
+
+
+def _gist(text: str, limit: int = 160) -> str:
+    """First sentence (or the first `limit` characters) of a message, on one line."""
+    text = " ".join(text.split())
+    match = re.search(r"[.!?](\s|$)", text)
+    if match and match.end() <= limit:
+        return text[:match.end()].strip()
+    return text[:limit].rstrip() + ("…" if len(text) > limit else "")
+
+
+class ContextWindow:
+    def __init__(self, budget: int, summary_tokens: int = 0):
+        """
+        :param budget: prompt tokens allowed per request
+        :param summary_tokens: room for a summary of the turns that don't fit; 0 disables it
+        """
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+
+    @classmethod
+    def for_model(cls, model: str) -> "ContextWindow":
+        return cls(budget_for(model), CONTEXT_SUMMARY_TOKENS)
+
+    def summarize(self, dropped: list, budget: int) -> dict | None:
+        """A system message with one line per dropped turn, newest kept first when space runs out."""
+        header = "Summary of the earlier conversation:"
+        used = estimate_tokens(header) + MESSAGE_OVERHEAD
+        lines = []
+        for message in reversed(dropped):
+            line = f"- {message['role']}: {_gist(_text_of(message))}"
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        if not lines:
+            return None
+        return {"role": "system", "content": "\n".join([header] + lines[::-1])}
+
+    @staticmethod
+    def _fill(turns: list, remaining: int) -> tuple[list, int]:
+        """Newest turns that fit in `remaining` tokens (at least the last one), and what is left."""
+        kept = []
+        for i in range(len(turns) - 1, -1, -1):
+            cost = message_tokens(turns[i])
+            if kept and cost > remaining:
+                break
+            kept.append(turns[i])
+            remaining -= cost
+        kept.reverse()
+        return kept, remaining
+
+    def build(self, messages: list) -> list:
+        """
+        The messages to send: pinned system messages, optionally a summary of
+        what didn't fit, then the newest turns within the budget. The last
+        message (the one being answered) is always included.
+        """
+        pinned = [m for m in messages if m.get("role") == "system"]
+        turns = [m for m in messages if m.get("role") != "system"]
+        available = self.budget - sum(message_tokens(m) for m in pinned)
+
+        kept, remaining = self._fill(turns, available)
+        summary = None
+        if len(kept) < len(turns) and self.summary_tokens > 0:
+            # Something is dropped anyway: make room for the summary and refill
+            kept, remaining = self._fill(turns, available - self.summary_tokens)
+            summary = self.summarize(turns[:len(turns) - len(kept)], self.summary_tokens)
+            remaining += self.summary_tokens - (message_tokens(summary) if summary else 0)
+
+        window = pinned + ([summary] if summary else []) + kept
+        tracing.annotate(
+            context_tokens=self.budget - remaining,
+            context_messages=len(window),
+            context_dropped=len(turns) - len(kept),
+        )
+        return window
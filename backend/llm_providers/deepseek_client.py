@@ -1,44 +1,62 @@
-import requests
 import traceback
 
+from . import OPENROUTER_BASE_URL, transport
+from .context import CONTEXT_HISTORY_MESSAGES, ContextWindow
+from .streaming import StreamError, stream_completion
+from ..core import tracing
+
 class DeepSeekClient:
     def __init__(self, api_key: str):
         if not api_key:
             raise ValueError("❌ DeepSeek API key is missing.")
         self.api_key = api_key
-        self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.api_url = f"{OPENROUTER_BASE_URL}/chat/completions"
+        self.model = "deepseek/deepseek-chat-v3.1:free"
+        # Messages retained per session; the token budget decides how many are sent
+        self.history_window = CONTEXT_HISTORY_MESSAGES
+        self.context = ContextWindow.for_model(self.model)
+
+    @property
+    def upstream(self) -> str:
+        return transport.upstream_name(self.api_url, self.model)
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _payload(self, history: list) -> dict:
+        return {
+            "model": self.model,
+            "messages": self.context.build(history),
+            "temperature": 0.7
+        }
+
+    def _error_message(self, status_code: int, text: str) -> str:
+        if status_code == 401:
+            return "❌ Unauthorized: Invalid API key."
+        return f"❌ Error {status_code}: {text}"
 
-    def generate_response(self, message: str, history=None):
-        """Send chat request with limited history to DeepSeek / OpenRouter"""
+    async def generate_response(self, message: str, history=None):
+        """Send chat request with token-budgeted history to DeepSeek / OpenRouter"""
         if history is None:
             history = []
 
         # Add the current user message
         history.append({"role": "user", "content": message})
 
-        # Limit history to last 4 messages (API safe)
-        payload_history = history[-4:]
-
-        payload = {
-            "model": "deepseek/deepseek-chat-v3.1:free",
-            "messages": payload_history,
-            "temperature": 0.7
-        }
+        payload = self._payload(history)
 
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            response = await transport.post(self.api_url, upstream=self.upstream, headers=self._headers(), json=payload)
 
-            if response.status_code == 401:
-                return "❌ Unauthorized: Invalid API key.", history
-            elif response.status_code != 200:
-                return f"❌ Error {response.status_code}: {response.text}", history
+            if response.status_code != 200:
+                return self._error_message(response.status_code, response.text), history
 
-            data = response.json()
-            assistant_reply = data["choices"][0]["message"]["content"].strip()
+            with tracing.span("deepseek.parse"):
+                data = response.json()
+                assistant_reply = data["choices"][0]["message"]["content"].strip()
 
             # Add assistant reply to history
             history.append({"role": "assistant", "content": assistant_reply})
@@ -48,3 +66,22 @@ class DeepSeekClient:
         except Exception as e:
             traceback.print_exc()
             return f"❌ Unexpected error: {str(e)}", history
+
+    async def stream_response(self, message: str, history: list):
+        """
+        Streaming variant of generate_response. `history` is updated in place:
+        the user message is appended up front, the full reply once the stream ends.
+        """
+        history.append({"role": "user", "content": message})
+        payload = self._payload(history)
+
+        parts = []
+        try:
+            async for chunk in stream_completion(self.api_url, self.upstream, self._headers(), payload, self._error_message):
+                parts.append(chunk)
+                yield chunk
+        except StreamError as e:
+            yield str(e)
+            return
+
+        history.append({"role": "assistant", "content": "".join(parts).strip()})
@@ -1,16 +1,20 @@
 # news_client.py
-import requests
+import asyncio
 import os
 
+import httpx
+
+from . import NEWSAPI_BASE_URL, transport
+
 # Load your News API key from environment
 NEWS_API_KEY = os.environ.get("NEWS_API_KEY") or os.environ.get("NEWSAPI_KEY")
 
 class NewsClient:
     def __init__(self, api_key=None):
         self.api_key = api_key or NEWS_API_KEY
-        self.base_url = "https://newsapi.org/v2/top-headlines"
+        self.base_url = f"{NEWSAPI_BASE_URL}/top-headlines"
 
-    def get_latest_news(self, country="in", category=None, limit=5):
+    async def get_latest_news(self, country="in", category=None, limit=5):
         """
         Fetch latest news articles.
         :param country: 'in' for India, 'us' for USA, etc.
@@ -30,7 +34,8 @@ class NewsClient:
             if not self.api_key:
                 return [], "Missing NEWS_API_KEY. Set it in backend/.env and restart."
 
-            response = requests.get(self.base_url, params=params, timeout=10)
+            # Concurrent identical requests (e.g. during a news spike) share one upstream call
+            response = await transport.get_shared(self.base_url, params=params, timeout=10)
             if response.status_code != 200:
                 try:
                     body = response.json()
@@ -45,12 +50,12 @@ class NewsClient:
 
             articles = data.get("articles", [])
             return articles[:limit], None
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             return [], f"Request error: {e}"
 
 # Example usage
 if __name__ == "__main__":
     client = NewsClient()
-    news = client.get_latest_news(country="in", category="technology")
+    news, err = asyncio.run(client.get_latest_news(country="in", category="technology"))
     for idx, article in enumerate(news, 1):
         print(f"{idx}. {article['title']} ({article['source']['name']})")
@@ -1,7 +1,12 @@
 # openai_client.py
-import requests
 import os
-import json
+
+import httpx
+
+from . import OPENROUTER_BASE_URL, transport
+from .context import CONTEXT_HISTORY_MESSAGES, ContextWindow
+from .streaming import StreamError, stream_completion
+from ..core import tracing
 
 class OpenAIClient:
     def __init__(self, api_key=None):
@@ -9,37 +14,61 @@ class OpenAIClient:
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         if not self.api_key:
             raise ValueError("❌ OpenAI API key missing. Set OPENROUTER_API_KEY in your environment.")
-        self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.api_url = f"{OPENROUTER_BASE_URL}/chat/completions"
+        self.model = "openai/gpt-oss-120b:free"
+        self.history_window = CONTEXT_HISTORY_MESSAGES
+        self.context = ContextWindow.for_model(self.model)
+
+    @property
+    def upstream(self) -> str:
+        return transport.upstream_name(self.api_url, self.model)
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _payload(self, message: str, history: list = None) -> dict:
+        return {
+            "model": self.model,
+            "messages": self.context.build(list(history or []) + [{"role": "user", "content": message}])
+        }
+
+    def _error_message(self, status_code: int, text: str) -> str:
+        return f"❌ API error {status_code}: {text}"
 
-    def generate_response(self, message: str) -> str:
+    async def generate_response(self, message: str, history: list = None) -> str:
         """
         Send a message to OpenRouter/OpenAI API and get the response.
+        `history` holds earlier turns of the session, sent as far as the token budget allows.
         """
         try:
-            payload = {
-                "model": "openai/gpt-oss-120b:free",
-                "messages": [{"role": "user", "content": message}]
-            }
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(self.api_url, headers=headers, data=json.dumps(payload))
+            response = await transport.post(self.api_url, upstream=self.upstream, headers=self._headers(), json=self._payload(message, history))
             if response.status_code != 200:
-                return f"❌ API error {response.status_code}: {response.text}"
+                return self._error_message(response.status_code, response.text)
 
-            data = response.json()
-            # Access the first assistant message from choices
-            return data["choices"][0]["message"]["content"].strip()
+            with tracing.span("openai.parse"):
+                data = response.json()
+                # Access the first assistant message from choices
+                return data["choices"][0]["message"]["content"].strip()
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             return f"❌ Request failed: {str(e)}"
         except Exception as e:
             return f"❌ Unexpected error: {str(e)}"
 
+    async def stream_response(self, message: str, history: list = None):
+        """
+        Same as generate_response, but yields the reply text in chunks as it is generated.
+        """
+        try:
+            async for chunk in stream_completion(self.api_url, self.upstream, self._headers(), self._payload(message, history), self._error_message):
+                yield chunk
+        except StreamError as e:
+            yield str(e)
+
 # Example usage:
 # client = OpenAIClient()
-# reply = client.generate_response("Hello, how are you?")
+# reply = asyncio.run(client.generate_response("Hello, how are you?"))
 # print(reply)
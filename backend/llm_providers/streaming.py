@@ -0,0 +1,57 @@
+# streaming.py
+"""
+Helpers for OpenRouter's `stream: true` chat-completions mode.
+
+OpenRouter streams Server-Sent Events: `data: {json chunk}` lines, keep-alive
+comments such as `: OPENROUTER PROCESSING`, and a final `data: [DONE]`.
+"""
+import json
+
+import httpx
+
+from . import transport
+from ..core import deadline
+
+
+class StreamError(Exception):
+    """Raised when the upstream stream fails; the message is user-facing."""
+
+
+async def stream_completion(api_url: str, upstream: str, headers: dict, payload: dict, error_message):
+    """
+    Yield assistant text deltas for a chat-completions request as they arrive.
+    `upstream` keys the breaker (see transport.upstream_name), and
+    `error_message(status_code, body)` maps a non-200 reply to a user-facing string.
+    """
+    payload = dict(payload, stream=True)
+    try:
+        async with transport.stream("POST", api_url, upstream=upstream, headers=headers, json=payload) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                raise StreamError(error_message(response.status_code, body))
+
+            async for line in response.aiter_lines():
+                budget = deadline.remaining()
+                if budget is not None and budget <= 0:
+                    raise StreamError("⚠️ Request deadline exceeded while streaming.")
+                # Skip blank separators and ": keep-alive" comments
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if "error" in chunk:
+                    err = chunk["error"]
+                    raise StreamError(f"❌ Stream error: {err.get('message', err) if isinstance(err, dict) else err}")
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+    except httpx.HTTPError as e:
+        raise StreamError(f"❌ Request failed: {str(e)}") from e
@@ -0,0 +1,399 @@
+# transport.py
+"""
+Shared async HTTP transport used by every provider client.
+
+A single pooled httpx.AsyncClient is reused for all upstream calls, so
+connections to OpenRouter, NewsAPI and OpenWeather stay alive between
+requests instead of paying a TCP+TLS handshake each time. Each upstream
+gets its own circuit breaker, so one failing model behind a gateway does not
+fail its siblings, while the adaptive concurrency limit (and any Retry-After
+block) is per host, capped separately from the global pool size, since
+models behind one gateway share its rate limit. Every call is bounded by the
+current request's deadline (see core.deadline).
+"""
+import asyncio
+import importlib.util
+import os
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..core import deadline, metrics, tracing
+from ..core.resilience import AdaptiveLimiter, CircuitBreaker, UpstreamGuard, UpstreamUnavailable
+from ..core.singleflight import SingleFlight
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "50"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+PREWARM_CONNECTIONS = int(os.getenv("HTTP_PREWARM_CONNECTIONS", "2"))
+
+# Resilience per upstream: fail fast while unhealthy, adapt concurrency to 429s
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+LIMITER_INITIAL = int(os.getenv("LIMITER_INITIAL", "10"))
+LIMITER_ACQUIRE_TIMEOUT = float(os.getenv("LIMITER_ACQUIRE_TIMEOUT", "10"))
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+HTTP2 = os.getenv("HTTP2_ENABLED", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+
+class _ReleaseOnClose(httpx.AsyncByteStream):
+    """Response body stream that frees its host slot once the body is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class GuardedTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps a pooled transport with a circuit breaker per upstream and an
+    adaptive concurrency limit per host (see core.resilience). The upstream is
+    the request's "upstream" extension if set, else its host.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max(1, max_per_host)
+        self._guards = {}
+        self._limiters = {}  # {host: AdaptiveLimiter}, shared by that host's guards
+
+    def guard(self, name: str, host: str) -> UpstreamGuard:
+        guard = self._guards.get(name)
+        if guard is None:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = AdaptiveLimiter(
+                    initial=min(LIMITER_INITIAL, self._max_per_host),
+                    max_limit=self._max_per_host,
+                )
+            guard = self._guards[name] = UpstreamGuard(
+                name,
+                CircuitBreaker(
+                    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                    reset_timeout=BREAKER_RESET_TIMEOUT,
+                ),
+                limiter,
+                acquire_timeout=LIMITER_ACQUIRE_TIMEOUT,
+            )
+        return guard
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode("ascii")
+        guard = self.guard(request.extensions.get("upstream") or host, host)
+        await guard.enter(request)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            guard.limiter.release()
+            guard.on_error(e)
+            raise
+        guard.on_response(response.status_code, response.headers.get("retry-after"))
+        if isinstance(response.stream, httpx.ByteStream):
+            # Body is already buffered in memory, nothing left on the wire
+            guard.limiter.release()
+            return response
+        # Hold the slot until the body has been read (matters for streaming)
+        response.stream = _ReleaseOnClose(response.stream, guard.limiter.release)
+        return response
+
+    def snapshot(self) -> dict:
+        return {name: guard.snapshot() for name, guard in self._guards.items()}
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """Response body stream that counts bytes and closes out the in-flight gauge and body span."""
+
+    def __init__(self, stream, label: str, body_started: float | None = None):
+        self._stream = stream
+        self._label = label
+        self._body_started = body_started
+        self._bytes = 0
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                metrics.upstream_bytes_in.labels(self._label).inc(self._bytes)
+                metrics.upstream_in_flight.labels(self._label).dec()
+                if self._body_started is not None:
+                    tracing.record(f"{self._label}.body", self._body_started, time.perf_counter(), bytes=self._bytes)
+
+
+def _record_phases(label: str, started: float, events: dict, url: str):
+    """Trace spans for one upstream call from httpcore's connection events."""
+    connect_start = events.get("connect_tcp.started")
+    connect_end = events.get("start_tls.complete") or events.get("connect_tcp.complete")
+    if connect_start is not None and connect_end is not None:
+        tracing.record(f"{label}.connect", connect_start, connect_end)
+    # Time to first byte: request sent until response headers are in
+    sent = events.get("send_request_headers.started") or connect_end or started
+    headers = events.get("receive_response_headers.complete") or time.perf_counter()
+    tracing.record(f"{label}.ttfb", sent, headers, url=url)
+    return headers
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """
+    Records request counts, latency, in-flight requests and bytes per upstream
+    label, plus connect/TTFB/body trace spans when the request is traced.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        label = metrics_label(request)
+        try:
+            metrics.upstream_bytes_out.labels(label).inc(len(request.content))
+        except httpx.RequestNotRead:
+            pass
+        events = None
+        if tracing.current() is not None and "trace" not in request.extensions:
+            events = {}
+
+            async def on_event(name, info):
+                # e.g. "connection.connect_tcp.started", "http11.receive_response_headers.complete"
+                events[name.split(".", 1)[-1]] = time.perf_counter()
+
+            request.extensions["trace"] = on_event
+        in_flight = metrics.upstream_in_flight.labels(label)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            in_flight.dec()
+            if isinstance(e, UpstreamUnavailable):
+                kind = "rejected"
+            elif isinstance(e, httpx.TimeoutException):
+                kind = "timeout"
+            else:
+                kind = "error" if isinstance(e, Exception) else "cancelled"
+            metrics.upstream_requests.labels(label, kind).inc()
+            raise
+        metrics.upstream_duration.labels(label).observe(time.perf_counter() - started)
+        metrics.upstream_requests.labels(label, str(response.status_code)).inc()
+        body_started = None
+        if events is not None:
+            body_started = _record_phases(label, started, events, f"{request.url.host}{request.url.path}")
+        try:
+            size = len(response.content)
+        except httpx.ResponseNotRead:
+            response.stream = _MeteredStream(response.stream, label, body_started)
+            return response
+        # Body is already buffered in memory, nothing left on the wire
+        in_flight.dec()
+        metrics.upstream_bytes_in.labels(label).inc(size)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+# Metrics labels for upstreams: {upstream name or URL prefix: label}, see label_upstream()
+_labels = {}
+
+
+def label_upstream(key: str, label: str):
+    """
+    Report requests to an upstream under `label` in the metrics. `key` is an
+    upstream name (see upstream_name) or a URL prefix.
+    """
+    _labels[key] = label
+
+
+def metrics_label(request: httpx.Request) -> str:
+    label = request.extensions.get("label")
+    if label:
+        return label
+    upstream = request.extensions.get("upstream")
+    if upstream in _labels:
+        return _labels[upstream]
+    url = str(request.url)
+    matches = [prefix for prefix in _labels if url.startswith(prefix)]
+    # Unknown hosts share one label to keep metric cardinality bounded
+    return _labels[max(matches, key=len)] if matches else "other"
+
+
+_client: httpx.AsyncClient | None = None
+_guarded: GuardedTransport | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client, creating it on first use."""
+    global _client, _guarded
+    if _client is None or _client.is_closed:
+        pool = httpx.AsyncHTTPTransport(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        _guarded = GuardedTransport(pool, MAX_CONNECTIONS_PER_HOST)
+        _client = httpx.AsyncClient(
+            transport=MeteredTransport(_guarded),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+def _with_upstream(kwargs: dict, upstream: str | None, label: str | None = None) -> dict:
+    extensions = {}
+    if upstream:
+        extensions["upstream"] = upstream
+    if label:
+        extensions["label"] = label
+    if extensions:
+        kwargs["extensions"] = dict(kwargs.get("extensions") or {}, **extensions)
+    return kwargs
+
+
+def upstream_name(url: str, model: str) -> str:
+    """
+    Upstream key for a model behind a shared gateway such as OpenRouter, so one
+    failing free model does not trip the breaker for every model on that host.
+    The concurrency limit stays per host, since the models share its rate limit.
+    """
+    return f"{urlsplit(url).netloc}/{model}"
+
+
+def _budget() -> float | None:
+    """Seconds left for the current request; raises if it has already run out."""
+    budget = deadline.remaining()
+    if budget is not None and budget <= 0:
+        raise deadline.DeadlineExceeded("Request deadline exceeded before the upstream call")
+    return budget
+
+
+async def request(method: str, url: str, upstream: str | None = None, label: str | None = None, **kwargs) -> httpx.Response:
+    """`upstream` keys the breaker (see upstream_name); `label` overrides the metrics label."""
+    budget = _budget()
+    call = get_client().request(method, url, **_with_upstream(kwargs, upstream, label))
+    if budget is None:
+        return await call
+    try:
+        # Cancelling on timeout also drops the in-flight upstream request
+        return await asyncio.wait_for(call, budget)
+    except asyncio.TimeoutError:
+        raise deadline.DeadlineExceeded(f"Request deadline exceeded after {budget:.1f}s") from None
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+# Coalesced calls run detached from any one caller's deadline, under this cap instead
+SHARED_CALL_TIMEOUT = float(os.getenv("HTTP_SHARED_CALL_TIMEOUT", "30"))
+
+_flight = SingleFlight(timeout=SHARED_CALL_TIMEOUT)
+
+
+async def get_shared(url: str, params: dict | None = None, headers: dict | None = None, **kwargs) -> httpx.Response:
+    """
+    GET where identical concurrent requests (same URL, params, headers and
+    other options but the timeout) share one upstream call. The response body
+    is already read, so every caller can parse it independently. Each caller
+    waits for the shared call only as long as its own deadline allows.
+    """
+    key = (
+        url,
+        tuple(sorted((params or {}).items())),
+        tuple(sorted((name.lower(), value) for name, value in (headers or {}).items())),
+        tuple(sorted((name, repr(value)) for name, value in kwargs.items() if name != "timeout")),
+    )
+    budget = _budget()
+    parts = urlsplit(url)
+    with tracing.span("upstream.shared", url=f"{parts.netloc}{parts.path}", joined=_flight.in_flight(key)):
+        try:
+            # The shield inside do() keeps our timeout from cancelling the call for the others
+            return await asyncio.wait_for(_flight.do(key, get, url, params=params, headers=headers, **kwargs), budget)
+        except asyncio.TimeoutError:
+            remaining = deadline.remaining()
+            if remaining is not None and remaining <= 0:
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded after {budget:.1f}s") from None
+            raise deadline.DeadlineExceeded(f"Shared upstream call exceeded {SHARED_CALL_TIMEOUT:.0f}s") from None
+
+
+def coalescing_stats() -> dict:
+    return _flight.stats()
+
+
+def stream(method: str, url: str, upstream: str | None = None, label: str | None = None, **kwargs):
+    """
+    Async context manager yielding a response whose body is read lazily. Each
+    read is bounded by the remaining deadline; callers check it between chunks.
+    """
+    budget = _budget()
+    if budget is not None:
+        kwargs.setdefault("timeout", httpx.Timeout(min(READ_TIMEOUT, budget), connect=min(CONNECT_TIMEOUT, budget)))
+    return get_client().stream(method, url, **_with_upstream(kwargs, upstream, label))
+
+
+def upstream_stats() -> dict:
+    """Breaker state and concurrency limit per upstream seen so far."""
+    return _guarded.snapshot() if _guarded is not None else {}
+
+
+def origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+async def warmup(urls):
+    """
+    Open pooled connections to each upstream origin ahead of the first request.
+    Failures are ignored: warmup is best effort and must never block startup.
+    """
+    client = get_client()
+    origins = {origin(u) for u in urls if u}
+    per_origin = 1 if HTTP2 else max(1, PREWARM_CONNECTIONS)
+
+    async def _touch(url):
+        try:
+            await client.head(url, timeout=CONNECT_TIMEOUT)
+        except httpx.HTTPError:
+            pass
+
+    await asyncio.gather(*(_touch(o) for o in origins for _ in range(per_origin)))
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
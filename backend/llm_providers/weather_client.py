@@ -1,5 +1,8 @@
 import os
-import requests
+
+from . import OPENWEATHER_BASE_URL, transport
+from ..core import tracing
+from ..core.state import make_cache
 
 # Load from env, fallback to provided key (user-supplied)
 OPENWEATHER_KEY = (
@@ -8,14 +11,29 @@ OPENWEATHER_KEY = (
     or "87d6b8aea467fc8873d2d9403e6ee469"
 )
 
+# Cache lifetimes in seconds: place coordinates rarely change, conditions do
+WEATHER_CACHE_TTLS = {
+    "geocode": float(os.getenv("WEATHER_GEOCODE_TTL", str(7 * 24 * 3600))),
+    "current": float(os.getenv("WEATHER_CURRENT_TTL", "600")),
+    "forecast": float(os.getenv("WEATHER_FORECAST_TTL", "3600")),
+}
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "2048"))
+WEATHER_CACHE_MAX_BYTES = int(os.getenv("WEATHER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
 class WeatherClient:
     def __init__(self, api_key: str | None = None):
         self.api_key = api_key or OPENWEATHER_KEY
-        self.base = "https://api.openweathermap.org/data/2.5"
-        self.geo_base = "https://api.openweathermap.org/geo/1.0"
-        self._cache = {"geocode": {}, "current": {}, "forecast": {}}
+        self.base = f"{OPENWEATHER_BASE_URL}/data/2.5"
+        self.geo_base = f"{OPENWEATHER_BASE_URL}/geo/1.0"
+        # In-process by default; shared between workers when STATE_BACKEND_URL is set
+        self._cache = make_cache(
+            "weather",
+            ttls=WEATHER_CACHE_TTLS,
+            max_entries=WEATHER_CACHE_MAX_ENTRIES,
+            max_bytes=WEATHER_CACHE_MAX_BYTES,
+        )
 
-    def geocode(self, query: str):
+    async def geocode(self, query: str):
         """Resolve a city name (optionally with country code, e.g., 'Delhi,IN') to lat/lon."""
         if not self.api_key:
             return None, "Missing OPENWEATHER_KEY in environment"
@@ -24,10 +42,12 @@ class WeatherClient:
             "pachikapallam": "Pachikapallam,IN",
         }
         qnorm = aliases.get(query.strip().lower(), query.strip())
-        if qnorm in self._cache["geocode"]:
-            return self._cache["geocode"][qnorm], None
+        with tracing.span("cache", namespace="geocode"):
+            loc = await self._cache.get("geocode", qnorm)
+        if loc is not None:
+            return loc, None
         try:
-            r = requests.get(
+            r = await transport.get_shared(
                 f"{self.geo_base}/direct",
                 params={"q": qnorm, "limit": 5, "appid": self.api_key},
                 timeout=10,
@@ -44,25 +64,28 @@ class WeatherClient:
             state = item.get("state")
             display = ", ".join([p for p in [name, state, country] if p])
             loc = {"lat": item.get("lat"), "lon": item.get("lon"), "display": display}
-            self._cache["geocode"][qnorm] = loc
+            await self._cache.set("geocode", qnorm, loc)
             return loc, None
         except Exception as e:
             return None, str(e)
 
-    def current(self, city: str, units: str = "metric"):
+    async def current(self, city: str, units: str = "metric"):
         if not self.api_key:
             return None, "Missing OPENWEATHER_KEY in environment"
         # Prefer geocoding for better accuracy
-        loc, err = self.geocode(city)
+        with tracing.span("geocode"):
+            loc, err = await self.geocode(city)
         if err:
             return None, err
         key = f"{loc['lat']},{loc['lon']}:{units}"
-        if key in self._cache["current"]:
-            data = self._cache["current"][key]
+        with tracing.span("cache", namespace="current"):
+            data = await self._cache.get("current", key)
+        if data is not None:
+            # cached values are copies, safe to annotate per request
             data["resolved_name"] = loc["display"]
             return data, None
         try:
-            r = requests.get(
+            r = await transport.get_shared(
                 f"{self.base}/weather",
                 params={"lat": loc["lat"], "lon": loc["lon"], "appid": self.api_key, "units": units},
                 timeout=10,
@@ -70,26 +93,29 @@ class WeatherClient:
             if r.status_code != 200:
                 return None, f"HTTP {r.status_code}: {r.text}"
             data = r.json()
+            await self._cache.set("current", key, data)
             # include resolved display name
             data["resolved_name"] = loc["display"]
-            self._cache["current"][key] = data
             return data, None
         except Exception as e:
             return None, str(e)
 
-    def forecast(self, city: str, units: str = "metric"):
+    async def forecast(self, city: str, units: str = "metric"):
         if not self.api_key:
             return None, "Missing OPENWEATHER_KEY in environment"
-        loc, err = self.geocode(city)
+        with tracing.span("geocode"):
+            loc, err = await self.geocode(city)
         if err:
             return None, err
         key = f"{loc['lat']},{loc['lon']}:{units}"
-        if key in self._cache["forecast"]:
-            data = self._cache["forecast"][key]
+        with tracing.span("cache", namespace="forecast"):
+            data = await self._cache.get("forecast", key)
+        if data is not None:
+            # cached values are copies, safe to annotate per request
             data["resolved_name"] = loc["display"]
             return data, None
         try:
-            r = requests.get(
+            r = await transport.get_shared(
                 f"{self.base}/forecast",
                 params={"lat": loc["lat"], "lon": loc["lon"], "appid": self.api_key, "units": units},
                 timeout=10,
@@ -97,23 +123,28 @@ class WeatherClient:
             if r.status_code != 200:
                 return None, f"HTTP {r.status_code}: {r.text}"
             data = r.json()
+            await self._cache.set("forecast", key, data)
             data["resolved_name"] = loc["display"]
-            self._cache["forecast"][key] = data
             return data, None
         except Exception as e:
             return None, str(e)
 
-    def current_text(self, city: str, units: str = "metric"):
+    def cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    async def current_text(self, city: str, units: str = "metric"):
         """Return a concise human-readable weather string."""
         try:
-            loc, err = self.geocode(city)
+            with tracing.span("geocode"):
+                loc, err = await self.geocode(city)
             if err:
                 return err
-            r = requests.get(
+            r = await transport.get_shared(
                 f"{self.base}/weather",
                 params={"lat": loc["lat"], "lon": loc["lon"], "appid": self.api_key, "units": units},
                 timeout=10,
-            ).json()
+            )
+            r = r.json()
             if r.get("cod") != 200:
                 return f"⚠️ Could not find weather for {city}. Try 'City,CountryCode' (e.g., 'Delhi,IN')."
             temp = r["main"]["temp"]
@@ -0,0 +1,27 @@
+import pytest
+
+from backend.core.batch import InvalidItem, assign_ids, parse_item
+
+
+def test_positional_ids_skip_ids_already_taken():
+    raw = [{"id": "1"}, {"id": "2"}, {"provider": "bad"}]
+    assert assign_ids(raw) == ["1", "2", "2-1"]
+
+
+def test_invalid_items_get_unique_ids_too():
+    raw = ["not an object", {"id": "0"}, {"provider": "openai"}, {"id": "2"}, {"id": "2-1"}]
+    ids = assign_ids(raw)
+    assert ids == ["0-1", "0", "2-2", "2", "2-1"]
+    assert len(set(ids)) == len(ids)
+
+
+def test_duplicate_given_ids_are_rejected():
+    with pytest.raises(InvalidItem):
+        assign_ids([{"id": 1, "provider": "bad"}, {"id": "1"}])
+
+
+def test_parse_item_uses_the_assigned_id():
+    item = parse_item({"provider": "openai", "message": "hi"}, "2-1", ["openai"])
+    assert item["id"] == "2-1"
+    with pytest.raises(InvalidItem, match="item 2-1"):
+        parse_item({"provider": "bad", "message": "hi"}, "2-1", ["openai"])
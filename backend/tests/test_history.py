@@ -0,0 +1,75 @@
+import asyncio
+
+from backend.core.history import HistoryStore, SharedHistoryStore
+from backend.core.state import MemoryBackend
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def exchange(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(n)]
+
+
+def test_footprint_counts_retained_window():
+    async def scenario():
+        store = HistoryStore(windows={"openai": 4})
+        assert await store.footprint() == {
+            "sessions": 0, "messages": 0, "bytes": 0, "max_bytes": store.max_bytes, "evicted_sessions": 0,
+        }
+        await store.save("a", "openai", exchange(10))
+        await store.save("b", "openai", exchange(2))
+        footprint = await store.footprint()
+        assert footprint["sessions"] == 2
+        assert footprint["messages"] == 6
+        assert footprint["bytes"] > 0
+
+        await store.clear("a")
+        assert (await store.footprint())["messages"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_footprint_reports_evictions():
+    async def scenario():
+        clock = FakeClock()
+        store = HistoryStore(windows={"openai": 4}, idle_ttl=60, clock=clock)
+        await store.save("a", "openai", exchange(2))
+        clock.now = 120
+        await store.save("b", "openai", exchange(2))
+        footprint = await store.footprint()
+        assert footprint["sessions"] == 1
+        assert footprint["evicted_sessions"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_shared_footprint_counts_keys():
+    async def scenario():
+        store = SharedHistoryStore(MemoryBackend(), windows={"openai": 4, "gemini": 4})
+        await store.save("a", "openai", exchange(2))
+        await store.save("a", "gemini", exchange(2))
+        await store.save("b", "openai", exchange(2))
+        assert await store.footprint() == {"backend": "memory", "keys": 3, "max_keys": 100_000, "evicted_keys": 0}
+
+    asyncio.run(scenario())
+
+
+def test_shared_store_evicts_least_recently_saved_beyond_max_keys():
+    async def scenario():
+        clock = FakeClock()
+        store = SharedHistoryStore(MemoryBackend(clock=clock), windows={"openai": 4}, max_keys=2, trim_every=1)
+        for session in ("a", "b", "c"):
+            clock.now += 1
+            await store.save(session, "openai", exchange(2))
+        assert await store.get("a", "openai") == []
+        assert len(await store.get("c", "openai")) == 2
+        footprint = await store.footprint()
+        assert (footprint["keys"], footprint["evicted_keys"]) == (2, 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, FastAPI
+from starlette.testclient import TestClient
+
+from backend.auth_module.router import router as auth_router
+from backend.core import metrics
+
+
+def make_app():
+    app = FastAPI()
+    app.include_router(auth_router, prefix="", tags=["auth"])
+    prefixed = APIRouter()
+
+    @prefixed.get("/{session_id}")
+    async def session(session_id: str):
+        return {}
+
+    app.include_router(prefixed, prefix="/sessions")
+    return app
+
+
+def route_label(app, path: str, method: str = "GET") -> str:
+    middleware = metrics.MetricsMiddleware(app, routes=app.routes)
+    return middleware.route_for({"type": "http", "path": path, "method": method, "root_path": ""})
+
+
+def test_included_routes_are_labelled_by_template():
+    app = make_app()
+    assert route_label(app, "/login", "POST") == "/login"
+    assert route_label(app, "/me") == "/me"
+    assert route_label(app, "/sessions/abc") == "/sessions/{session_id}"
+    assert route_label(app, "/nowhere") == "unmatched"
+
+
+def test_auth_requests_are_not_counted_as_other():
+    app = make_app()
+    app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+    TestClient(app).post("/login", data={})
+    rendered = metrics.registry.render()
+    assert 'chatbot_http_requests_total{route="/login",method="POST"' in rendered
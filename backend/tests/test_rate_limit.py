@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from backend.core.rate_limit import FairQueue, RateLimited, RateLimiter
+
+
+def test_multi_slot_waiters_do_not_deadlock():
+    async def scenario():
+        queue = FairQueue(4)
+        assert await queue.acquire("x", 0, n=2)
+        # Neither fits while "x" holds two slots; neither may hold part of its slots
+        a = asyncio.create_task(queue.acquire("a", 1.0, n=3))
+        b = asyncio.create_task(queue.acquire("b", 1.0, n=3))
+        await asyncio.sleep(0)
+        assert queue.active == 2
+        queue.release(2)
+        assert await a
+        assert queue.active == 3 and not b.done()
+        queue.release(3)
+        assert await b
+        queue.release(3)
+        assert queue.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_timed_out_waiter_lets_the_next_one_in():
+    async def scenario():
+        queue = FairQueue(2)
+        assert await queue.acquire("x", 0)
+        big = asyncio.create_task(queue.acquire("a", 0.05, n=2))
+        small = asyncio.create_task(queue.acquire("b", 1.0))
+        assert not await big
+        assert await small
+        assert queue.active == 2
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_compares_are_admitted():
+    async def scenario():
+        limiter = RateLimiter(rate=100, burst=100, concurrency=4, queue_timeout=2.0)
+
+        async def compare(user):
+            permit = await limiter.acquire_many(user, ["a", "b", "c"])
+            await asyncio.sleep(0.01)
+            permit.release()
+
+        await asyncio.gather(*(compare(f"u{i}") for i in range(6)))
+        assert limiter.stats()["admitted"] == 6
+        assert limiter.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_more_slots_than_concurrency_is_refused_up_front():
+    async def scenario():
+        limiter = RateLimiter(rate=1, burst=5, concurrency=2)
+        with pytest.raises(RateLimited) as exc:
+            await limiter.acquire_many("u", ["a", "b", "c"])
+        assert exc.value.status_code == 400
+        # Nothing was charged
+        assert (await limiter.acquire_many("u", ["a"])).headers["RateLimit-Remaining"] == "4"
+
+    asyncio.run(scenario())
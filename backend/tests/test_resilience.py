@@ -0,0 +1,34 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.core.resilience import UpstreamUnavailable
+from backend.llm_providers.transport import GuardedTransport
+
+
+def gateway(request):
+    if request.url.path == "/fail":
+        return httpx.Response(500)
+    if request.url.path == "/limited":
+        return httpx.Response(429, headers={"retry-after": "5"})
+    return httpx.Response(200)
+
+
+def test_breaker_is_per_model_and_backoff_is_per_host():
+    async def scenario():
+        guarded = GuardedTransport(httpx.MockTransport(gateway), max_per_host=10)
+        async with httpx.AsyncClient(transport=guarded) as client:
+            for _ in range(5):
+                await client.get("http://gw/fail", extensions={"upstream": "gw/a"})
+            assert guarded.snapshot()["gw/a"]["state"] == "open"
+            # A sibling model on the same host keeps working
+            assert (await client.get("http://gw/ok", extensions={"upstream": "gw/b"})).status_code == 200
+
+            # ...but a 429 with Retry-After holds back every model on the host
+            await client.get("http://gw/limited", extensions={"upstream": "gw/b"})
+            with pytest.raises(UpstreamUnavailable):
+                await client.get("http://gw/ok", extensions={"upstream": "gw/c"})
+            assert (await client.get("http://other/ok")).status_code == 200
+
+    asyncio.run(scenario())
@@ -0,0 +1,51 @@
+from backend.core.semantic_cache import PromptTerms, SemanticCache
+
+
+def make_cache(**kwargs):
+    cache = SemanticCache(**kwargs)
+    cache.add("p", "Convert 100 USD to EUR", "92 EUR")
+    cache.add("p", "What is the capital of France?", "Paris")
+    return cache
+
+
+def test_serves_case_and_punctuation_variants():
+    cache = make_cache()
+    assert cache.lookup("p", "convert 100 usd to eur")[0] == "92 EUR"
+    assert cache.lookup("p", "What is the capital of France")[0] == "Paris"
+
+
+def test_different_number_is_a_miss():
+    # Lexically 0.909 similar to the cached prompt
+    cache = make_cache(threshold=0.9)
+    assert cache.lookup("p", "Convert 1000 USD to EUR") is None
+    assert cache.lookup("p", "Convert 100.5 USD to EUR") is None
+
+
+def test_different_name_is_a_miss():
+    cache = make_cache(threshold=0.5)
+    assert cache.lookup("p", "Convert 100 USD to GBP") is None
+    assert cache.lookup("p", "What is the capital of Germany?") is None
+
+
+def test_misses_are_counted():
+    cache = make_cache()
+    cache.lookup("p", "Convert 1000 USD to EUR")
+    cache.lookup("p", "convert 100 usd to eur")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_add_keeps_prompts_with_different_numbers_apart():
+    cache = make_cache(threshold=0.9)
+    cache.add("p", "Convert 1000 USD to EUR", "920 EUR")
+    assert cache.stats()["partitions"]["p"] == 3
+    assert cache.lookup("p", "Convert 100 USD to EUR")[0] == "92 EUR"
+    assert cache.lookup("p", "Convert 1000 USD to EUR")[0] == "920 EUR"
+
+
+def test_prompt_terms():
+    terms = PromptTerms("Is Paris bigger than Rome? Compare 2 cities in the EU.")
+    assert terms.numbers == {"2"}
+    assert terms.names == {"paris", "rome", "2", "eu"}
+    assert PromptTerms("is paris bigger than rome? compare 2 cities in the eu").compatible(terms)
+    assert not PromptTerms("Is Paris bigger than Rome? Compare 3 cities in the EU.").compatible(terms)
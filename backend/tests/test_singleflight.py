@@ -0,0 +1,59 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.core import deadline
+from backend.core.singleflight import SingleFlight
+from backend.llm_providers import transport
+
+
+def test_shared_call_runs_outside_the_callers_context():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def budget():
+            return deadline.remaining()
+
+        deadline.set_deadline(5)
+        assert await flight.do("k", budget) is None
+
+    asyncio.run(scenario())
+
+
+def test_shared_call_has_its_own_timeout():
+    async def scenario():
+        flight = SingleFlight(timeout=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", asyncio.sleep, 1)
+
+    asyncio.run(scenario())
+
+
+def test_joiners_keep_their_own_deadline(monkeypatch):
+    async def scenario():
+        seen = []
+
+        async def slow(request):
+            seen.append(request)
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json={"ok": True})
+
+        monkeypatch.setattr(transport, "_client", httpx.AsyncClient(transport=httpx.MockTransport(slow)))
+
+        async def caller(budget, headers=None):
+            deadline.set_deadline(budget)
+            return await transport.get_shared("http://upstream/x", params={"q": "1"}, headers=headers, timeout=10)
+
+        impatient = asyncio.create_task(caller(0.05))
+        await asyncio.sleep(0)
+        patient = asyncio.create_task(caller(5))
+        other_key = asyncio.create_task(caller(5, headers={"Accept-Language": "de"}))
+        with pytest.raises(deadline.DeadlineExceeded):
+            await impatient
+        assert (await patient).json() == {"ok": True}
+        assert (await other_key).status_code == 200
+        # The impatient caller's budget did not reach the shared call; other headers got their own
+        assert len(seen) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,114 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from backend.core.state import MemoryBackend, RedisBackend, SQLiteBackend
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def memory_backend(tmp_path, clock):
+    return MemoryBackend(clock=clock)
+
+
+def sqlite_backend(tmp_path, clock):
+    return SQLiteBackend(str(tmp_path / "state.db"), clock=clock)
+
+
+@pytest.fixture(params=[memory_backend, sqlite_backend], ids=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    return lambda clock: request.param(tmp_path, clock)
+
+
+def test_round_trip_and_expiry(make_backend):
+    async def scenario():
+        clock = FakeClock()
+        backend = make_backend(clock)
+        await backend.set("history:openai:a", b"one", ttl=10)
+        await backend.set("history:openai:b", b"two")
+        await backend.set("cache:x", b"three", ttl=5)
+        assert await backend.get("history:openai:a") == b"one"
+        assert await backend.count("history:") == 2
+
+        clock.now += 10
+        assert await backend.get("history:openai:a") is None
+        assert await backend.get("history:openai:b") == b"two"
+        assert await backend.count("") == 1
+
+        await backend.delete_prefix("history:")
+        assert await backend.get("history:openai:b") is None
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_trim_drops_keys_closest_to_expiry(make_backend):
+    async def scenario():
+        clock = FakeClock()
+        backend = make_backend(clock)
+        for i, ttl in enumerate((30, 10, None, 20)):
+            await backend.set(f"history:{i}", b"x", ttl=ttl)
+        await backend.set("cache:x", b"x", ttl=1)
+        assert await backend.trim("history:", 2) == 2
+        assert [await backend.get(f"history:{i}") is not None for i in range(4)] == [True, False, True, False]
+        # Other prefixes are left alone
+        assert await backend.get("cache:x") == b"x"
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_is_shared_across_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    backend = SQLiteBackend(path)
+    writer = (
+        "import asyncio, sys\n"
+        "from backend.core.state import SQLiteBackend\n"
+        "backend = SQLiteBackend(sys.argv[1])\n"
+        "asyncio.run(backend.set('history:openai:s1', b'from another process', ttl=60))\n"
+    )
+    subprocess.run([sys.executable, "-c", writer, path], check=True)
+    assert asyncio.run(backend.get("history:openai:s1")) == b"from another process"
+
+    asyncio.run(backend.set("history:openai:s2", b"from the test", ttl=60))
+    reader = (
+        "import asyncio, sys\n"
+        "from backend.core.state import SQLiteBackend\n"
+        "print(asyncio.run(SQLiteBackend(sys.argv[1]).get('history:openai:s2')).decode())\n"
+    )
+    out = subprocess.run([sys.executable, "-c", reader, path], check=True, capture_output=True, text=True)
+    assert out.stdout.strip() == "from the test"
+
+
+def test_redis_round_trip():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        backend = RedisBackend(client=fakeredis.FakeAsyncRedis())
+        await backend.set("history:openai:a", b"one", ttl=60)
+        await backend.set("history:openai:b", b"two", ttl=0.05)
+        await backend.set("history:*", b"glob", ttl=60)
+        assert await backend.get("history:openai:a") == b"one"
+        assert await backend.count("history:openai:") == 2
+        await asyncio.sleep(0.1)
+        assert await backend.get("history:openai:b") is None
+        assert await backend.count("history:") == 2
+
+        await backend.set("history:openai:c", b"three")
+        assert await backend.trim("history:", 2) == 1
+        # The key without a TTL outlives the ones that expire
+        assert await backend.get("history:openai:c") == b"three"
+
+        await backend.delete_prefix("history:openai:")
+        assert await backend.count("history:") == 1
+        await backend.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,53 @@
+import asyncio
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.auth_module import transcripts
+from backend.auth_module.database import Base
+from backend.auth_module.models import ChatMessage, ChatSession
+
+
+def use_database(monkeypatch, url: str):
+    engine = create_async_engine(url)
+    monkeypatch.setattr(transcripts, "AsyncSessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+    return engine
+
+
+def test_refused_batch_is_written_row_by_row(monkeypatch, tmp_path):
+    async def scenario():
+        engine = use_database(monkeypatch, f"sqlite+aiosqlite:///{tmp_path / 'auth.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        writer = transcripts.TranscriptWriter(batch_size=10)
+        writer.record(1, "s1", "openai", "user", "hello")
+        writer.record(1, "s1", "openai", "assistant", None)  # NOT NULL violation
+        writer.record(1, "s1", "openai", "user", "still here")
+        assert await writer.flush()
+        # A later batch goes through in one piece
+        writer.record(1, "s1", "openai", "assistant", "reply")
+        assert await writer.flush()
+
+        stats = writer.stats()
+        assert (stats["queued"], stats["written"], stats["rejected"], stats["errors"]) == (0, 3, 1, 1)
+        async with transcripts.AsyncSessionLocal() as db:
+            assert (await db.execute(select(func.count(ChatMessage.id)))).scalar_one() == 3
+            assert (await db.execute(select(ChatSession.message_count))).scalar_one() == 3
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_unreachable_database_keeps_the_batch_queued(monkeypatch, tmp_path):
+    async def scenario():
+        engine = use_database(monkeypatch, f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'auth.db'}")
+        writer = transcripts.TranscriptWriter(batch_size=10)
+        writer.record(1, "s1", "openai", "user", "hello")
+        writer.record(1, "s1", "openai", "assistant", "hi")
+        assert not await writer.flush()
+        stats = writer.stats()
+        assert (stats["queued"], stats["written"], stats["rejected"]) == (2, 0, 0)
+        await engine.dispose()
+
+    asyncio.run(scenario())